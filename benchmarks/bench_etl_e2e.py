@@ -0,0 +1,220 @@
+"""
+各 run_etl_* 從匯出檔到資料表的端到端耗時（假匯出檔 + 本機 SQLite 當 SQL Server 的替身）。
+
+流程跟正式的一樣（iter_sap_export → parse → run_file_batches → staging writer），
+只有最後的 upsert_batch 換成 SQLite 版（MERGE → INSERT … ON CONFLICT DO UPDATE），
+所以量得到 parse / clean / 寫入的退步，量不到 SQL Server 本身的差異。
+各階段秒數來自 common/instrument 的 run 紀錄（read / parse / load / staging_write / merge）。
+
+每次結果（含 git commit）附加到 benchmarks/results/etl_e2e.jsonl，
+並跟同一組參數上一次的結果比較，超過 --threshold 標成退步。
+
+    python -m ETL_SAP.benchmarks.bench_etl_e2e --rows 200000 --files 4
+    python -m ETL_SAP.benchmarks.bench_etl_e2e --cases ZMB51 --parse-workers 2 --fail-on-regression
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# 要在 import ETL 之前設定：不碰真的 SAP GUI、run 紀錄 / key 字典不寫進 repo
+os.environ.setdefault("SAP_GUI_BACKEND", "fake")
+os.environ.setdefault("ETL_RUN_DIR", os.path.join(tempfile.gettempdir(), "etl_bench_runs"))
+os.environ.setdefault("KEY_DICT_DIR", os.path.join(tempfile.gettempdir(), "etl_bench_keys"))
+for _name in ("ZMB51", "ZSTPROMO", "ZRSSALE_D2", "ZRSSALE_D3", "ZMMIDR_BUn"):
+    os.environ.setdefault(f"TABLE_{_name}", f"dbo.{_name}")
+
+import pandas as pd
+from sqlalchemy import create_engine, text
+from sqlalchemy.types import NVARCHAR, DECIMAL, Date
+
+from ETL_SAP.benchmarks.synthetic import CASES, generate
+from ETL_SAP.common import instrument
+from ETL_SAP.common.instrument import stage
+from ETL_SAP.common.key_codes import decode_keys, concat_encoded
+from ETL_SAP.common.staging_writers import write_staging, DEFAULT_WRITER
+from ETL_SAP.pipelines import etl_zmb51, etl_zstpromo, etl_zrssale, etl_zmmidr_bun
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCH_DIR.parent
+HISTORY = BENCH_DIR / "results" / "etl_e2e.jsonl"
+STAGES = ("read", "parse", "load", "staging_write", "merge")
+
+ZMMIDR_COLUMN_TYPES = {
+    "DC": NVARCHAR(10), "Article": NVARCHAR(20), "MCH": NVARCHAR(50), "Pack size": NVARCHAR(50),
+    "Unit": NVARCHAR(10), "D/C MAP": DECIMAL(14, 6), "Unrestricted-Use Stock": DECIMAL(14, 6),
+    "Allocation Qty": DECIMAL(14, 6), "On order Stock": DECIMAL(14, 6),
+    "Unrestricted Stock Value": DECIMAL(14, 6), "PTD MVMT": DECIMAL(14, 6), "YTD MVMT": DECIMAL(14, 6),
+    "Date": Date(),
+}
+
+
+class SQLiteUpsert:
+    """upsert_batch 的 SQLite 替身：同樣先寫暫存表（用 repo 的 staging writer），再一次 upsert 進正式表。"""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def __call__(self, df, target_table, unique_keys, column_types, writer=None, **_):
+        df = decode_keys(df)
+        tgt = target_table.split(".")[-1]
+        stg = f"{tgt}_stg"
+        cols = ", ".join(f'"{c}"' for c in df.columns)
+        updates = ", ".join(f'"{c}" = excluded."{c}"' for c in df.columns if c not in unique_keys)
+        with self.engine.begin() as conn:
+            for name, unique in ((tgt, True), (stg, False)):
+                df.head(0).to_sql(name, con=conn, index=False, dtype=column_types, if_exists="append")
+                if unique:
+                    keys = ", ".join(f'"{k}"' for k in unique_keys)
+                    conn.execute(text(f'CREATE UNIQUE INDEX IF NOT EXISTS "ux_{tgt}" ON "{tgt}" ({keys})'))
+            conn.execute(text(f'DELETE FROM "{stg}"'))
+            with stage("staging_write", table=tgt, writer=writer or DEFAULT_WRITER) as s:
+                s.rows = write_staging(df, stg, conn, column_types, writer=writer)
+            with stage("merge", table=tgt) as s:
+                keys = ", ".join(f'"{k}"' for k in unique_keys)
+                s.rows = conn.execute(text(
+                    f'INSERT INTO "{tgt}" ({cols}) SELECT {cols} FROM "{stg}" WHERE true '
+                    f'ON CONFLICT ({keys}) DO UPDATE SET {updates}')).rowcount
+        return {"affected": s.rows}
+
+
+def run_zmmidr(folder, upsert, parse_workers=None):
+    """ZMMIDR 的 run_etl 會寫 Excel / 網路磁碟，這裡只跑讀檔清洗（load_zmmidr_file）+ 上傳。"""
+    frames = []
+    for fp in sorted(Path(folder).glob("Zmmidr_bun_*.txt")):
+        dc = fp.stem.split("_")[3]
+        with stage("parse", etl="ZMMIDR", file=fp.name) as s:
+            frames.append(etl_zmmidr_bun.load_zmmidr_file(fp, dc))
+            s.rows = len(frames[-1])
+    df = concat_encoded(frames, ignore_index=True)
+    df.insert(0, "Date", pd.Timestamp.today().date())
+    df = df[[c for c in ZMMIDR_COLUMN_TYPES if c in df.columns]]
+    with stage("load", etl="ZMMIDR") as s:
+        upsert(df, os.environ["TABLE_ZMMIDR_BUn"], ["DC", "Article", "Date"], ZMMIDR_COLUMN_TYPES)
+        s.rows = len(df)
+
+
+RUNNERS = {
+    "ZMB51": lambda folder, pw: etl_zmb51.run_etl_zmb51(folder, parse_workers=pw),
+    "ZSTPROMO": lambda folder, pw: etl_zstpromo.run_etl_zstpromo(folder, parse_workers=pw),
+    "ZRSSALE_D2": lambda folder, pw: etl_zrssale.run_etl_zrssale_D2(folder, parse_workers=pw),
+    "ZRSSALE_D3": lambda folder, pw: etl_zrssale.run_etl_zrssale_D3(folder, parse_workers=pw),
+}
+
+
+def git_commit() -> tuple[str | None, bool]:
+    try:
+        head = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_DIR,
+                                    capture_output=True, text=True).stdout.strip())
+        return head, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+
+
+def bench_case(case, rows, files, parse_workers, tmp) -> dict:
+    folder = Path(tmp, case)
+    inputs = generate(case, folder, rows, files)
+    size = sum(os.path.getsize(p) for p in inputs)
+
+    engine = create_engine(f"sqlite:///{Path(tmp, 'bench.db')}")
+    upsert = SQLiteUpsert(engine)
+    for module in (etl_zmb51, etl_zstpromo, etl_zrssale):
+        module.upsert_batch = upsert
+
+    instrument.start_run(f"bench {case}")
+    t0 = time.perf_counter()
+    if case == "ZMMIDR":
+        run_zmmidr(folder, upsert)
+    else:
+        RUNNERS[case](folder, parse_workers)
+    seconds = time.perf_counter() - t0
+    engine.dispose()
+
+    summary = instrument.summarize(instrument.RECORDER.load())
+    return {
+        "case": case,
+        "seconds": round(seconds, 3),
+        "input_mb": round(size / 1e6, 2),
+        "rows_in": rows * files if case != "ZMMIDR" else min(rows, 20_000) * files,
+        "rows_out": summary.get("load", {}).get("rows", 0),
+        "stages": {name: round(summary[name]["seconds"], 3) for name in STAGES if name in summary},
+    }
+
+
+def load_history(path=HISTORY) -> list[dict]:
+    if not path.exists():
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def previous_result(history, result) -> dict | None:
+    """同一個 case / 參數最近一次的結果（不同 commit 才比）。"""
+    same = [h for h in history
+            if all(h.get(k) == result[k] for k in ("case", "rows", "files", "parse_workers", "writer"))
+            and h.get("commit") != result["commit"]]
+    return same[-1] if same else None
+
+
+def print_results(results, history, threshold) -> list[str]:
+    regressions = []
+    print(f"\n⏱️ ETL 端到端（commit {results[0]['commit']}{'+dirty' if results[0]['dirty'] else ''}）：")
+    print(f"   {'case':<12}{'MB':>7}{'rows/s':>11}{'total(s)':>10}{'prev(s)':>9}{'Δ':>8}  "
+          + "  ".join(f"{s:>13}" for s in STAGES))
+    for r in results:
+        prev = previous_result(history, r)
+        delta = (r["seconds"] / prev["seconds"] - 1) if prev and prev["seconds"] else None
+        flag = ""
+        if delta is not None and delta > threshold:
+            flag = " ⚠️"
+            regressions.append(f"{r['case']} {delta:+.0%}（{prev['commit']} → {r['commit']}）")
+        stages = "  ".join(f"{r['stages'].get(s, 0):>13.2f}" for s in STAGES)
+        prev_s = f"{prev['seconds']:.2f}" if prev else "-"
+        print(f"   {r['case']:<12}{r['input_mb']:>7.1f}{r['rows_in'] / r['seconds']:>11,.0f}{r['seconds']:>10.2f}"
+              f"{prev_s:>9}"
+              f"{(f'{delta:+.0%}' if delta is not None else '-'):>8}  {stages}{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--rows", type=int, default=100_000, help="每個檔案的列數")
+    parser.add_argument("--files", type=int, default=2)
+    parser.add_argument("--parse-workers", type=int, default=1)
+    parser.add_argument("--threshold", type=float, default=0.15, help="比上一次慢超過這個比例算退步")
+    parser.add_argument("--no-save", action="store_true", help="不寫進 results/etl_e2e.jsonl")
+    parser.add_argument("--fail-on-regression", action="store_true", help="有退步時 exit code 1（給 CI 用）")
+    args = parser.parse_args()
+
+    commit, dirty = git_commit()
+    meta = {
+        "commit": commit, "dirty": dirty, "ts": pd.Timestamp.now().isoformat(timespec="seconds"),
+        "rows": args.rows, "files": args.files, "parse_workers": args.parse_workers,
+        "writer": DEFAULT_WRITER, "python": platform.python_version(), "pandas": pd.__version__,
+    }
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for case in args.cases:
+            print(f"\n===== {case} =====")
+            results.append({**meta, **bench_case(case, args.rows, args.files, args.parse_workers, tmp)})
+
+    history = load_history()
+    regressions = print_results(results, history, args.threshold)
+    if not args.no_save:
+        HISTORY.parent.mkdir(parents=True, exist_ok=True)
+        with open(HISTORY, "a", encoding="utf-8") as f:
+            for r in results:
+                f.write(json.dumps(r, ensure_ascii=False) + "\n")
+        print(f"   📄 {HISTORY}")
+    if regressions:
+        print("⚠️ 退步：" + "；".join(regressions))
+        if args.fail_on_regression:
+            sys.exit(1)
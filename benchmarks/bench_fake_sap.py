@@ -0,0 +1,64 @@
+"""
+用 fake SAP GUI 跑真的 run_zmb51_query：比較 session 數、失敗率對下載吞吐量的影響。
+查詢時間照比例縮小（--time-scale），匯出檔是真的 Text with Tabs。
+
+    python -m ETL_SAP.benchmarks.bench_fake_sap --weeks 26 --sessions 1 2 4 --fail-rate 0.05
+"""
+import argparse
+import os
+import tempfile
+import time
+
+os.environ["SAP_GUI_BACKEND"] = "fake"
+
+import pandas as pd
+
+from ETL_SAP.sap_scripts.fake_gui import FakeSAP, set_fake_sap
+from ETL_SAP.sap_scripts.session_pool import SessionPool
+from ETL_SAP.sap_scripts.downloader_zmb51 import run_zmb51_query
+
+
+def make_jobs(weeks, first="2025-01-05"):
+    starts = pd.date_range(first, periods=weeks, freq="7D")
+    return [(s.strftime("%m/%d/%Y"), (s + pd.Timedelta(days=6)).strftime("%m/%d/%Y"), site)
+            for s in starts for site in ("NCA_EC", "SCA")]
+
+
+def run(n_sessions, jobs, args):
+    sap = FakeSAP(time_scale=args.time_scale, rows_per_day=args.rows_per_day,
+                  fail_rate=args.fail_rate, disconnect_rate=args.disconnect_rate, seed=0)
+    set_fake_sap(sap)
+    with tempfile.TemporaryDirectory() as export_dir:
+        def query(session, job):
+            start, end, site = job
+            filename = f"ZMB51_{start}_{end}_{site}.txt".replace("/", "")
+            return run_zmb51_query(session, start, end, site, export_dir, filename)
+
+        pool = SessionPool(n_sessions, retry_wait=0, max_retries=3, label=f"bench×{n_sessions}")
+        result = pool.run(jobs, query)
+    log = sap.query_log()
+    return result, sap.logins, log
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--weeks", type=int, default=26)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--time-scale", type=float, default=0.002)
+    parser.add_argument("--rows-per-day", type=int, default=2_000)
+    parser.add_argument("--fail-rate", type=float, default=0.05)
+    parser.add_argument("--disconnect-rate", type=float, default=0.01)
+    args = parser.parse_args()
+
+    jobs = make_jobs(args.weeks)
+    rows = []
+    for n in args.sessions:
+        t0 = time.perf_counter()
+        result, logins, log = run(n, jobs, args)
+        rows.append((n, result, logins, len(log), time.perf_counter() - t0))
+
+    base = rows[0][4]
+    print(f"\n{'sessions':>9}{'done':>7}{'failed':>8}{'queries':>9}{'logins':>8}{'wall(s)':>9}{'jobs/s':>8}{'speedup':>9}")
+    for n, result, logins, n_queries, seconds in rows:
+        print(f"{n:>9}{result['done']:>7}{len(result['failed']):>8}{n_queries:>9}{logins:>8}"
+              f"{seconds:>9.1f}{result['done'] / seconds:>8.2f}{base / seconds:>9.2f}x")
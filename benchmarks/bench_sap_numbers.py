@@ -0,0 +1,71 @@
+"""
+parse_sap_number 與舊寫法（逐格 .apply(clean_number) / regex fast_numeric）的速度比較。
+
+    python -m ETL_SAP.benchmarks.bench_sap_numbers --rows 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from ETL_SAP.pipelines.sap_numbers import parse_sap_number
+
+
+# ---- 舊版實作（原本在 etl_utils），只留在這裡當比較基準 ----
+def legacy_clean_number(val):
+    if pd.isna(val):
+        return np.nan
+    val = str(val).replace(',', '').strip()
+    if val.endswith('-') and val[:-1].replace('.', '', 1).isdigit():
+        val = '-' + val[:-1]
+    try:
+        return pd.to_numeric(val, errors="coerce")
+    except Exception:
+        return np.nan
+
+
+def legacy_fast_numeric(col: pd.Series) -> pd.Series:
+    s = col.astype(str).str.replace(",", "", regex=False)
+    s = s.str.replace(r"^([\d.]+)-$", r"-\1", regex=True)
+    return pd.to_numeric(s, errors="coerce")
+
+
+def make_column(n_rows: int, seed: int = 0) -> pd.Series:
+    """模仿 SAP 匯出：多數是一般數字，夾雜千分位、尾巴負號、空白和 '-'。"""
+    rng = np.random.default_rng(seed)
+    values = rng.normal(0, 5000, n_rows).round(2)
+    text = pd.Series(np.abs(values)).map("{:,.2f}".format)
+    text = text.where(values >= 0, text + "-")
+    kind = rng.random(n_rows)
+    text = text.where(kind > 0.02, "")
+    text = text.where((kind <= 0.02) | (kind > 0.04), "-")
+    return text.where((kind <= 0.04) | (kind > 0.05), None)
+
+
+def timed(fn, col):
+    t0 = time.perf_counter()
+    out = fn(col)
+    return time.perf_counter() - t0, out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--skip-apply", action="store_true", help="略過最慢的逐格 apply 基準")
+    args = parser.parse_args()
+
+    col = make_column(args.rows)
+    runs = {"parse_sap_number": lambda c: parse_sap_number(c),
+            "legacy fast_numeric": legacy_fast_numeric}
+    if not args.skip_apply:
+        runs["legacy apply(clean_number)"] = lambda c: c.apply(legacy_clean_number)
+
+    results = {name: timed(fn, col) for name, fn in runs.items()}
+    new_sec, new_out = results["parse_sap_number"]
+
+    print(f"{'parser':<28}{'seconds':>10}{'rows/sec':>16}{'vs new':>10}")
+    for name, (sec, out) in results.items():
+        same = np.allclose(out.astype("float64"), new_out, equal_nan=True)
+        print(f"{name:<28}{sec:>10.3f}{args.rows / sec:>16,.0f}{sec / new_sec:>9.1f}x"
+              f"{'' if same else '   ⚠️ 結果不同'}")
@@ -0,0 +1,127 @@
+"""
+SAP 查詢流程的等待時間：固定 sleep + 每秒輪詢（舊） vs sap_wait 自適應等待（新）。
+用假的 session + 虛擬時鐘模擬，瞬間跑完幾百次查詢。
+
+    python -m ETL_SAP.benchmarks.bench_sap_wait --queries 500
+"""
+import argparse
+
+import numpy as np
+
+from ETL_SAP.sap_scripts.sap_wait import wait_until, element_ready, grid_ready
+
+GRID_ID = "wnd[0]/usr/cntlGRID1/shellcont/shell"
+SELECTION_ID = "wnd[0]/usr/ctxtBUDAT-LOW"
+SAVE_BTN_ID = "wnd[1]/tbar[0]/btn[11]"
+
+
+class VirtualClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeElement:
+    RowCount = 100
+
+    def select(self):
+        pass
+
+    def press(self):
+        pass
+
+
+class FakeSession:
+    """元件在 ready_at 之後才找得到；busy_until 之前 session.busy = True。"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.ready_at = {}
+        self.busy_until = 0.0
+
+    @property
+    def busy(self):
+        return self.clock.now < self.busy_until
+
+    def findById(self, element_id):
+        if self.clock.now < self.ready_at.get(element_id, 0.0):
+            raise RuntimeError(f"control not found: {element_id}")
+        return FakeElement()
+
+    def schedule(self, element_id, delay):
+        self.ready_at[element_id] = self.clock.now + delay
+        self.busy_until = max(self.busy_until, self.clock.now + delay)
+
+
+def legacy_query(session, clock, lat):
+    clock.sleep(1)                                   # tcode 前
+    session.schedule(SELECTION_ID, lat["screen"])
+    clock.sleep(1)                                   # tcode 後
+    wait_until(element_ready(session, SELECTION_ID), initial=1.0, max_interval=1.0,
+               clock=clock.monotonic, sleep=clock.sleep)   # 萬一 1 秒不夠
+    session.schedule(GRID_ID, lat["query"])
+    while True:                                      # 舊 wait_for_table：每秒輪詢
+        if not session.busy:
+            try:
+                session.findById(GRID_ID).RowCount
+                break
+            except Exception:
+                pass
+        clock.sleep(1.0)
+    session.schedule(SAVE_BTN_ID, lat["dialog"])
+    clock.sleep(2)                                   # Save-As 前
+    clock.sleep(lat["file"])                         # wait_for_file（0.2s 輪詢，近似即時）
+    clock.sleep(2)                                   # wait_for_file 後
+    clock.sleep(1)                                   # 返回主畫面後
+
+
+def new_query(session, clock, lat):
+    kw = dict(clock=clock.monotonic, sleep=clock.sleep)
+    session.schedule(SELECTION_ID, lat["screen"])
+    wait_until(element_ready(session, SELECTION_ID), **kw)
+    session.schedule(GRID_ID, lat["query"])
+    wait_until(grid_ready(session, GRID_ID), timeout=2400, **kw)
+    session.schedule(SAVE_BTN_ID, lat["dialog"])
+    wait_until(element_ready(session, SAVE_BTN_ID), **kw)
+    clock.sleep(lat["file"] + 0.3)                   # file_ready：寫完再等 settle
+    session.schedule(SELECTION_ID, lat["screen"])     # /n 回主畫面
+    wait_until(lambda: not session.busy, **kw)
+
+
+def make_latencies(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [{
+        "screen": float(rng.uniform(0.1, 0.6)),
+        "query": float(rng.lognormal(np.log(20), 0.8)),
+        "dialog": float(rng.uniform(0.1, 0.5)),
+        "file": float(rng.uniform(0.2, 1.5)),
+    } for _ in range(n)]
+
+
+def run(flow, latencies):
+    clock = VirtualClock()
+    session = FakeSession(clock)
+    for lat in latencies:
+        flow(session, clock, lat)
+    return clock.now
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    lats = make_latencies(args.queries)
+    pure = sum(l["screen"] * 2 + l["query"] + l["dialog"] + l["file"] for l in lats)
+    legacy = run(legacy_query, lats)
+    new = run(new_query, lats)
+
+    print(f"{'flow':<10}{'total(s)':>12}{'per query(s)':>15}{'overhead(s)':>14}")
+    for name, total in [("SAP only", pure), ("legacy", legacy), ("sap_wait", new)]:
+        print(f"{name:<10}{total:>12,.0f}{total / args.queries:>15.2f}{(total - pure) / args.queries:>14.2f}")
+    print(f"節省 {(legacy - new) / args.queries:.2f} s/query，{args.queries} 次共 {(legacy - new) / 60:,.1f} 分鐘")
@@ -0,0 +1,114 @@
+"""
+SessionPool：1 個 session 依序查詢 vs N 個 session 平行查詢。
+假的 SAP backend：查詢時間照比例縮小（--scale），可以注入查詢失敗和整個連線斷線。
+
+    python -m ETL_SAP.benchmarks.bench_session_pool --queries 120 --sessions 1 2 4 6
+"""
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from ETL_SAP.sap_scripts.session_pool import SessionPool
+
+
+class FakeElement:
+    def press(self):
+        pass
+
+
+class FakeBackend:
+    """login() 之後 connection 才存在；kill() 模擬連線斷掉（所有 session 失效）。"""
+
+    def __init__(self):
+        self.connection = 0
+        self.logins = 0
+        self.lock = threading.Lock()
+
+    def login(self):
+        with self.lock:
+            self.connection += 1
+            self.logins += 1
+
+    def attach(self, slot):
+        if not self.connection:
+            raise RuntimeError("no SAP connection")
+        return FakeSession(self, slot, self.connection)
+
+    def kill(self):
+        with self.lock:
+            self.connection = 0
+
+
+class FakeSession:
+    def __init__(self, backend, slot, connection):
+        self.backend = backend
+        self.slot = slot
+        self.connection = connection
+
+    @property
+    def busy(self):
+        self.findById("wnd[0]")
+        return False
+
+    def findById(self, element_id):
+        if self.backend.connection != self.connection:
+            raise RuntimeError("session closed")
+        return FakeElement()
+
+
+def make_query(latencies, scale, fail_at=(), kill_at=None):
+    """latencies[i] 是第 i 個 job 的 SAP 查詢秒數；fail_at 的 job 第一次跑會失敗，kill_at 的 job 會弄斷連線。"""
+    tried = set()
+    lock = threading.Lock()
+
+    def query(session, job):
+        session.findById("wnd[0]")
+        with lock:
+            first = job not in tried
+            tried.add(job)
+        if first and job == kill_at:
+            session.backend.kill()
+            raise RuntimeError("connection lost")
+        if first and job in fail_at:
+            raise RuntimeError("simulated SAP error")
+        if job % 10 == 0:
+            time.sleep(0.5 * scale)        # 模擬多值清單從檔案上傳（upload_selection_file，各 session 不用排隊）
+        time.sleep(latencies[job] * scale)
+        return True
+    return query
+
+
+def run(n_sessions, latencies, scale, inject):
+    backend = FakeBackend()
+    n = len(latencies)
+    fail_at = set(range(7, n, 25)) if inject else set()
+    kill_at = n // 2 if inject else None
+    pool = SessionPool(n_sessions, login=backend.login, attach=backend.attach, retry_wait=0, label="bench")
+    result = pool.run(range(n), make_query(latencies, scale, fail_at, kill_at))
+    return result, backend.logins
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--queries", type=int, default=120)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 6])
+    parser.add_argument("--scale", type=float, default=0.005, help="SAP 秒數 × scale = 模擬的實際秒數")
+    parser.add_argument("--no-failures", action="store_true", help="不注入查詢失敗 / 斷線")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    lats = rng.lognormal(np.log(20), 0.8, args.queries).tolist()
+
+    rows = []
+    for n in args.sessions:
+        result, logins = run(n, lats, args.scale, not args.no_failures)
+        rows.append((n, result, logins))
+
+    base = rows[0][1]["seconds"]
+    print(f"\n{'sessions':>9}{'done':>7}{'failed':>8}{'logins':>8}{'SAP time(min)':>15}{'speedup':>9}")
+    for n, result, logins in rows:
+        sap_minutes = result["seconds"] / args.scale / 60
+        print(f"{n:>9}{result['done']:>7}{len(result['failed']):>8}{logins:>8}"
+              f"{sap_minutes:>15,.0f}{base / result['seconds']:>9.2f}x")
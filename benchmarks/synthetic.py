@@ -0,0 +1,58 @@
+"""
+產生假的 SAP 匯出檔（ZMB51 / ZSTPROMO / ZRSSALE / ZMMIDR）給 benchmark 用。
+
+資料和格式來自 sap_scripts/fake_exports（fake_gui 存檔也是用同一套）：
+標題 + 空行 + header、每行最前面空白欄、MM/DD/YYYY、千分位 + 尾巴負號。
+檔名照各 ETL glob 的樣子（ZMB51_*.txt、ZRSSALE_D2*.txt、Zmmidr_bun_<dept>_<dc>_<date>.txt）。
+
+    python -m ETL_SAP.benchmarks.synthetic ZMB51 --rows 200000 --files 4 --out C:/tmp/zmb51
+"""
+import argparse
+import os
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from ETL_SAP.sap_scripts.fake_exports import make_export, write_sap_export, REPORT_TITLES
+
+# 每個 case：fake_exports 的 tcode、產生器參數、第 i 個檔案的檔名
+CASES = {
+    "ZMB51": ("ZMB51", {}, lambda i, s, e: f"ZMB51_{s:%m%d%Y}_{e:%m%d%Y}_SCA.txt"),
+    "ZSTPROMO": ("ZSTPROMO", {}, lambda i, s, e: f"ZSTPROMO_{s:%m%d%Y}_{e:%m%d%Y}.txt"),
+    "ZRSSALE_D2": ("ZRSSALE", {"channel": "D2"}, lambda i, s, e: f"ZRSSALE_D2_{s:%m%d%Y}_{e:%m%d%Y}.txt"),
+    "ZRSSALE_D3": ("ZRSSALE", {"channel": "D3"}, lambda i, s, e: f"ZRSSALE_D3_{s:%m%d%Y}_{e:%m%d%Y}.txt"),
+    "ZMMIDR": ("ZMMIDR", {}, lambda i, s, e: f"Zmmidr_bun_106_{9801 + i}_{e:%m%d%Y}.txt"),
+}
+
+
+def generate(case: str, out_dir, rows: int, files: int = 1, start="2025-01-05", seed: int = 0) -> list[Path]:
+    """每個檔案一週、rows 列（ZMMIDR 一個 D/C 一個檔，最多 20,000 列）；回傳檔案路徑。"""
+    tcode, kwargs, filename = CASES[case]
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(files):
+        s = pd.Timestamp(start) + pd.Timedelta(days=7 * i)
+        e = s + pd.Timedelta(days=6)
+        df = make_export(tcode, rows, s, e, seed=seed + i, **kwargs)
+        path = out_dir / filename(i, s, e)
+        write_sap_export(path, df, title=REPORT_TITLES[tcode])
+        paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("cases", nargs="+", choices=list(CASES))
+    parser.add_argument("--rows", type=int, default=100_000, help="每個檔案的列數")
+    parser.add_argument("--files", type=int, default=1)
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for case in args.cases:
+        t0 = time.perf_counter()
+        paths = generate(case, Path(args.out, case), args.rows, args.files, seed=args.seed)
+        size = sum(os.path.getsize(p) for p in paths) / 1e6
+        print(f"{case:<12} {len(paths)} 個檔案  {size:,.1f} MB  {time.perf_counter() - t0:.1f}s  → {paths[0].parent}")
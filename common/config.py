@@ -1,6 +1,8 @@
 import os
+import atexit
 import pyodbc
 import urllib
+import threading
 from sqlalchemy import text
 from sqlalchemy import create_engine
 from sqlalchemy.exc import SQLAlchemyError
@@ -8,19 +10,73 @@ from dotenv import load_dotenv
 
 load_dotenv() # Load environment variables from .env file. 自動讀取 .env 檔案中的環境變數並載入進 os.environ 中
 
-def get_sql_engine():
+# ------- Engine 快取：同一組參數整個 process 共用一個 engine / 連線池 -------
+_ENGINES = {}
+_ENGINES_LOCK = threading.Lock()
+
+
+def _build_sql_engine(server, database, pool_size, max_overflow, pool_recycle, pool_pre_ping):
     params = urllib.parse.quote_plus(
         f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-        f"SERVER={os.getenv('SQL_SERVER')};"
-        f"DATABASE={os.getenv('SQL_DB')};"
+        f"SERVER={server};"
+        f"DATABASE={database};"
         f"Trusted_Connection=yes;"
         f"CHARSET=UTF8;"
         f"Connection Timeout=60;"
         f"Query Timeout=0;"
     )
-    engine = create_engine("mssql+pyodbc:///?odbc_connect=%s" % params)
+    return create_engine(
+        "mssql+pyodbc:///?odbc_connect=%s" % params,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_recycle=pool_recycle,      # 秒；避免拿到被 server / 防火牆砍掉的舊連線
+        pool_pre_ping=pool_pre_ping,    # 借出前先 ping，斷線就自動重連
+    )
+
+
+def get_sql_engine(
+    server=None,
+    database=None,
+    pool_size=None,
+    max_overflow=None,
+    pool_recycle=None,
+    pool_pre_ping=None,
+):
+    """
+    回傳快取的 SQLAlchemy engine；同樣的連線設定只會建立一次，
+    之後的呼叫都共用同一個連線池（ODBC 連線 / 登入只付一次）。
+    參數沒給就讀 .env：SQL_POOL_SIZE、SQL_MAX_OVERFLOW、SQL_POOL_RECYCLE、SQL_POOL_PRE_PING。
+    """
+    server = server or os.getenv('SQL_SERVER')
+    database = database or os.getenv('SQL_DB')
+    pool_size = int(pool_size if pool_size is not None else os.getenv("SQL_POOL_SIZE", 5))
+    max_overflow = int(max_overflow if max_overflow is not None else os.getenv("SQL_MAX_OVERFLOW", 5))
+    pool_recycle = int(pool_recycle if pool_recycle is not None else os.getenv("SQL_POOL_RECYCLE", 1800))
+    if pool_pre_ping is None:
+        pool_pre_ping = os.getenv("SQL_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+    key = (server, database, pool_size, max_overflow, pool_recycle, bool(pool_pre_ping))
+    with _ENGINES_LOCK:
+        engine = _ENGINES.get(key)
+        if engine is None:
+            engine = _build_sql_engine(*key)
+            _ENGINES[key] = engine
     return engine
 
+
+def dispose_sql_engines():
+    """關閉所有快取的 engine 與連線池（整個 run 結束時呼叫）。"""
+    with _ENGINES_LOCK:
+        engines = list(_ENGINES.values())
+        _ENGINES.clear()
+    for engine in engines:
+        engine.dispose()
+    if engines:
+        print(f"🔌 已關閉 {len(engines)} 個 SQL engine 連線池")
+
+
+atexit.register(dispose_sql_engines)
+
 # def get_sql_engine():
 #     conn_str = (
 #         f"DRIVER={{ODBC Driver 17 for SQL Server}};"
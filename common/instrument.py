@@ -0,0 +1,204 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+# ------------------------------------------------------------
+# 各階段耗時紀錄（download / read / parse / clean / staging / merge …）：
+#   with stage("merge", table=tgt) as s: ...; s.rows = n     → context manager
+#   @timed("clean")                                          → decorator（回傳 DataFrame / int 自動算 rows）
+#   record("read", seconds, rows=..., nbytes=...)            → 自己量好時間再記（generator 這種）
+# 每一筆寫成一行 JSON 到 logs/runs/<run_id>.jsonl（env ETL_RUN_DIR），
+# run_id 放在 env ETL_RUN_ID：process pool 的子程序繼承同一個 run_id、寫同一個檔，
+# 最後 print_run_summary() 讀檔彙總成每個 stage 的次數 / 秒數 / 列數 / MB。
+# 每筆紀錄只多一次 perf_counter + 一行寫檔（以檔案 / 批次為單位，不在逐列迴圈裡用）。
+# ETL_INSTRUMENT=0 → 不寫檔，只留在記憶體。
+# ------------------------------------------------------------
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # 等於 ETL_SAP/
+RUN_DIR = os.getenv("ETL_RUN_DIR", os.path.join(BASE_DIR, "logs", "runs"))
+INSTRUMENT_ENABLED = os.getenv("ETL_INSTRUMENT", "1") != "0"
+
+
+def _new_run_id() -> str:
+    return datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+
+
+class Span:
+    """stage() yield 出來的物件：在 with 裡面設定 rows / bytes，或用 add() 累加。"""
+    __slots__ = ("rows", "bytes", "tags")
+
+    def __init__(self, tags):
+        self.rows = None
+        self.bytes = None
+        self.tags = tags
+
+    def add(self, rows=0, nbytes=0):
+        self.rows = (self.rows or 0) + rows
+        self.bytes = (self.bytes or 0) + nbytes
+
+
+class RunRecorder:
+    """一個 process 裡的紀錄器；寫檔和記憶體清單共用一把 lock（loader threads 會同時寫）。"""
+
+    def __init__(self, run_dir=RUN_DIR, enabled=INSTRUMENT_ENABLED):
+        self.run_dir = run_dir
+        self.enabled = enabled
+        self.records = []
+        self._lock = threading.Lock()
+        self._fh = None
+        # 子程序：沿用父程序的 run_id；主程序第一次 import 時產生
+        self.run_id = os.environ.setdefault("ETL_RUN_ID", _new_run_id())
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.run_dir, f"{self.run_id}.jsonl")
+
+    def start_run(self, label=None) -> str:
+        """開新的 run（之後的紀錄寫到新檔）；同一個 process 之後開的子程序也跟著用新的 run_id。"""
+        with self._lock:
+            self._close()
+            self.run_id = _new_run_id()
+            os.environ["ETL_RUN_ID"] = self.run_id
+            self.records = []
+        if label:
+            self.record("run", 0.0, label=label)
+        return self.run_id
+
+    def record(self, name, seconds, rows=None, nbytes=None, ok=True, error=None, **tags):
+        rec = {
+            "run_id": self.run_id,
+            "stage": name,
+            "ts": round(time.time(), 3),
+            "seconds": round(seconds, 4),
+            "rows": rows,
+            "bytes": nbytes,
+            "ok": ok,
+            "pid": os.getpid(),
+            "thread": threading.current_thread().name,
+            **tags,
+        }
+        if error is not None:
+            rec["error"] = str(error)[:300]
+        with self._lock:
+            self.records.append(rec)
+            if self.enabled:
+                if self._fh is None:
+                    os.makedirs(self.run_dir, exist_ok=True)
+                    self._fh = open(self.path, "a", encoding="utf-8")
+                self._fh.write(json.dumps(rec, ensure_ascii=False, default=str) + "\n")
+                self._fh.flush()          # 子程序可能被直接收掉，每筆都 flush
+        return rec
+
+    def load(self, run_id=None) -> list[dict]:
+        """這次 run 的所有紀錄（含子程序寫的）；沒寫檔時只有本 process 記憶體裡的。"""
+        run_id = run_id or self.run_id
+        path = os.path.join(self.run_dir, f"{run_id}.jsonl")
+        if not os.path.exists(path):
+            return list(self.records) if run_id == self.run_id else []
+        with self._lock:
+            if self._fh is not None:
+                self._fh.flush()
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def _close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+
+RECORDER = RunRecorder()
+atexit.register(RECORDER.close)
+
+
+def start_run(label=None) -> str:
+    return RECORDER.start_run(label)
+
+
+def record(name, seconds, rows=None, nbytes=None, ok=True, error=None, **tags) -> dict:
+    return RECORDER.record(name, seconds, rows=rows, nbytes=nbytes, ok=ok, error=error, **tags)
+
+
+@contextmanager
+def stage(name, **tags):
+    """with stage("to_sql", table="zmmidr") as s: ...; s.rows = len(df)。丟例外也會記（ok=False）。"""
+    span = Span(tags)
+    t0 = time.perf_counter()
+    try:
+        yield span
+    except BaseException as e:
+        RECORDER.record(name, time.perf_counter() - t0, span.rows, span.bytes, ok=False, error=e, **span.tags)
+        raise
+    RECORDER.record(name, time.perf_counter() - t0, span.rows, span.bytes, **span.tags)
+
+
+def count_rows(result):
+    if isinstance(result, bool):
+        return None
+    if isinstance(result, int):
+        return result
+    if hasattr(result, "shape") and hasattr(result, "columns"):   # DataFrame
+        return len(result)
+    return None
+
+
+def timed(name=None, **tags):
+    """@timed("clean")：記錄函式耗時；回傳 DataFrame / int 時當作 rows。"""
+    def wrap(func):
+        stage_name = name or func.__name__
+
+        @wraps(func)
+        def inner(*args, **kwargs):
+            with stage(stage_name, **tags) as s:
+                result = func(*args, **kwargs)
+                s.rows = count_rows(result)
+            return result
+        return inner
+    return wrap
+
+
+def summarize(records) -> dict:
+    """{stage: {"n", "seconds", "max_s", "rows", "bytes", "errors"}}，依總秒數排序。"""
+    out = defaultdict(lambda: {"n": 0, "seconds": 0.0, "max_s": 0.0, "rows": 0, "bytes": 0, "errors": 0})
+    for r in records:
+        if r["stage"] == "run":
+            continue
+        s = out[r["stage"]]
+        s["n"] += 1
+        s["seconds"] += r["seconds"]
+        s["max_s"] = max(s["max_s"], r["seconds"])
+        s["rows"] += r.get("rows") or 0
+        s["bytes"] += r.get("bytes") or 0
+        s["errors"] += 0 if r.get("ok", True) else 1
+    return dict(sorted(out.items(), key=lambda kv: -kv[1]["seconds"]))
+
+
+def print_run_summary(run_id=None) -> dict:
+    """
+    每個 stage 一行：次數、總秒數、最慢一次、列數、MB、rows/s。
+    stage 之間會巢狀（download 包含 sap.query），秒數不能直接相加。
+    """
+    summary = summarize(RECORDER.load(run_id))
+    if not summary:
+        return summary
+    print(f"\n⏱️ run {run_id or RECORDER.run_id} 各階段耗時：")
+    print(f"   {'stage':<20}{'n':>6}{'total(s)':>10}{'max(s)':>9}{'rows':>13}{'MB':>9}{'rows/s':>11}  err")
+    for name, s in summary.items():
+        rate = f"{s['rows'] / s['seconds']:,.0f}" if s["rows"] and s["seconds"] else "-"
+        mb = f"{s['bytes'] / 1e6:,.1f}" if s["bytes"] else "-"
+        rows = f"{s['rows']:,}" if s["rows"] else "-"
+        print(f"   {name:<20}{s['n']:>6}{s['seconds']:>10.1f}{s['max_s']:>9.2f}{rows:>13}{mb:>9}{rate:>11}"
+              f"  {s['errors'] or ''}")
+    if RECORDER.enabled:
+        print(f"   📄 {RECORDER.path if run_id is None else os.path.join(RECORDER.run_dir, f'{run_id}.jsonl')}")
+    return summary
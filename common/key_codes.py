@@ -0,0 +1,140 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+# ------------------------------------------------------------
+# 識別碼欄位（Article / Site / DC / MCH）的編碼層：
+#   ETL 裡這些欄位用 pandas categorical（int32 編號 + 一份字典）傳遞，
+#   groupby / drop_duplicates / merge 比 object 字串快、也省記憶體；
+#   寫進 SQL 之前（upsert_batch / upload_to_sql / clean_df_by_sql_schema）才 decode_keys() 轉回字串。
+#
+# 字典是持久的：<KEY_DICT_DIR>/<欄位>.txt，一行一個值，只會往後加（append-only），
+# 已經寫進檔案的值之後每次執行編號都一樣，不同檔案編出來的 categorical 通常 dtype 相同、直接 concat。
+# process pool 的子程序各自加新值也沒關係：categorical 自己帶著 categories，
+# 父程序用 concat_encoded() / align_keys() 合併時依「值」對齊，不依編號。
+#   KEY_ENCODING=0   → encode_keys() 不做事（欄位維持字串）
+#   KEY_DICT_DIR     → 字典位置（預設 ETL_SAP/keys）
+# ------------------------------------------------------------
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # 等於 ETL_SAP/
+KEY_DICT_DIR = os.getenv("KEY_DICT_DIR", os.path.join(BASE_DIR, "keys"))
+KEY_ENCODING = os.getenv("KEY_ENCODING", "1") != "0"
+KEY_COLUMNS = ("Article", "Site", "DC", "MCH")
+
+
+class KeyDictionary:
+    """單一欄位的持久字典（值 → 編號 = 第一次出現的順序）；同一個 process 裡的 thread 共用。"""
+
+    def __init__(self, name: str, key_dir: str | None = None):
+        self.name = name
+        self.path = os.path.join(key_dir or KEY_DICT_DIR, f"{name}.txt")
+        self._lock = threading.Lock()
+        self._pending = []
+        values = []
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                values = f.read().splitlines()
+        # 不同 process 同時 append 可能寫進重複的值：保留第一次出現的，編號不變
+        self.categories = pd.Index(pd.unique(pd.Series(values, dtype=object)), dtype=object)
+        self.dtype = pd.CategoricalDtype(self.categories)
+
+    def __len__(self):
+        return len(self.categories)
+
+    def add(self, values) -> bool:
+        """把沒看過的值加到字典尾端；有新值回傳 True。"""
+        values = pd.Index(pd.unique(pd.Series(values, dtype=object).dropna()), dtype=object)
+        new = values[self.categories.get_indexer(values) < 0]
+        if not len(new):
+            return False
+        with self._lock:
+            new = new[self.categories.get_indexer(new) < 0]     # 拿到 lock 之前別的 thread 可能加過
+            if len(new):
+                self.categories = self.categories.append(new)
+                self.dtype = pd.CategoricalDtype(self.categories)
+                self._pending.extend(v for v in new if "\n" not in v)
+        return bool(len(new))
+
+    def encode(self, col: pd.Series) -> pd.Series:
+        """字串欄位 → categorical（dtype 是整本字典）；空值維持 NaN。"""
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            return self.align(col)
+        col = col.astype(object)
+        self.add(col)
+        dtype = self.dtype
+        codes = dtype.categories.get_indexer(col)
+        return pd.Series(pd.Categorical.from_codes(codes.astype(np.int32), dtype=dtype),
+                         index=col.index, name=col.name)
+
+    def align(self, col: pd.Series) -> pd.Series:
+        """別的 process / 舊版字典編出來的 categorical → 這本字典的編號（依值對齊）。"""
+        if col.cat.categories.equals(self.dtype.categories):   # dtype 的 == 不看順序，這裡要看
+            return col
+        self.add(col.cat.categories.astype(object))
+        return col.cat.set_categories(self.dtype.categories)
+
+    def save(self) -> int:
+        """新值附加到字典檔（一次 write，多個 process 同時寫也不會交錯）；回傳寫了幾個。"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return 0
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(f"{v}\n" for v in pending))
+        return len(pending)
+
+
+_dictionaries = {}
+_dictionaries_lock = threading.Lock()
+
+
+def get_dictionary(name: str) -> KeyDictionary:
+    with _dictionaries_lock:
+        if name not in _dictionaries:
+            _dictionaries[name] = KeyDictionary(name)
+        return _dictionaries[name]
+
+
+def encode_keys(df: pd.DataFrame, columns=KEY_COLUMNS, save: bool = True) -> pd.DataFrame:
+    """df 裡有的識別碼欄位轉成 categorical（就地修改並回傳 df）；save=True 時新值馬上寫進字典檔。"""
+    if not KEY_ENCODING:
+        return df
+    for c in columns:
+        if c in df.columns:
+            book = get_dictionary(c)
+            df[c] = book.encode(df[c])
+            if save:
+                book.save()
+    return df
+
+
+def align_keys(df: pd.DataFrame, columns=KEY_COLUMNS) -> pd.DataFrame:
+    for c in columns:
+        if c in df.columns and isinstance(df[c].dtype, pd.CategoricalDtype):
+            df[c] = get_dictionary(c).align(df[c])
+    return df
+
+
+def concat_encoded(frames, columns=KEY_COLUMNS, **kwargs) -> pd.DataFrame:
+    """pd.concat，但先把各 frame 的 categorical 對齊到同一本字典（不然 concat 會退回 object）。"""
+    frames = list(frames)
+    # 先把所有新值加進字典，再一起對齊：不然先對齊的 frame 會停在比較短的字典
+    for f in frames:
+        for c in columns:
+            if c in f.columns and isinstance(f[c].dtype, pd.CategoricalDtype):
+                get_dictionary(c).add(f[c].cat.categories.astype(object))
+    return pd.concat([align_keys(f, columns) for f in frames], **kwargs)
+
+
+def decode_keys(df: pd.DataFrame) -> pd.DataFrame:
+    """SQL 寫入前：所有 categorical 欄位轉回原本的值（有需要才 copy）。"""
+    cats = [c for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)]
+    if not cats:
+        return df
+    df = df.copy(deep=False)
+    for c in cats:
+        df[c] = df[c].astype(df[c].cat.categories.dtype)
+    return df
@@ -1,24 +1,109 @@
 from __future__ import annotations
+import os
+import threading
 import time
+from contextlib import contextmanager
 import pandas as pd
 from sqlalchemy import text, inspect
+from sqlalchemy.types import BIGINT
 from typing import Sequence, Mapping
 from sqlalchemy.exc import SQLAlchemyError, OperationalError
 from ETL_SAP.common.config import get_sql_engine
 from ETL_SAP.pipelines.etl_utils import sql_type_string
+from ETL_SAP.common.staging_writers import write_staging, DEFAULT_WRITER
+from ETL_SAP.common.staging import get_staging
+from ETL_SAP.common.instrument import stage, record
+from ETL_SAP.common.key_codes import decode_keys
+from ETL_SAP.common.schema_registry import invalidate_schema
+from ETL_SAP.common.retry import DEFAULT_POLICY, call_with_retry, classify
 
-def upload_to_sql(df, table_name, column_types, if_exists="append", max_retries: int = 3):
+# ------------------------------------------------------------
+# 筆數統計模式（env LOADER_ROW_COUNTS）
+#   rowcount → 用 to_sql 回傳值 / MERGE 的 @@ROWCOUNT、OUTPUT（預設，不掃表）
+#   metadata → 另外從 sys.partitions 讀前後筆數（只讀 metadata，不掃表）
+#   full     → 前後 SELECT COUNT(*)，大表會整張掃，要的時候才開
+#   off      → 不統計
+# ------------------------------------------------------------
+ROW_COUNT_MODES = ("rowcount", "metadata", "full", "off")
+DEFAULT_ROW_COUNTS = os.getenv("LOADER_ROW_COUNTS", "rowcount")
+
+
+def _row_count_mode(mode: str | None) -> str:
+    mode = mode or DEFAULT_ROW_COUNTS
+    if mode not in ROW_COUNT_MODES:
+        raise ValueError(f"Unknown row count mode: {mode}（可用：{', '.join(ROW_COUNT_MODES)}）")
+    return mode
+
+
+def table_row_count(conn, table: str, mode: str) -> int | None:
+    """metadata → sys.partitions（heap / clustered index 的列數）；full → COUNT(*)；其他模式不查。"""
+    try:
+        if mode == "metadata":
+            return conn.execute(text("""
+                SELECT COALESCE(SUM(p.rows), 0) FROM sys.partitions p
+                WHERE p.object_id = OBJECT_ID(:t) AND p.index_id IN (0, 1)
+            """), {"t": table}).scalar()
+        if mode == "full":
+            return conn.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+    except SQLAlchemyError:
+        return 0  # 表示表格不存在
+    return None
+
+
+# ------------------------------------------------------------
+# SQL 寫入併發上限（env SQL_MAX_CONCURRENT_WRITES，0 = 不限制，預設）
+#   同一個 process 裡同時進行的 upload / upsert transaction 最多幾個；
+#   backfill 同時跑好幾個 ETL、每個又有多個 loader thread 時，用這個保護 SQL Server。
+#   排隊等待的秒數記成 "sql_wait" stage。
+# ------------------------------------------------------------
+_write_slots = None
+
+
+def set_sql_concurrency(limit: int | None):
+    """設定（或用 0 / None 取消）寫入併發上限；已經在等的 thread 沿用舊的設定。"""
+    global _write_slots
+    _write_slots = threading.BoundedSemaphore(limit) if limit else None
+
+
+set_sql_concurrency(int(os.getenv("SQL_MAX_CONCURRENT_WRITES", 0)))
+
+
+@contextmanager
+def sql_write_slot(table: str):
+    slots = _write_slots
+    if slots is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    with slots:
+        waited = time.perf_counter() - t0
+        if waited >= 0.01:
+            record("sql_wait", waited, table=table)
+        yield
+
+
+def _print_before_after(table, before, after):
+    if before is not None and after is not None:
+        print(f"{table}: 筆數從 {before} → {after}，共新增 {after - before} 筆。")
+
+
+def upload_to_sql(df, table_name, column_types, if_exists="append", max_retries: int = 3,
+                  row_counts: str | None = None):
+    """
+    df.to_sql 整批寫入（一個 transaction）；成功回傳寫入筆數。
+    連線類錯誤用 common/retry 的退避重試，每次重試前 dispose engine 重建連線；
+    append 不是冪等的，只有確定沒寫進去（連不上、deadlock）才重試。
+    """
     SQL_ENGINE = get_sql_engine()
+    row_counts = _row_count_mode(row_counts)
+    df = decode_keys(df)      # categorical 識別碼到這裡才轉回字串
 
-    for attempt in range(1, max_retries + 1):
-        try:
-            with SQL_ENGINE.begin() as conn:  # 使用 begin() 可自動 commit/rollback
-                try:
-                    before = conn.execute(text(f"SELECT COUNT(*) FROM {table_name}")).scalar()
-                except SQLAlchemyError:
-                    before = 0  # 表示表格不存在
+    def write():
+        with sql_write_slot(table_name), SQL_ENGINE.begin() as conn:  # 使用 begin() 可自動 commit/rollback
+            before = table_row_count(conn, table_name, row_counts)
 
-                df.to_sql(
+            with stage("to_sql", table=table_name) as s:
+                written = df.to_sql(
                     table_name, 
                     con=conn, 
                     if_exists=if_exists, 
@@ -27,15 +112,37 @@ def upload_to_sql(df, table_name, column_types, if_exists="append", max_retries:
                     chunksize=200,
                 )
 
-                after = conn.execute(text(f"SELECT COUNT(*) FROM {table_name}")).scalar()
-                print(f"✅ 成功 {if_exists} {len(df)} 筆資料到 {table_name}")
-                print(f"{table_name}: 筆數從 {before} → {after}，共新增 {after - before} 筆。")
-        except OperationalError as e:
-            print(f"⚠️  上傳失敗 ({attempt}/{max_retries})：{e}")
-            time.sleep(5)
-            SQL_ENGINE.dispose()          # 關掉舊連線，下一輪重建
+                # 有些 driver 的 to_sql 回傳 None；rowcount 拿不到時是 -1（例如連線還開著 NOCOUNT），都改用 df 筆數
+                written = s.rows = written if written is not None and written >= 0 else len(df)
+            if if_exists == "replace":
+                invalidate_schema(table_name)     # replace 會 DROP + CREATE，schema 快取要重讀
+            after = table_row_count(conn, table_name, row_counts)
+        if row_counts != "off":
+            print(f"✅ 成功 {if_exists} {written} 筆資料到 {table_name}")
+        _print_before_after(table_name, before, after)
+        return written
+
+    try:
+        return call_with_retry(
+            write, policy=DEFAULT_POLICY._replace(max_attempts=max_retries),
+            name=f"upload {table_name}", idempotent=if_exists != "append",
+            on_retry=lambda e, attempt: SQL_ENGINE.dispose(),   # 關掉舊連線，下一輪重建
+        )
+    except OperationalError as e:
+        raise RuntimeError(f"{table_name} 寫入失敗（{classify(e)[1]}）") from e
+
+
+ROW_HASH_COL = "RowHash"   # hash_diff 模式在正式表多存的內容雜湊欄
+
 
-    raise RuntimeError(f"{table_name} 連續 {max_retries} 次寫入失敗")
+def row_hash(df: pd.DataFrame, unique_keys: Sequence[str]) -> pd.Series:
+    """
+    非 key 欄位的內容雜湊（BIGINT）。欄位依名稱排序，跟 DataFrame 欄位順序無關；
+    同樣的清洗結果每次都得到同樣的值，所以重跑同一段資料時可以判斷哪些列真的有變。
+    """
+    value_cols = sorted(c for c in df.columns if c not in unique_keys and c != ROW_HASH_COL)
+    hashed = pd.util.hash_pandas_object(df[value_cols], index=False)
+    return pd.Series(hashed.to_numpy().view("int64"), index=df.index, name=ROW_HASH_COL)
 
 
 def upsert_batch(
@@ -43,111 +150,161 @@ def upsert_batch(
     target_table: str,                    # e.g. dbo.ZMB51
     unique_keys: Sequence[str],           # ['Article','Site','Date']
     column_types: Mapping[str, object],   # to_sql dtype dict
-    stg_table: str | None = None,         # None → 自動 <table>_stg
-    chunksize: int = 200,
+    stg_table: str | None = None,         # 指定 → persistent 策略用這張表
+    chunksize: int | None = None,         # None → 由 writer 決定
+    writer: str | None = None,            # None → env STAGING_WRITER（預設 fast_executemany）
+    hash_diff: bool = False,              # True → 只 UPDATE 內容雜湊有變的列
+    row_counts: str | None = None,        # None → env LOADER_ROW_COUNTS（預設 rowcount）
+    staging=None,                         # None → env STAGING_MODE（預設 temp），見 common/staging.py
     ):
     """
     通用批次 UPSERT：
-    1. TRUNCATE 暫存表
-    2. 將 df 批量寫入暫存表
+    1. 準備空的暫存表（persistent / temp #table / run 共用，依 staging 策略）
+    2. 將 df 批量寫入暫存表（writer 可選 fast_executemany / multi / to_sql）
     3. MERGE 暫存→正式表 (matched=UPDATE, not matched=INSERT)
 
-    失敗自動 rollback；成功才會改動正式表。
+    hash_diff=True 時每列多帶一個 RowHash（非 key 欄位的內容雜湊），正式表沒有這欄會自動加上；
+    MERGE 只更新 RowHash 不同的列，重跑同一段資料不會整批重寫。
+
+    回傳筆數 dict：一般模式 {"affected"}（MERGE 的 @@ROWCOUNT）；hash_diff 再加上
+    inserted / updated / unchanged。row_counts="metadata" / "full" 時多 before / after。
+
+    失敗自動 rollback；成功才會改動正式表。連線類錯誤依 common/retry 的策略退避重試（MERGE 可重做），
+    語法 / 欄位 / constraint 這類 fatal 錯誤直接丟出。
     """
     engine = get_sql_engine()
-    stg_table = stg_table or f"{target_table}_stg"
+    staging = get_staging(staging, stg_table)
+    row_counts = _row_count_mode(row_counts)
+    df = decode_keys(df)      # categorical 識別碼到這裡才轉回字串
+
+    if hash_diff:
+        df = df.assign(**{ROW_HASH_COL: row_hash(df, unique_keys)})
+        column_types = {**column_types, ROW_HASH_COL: BIGINT()}
 
     # 1) 動態產生 MERGE SQL
+    # 暫存表名要等 staging.prepare() 才知道，先留 {stg}
     tgt = target_table
-    stg = stg_table
     on_cond   = " AND ".join([f"T.[{k}] = S.[{k}]" for k in unique_keys])
     ins_cols  = ", ".join([f"[{c}]" for c in df.columns])
     ins_vals  = ", ".join([f"S.[{c}]" for c in df.columns])
     upd_set   = ", ".join([f"T.[{c}] = S.[{c}]" for c in df.columns
                            if c not in unique_keys])
 
+    # NOCOUNT 是 session 設定：連線會回到 pool 給別人用（to_sql 靠 rowcount），所以最後要 SET NOCOUNT OFF
     merge_sql = f"""
+    SET NOCOUNT ON;
     MERGE {tgt} AS T
-    USING {stg} AS S
+    USING {{stg}} AS S
         ON ({on_cond})
     WHEN MATCHED THEN
-        UPDATE SET {upd_set}
+        UPDATE SET {upd_set}{{clear_hash}}
     WHEN NOT MATCHED THEN
         INSERT ({ins_cols})
         VALUES ({ins_vals});
+    SELECT @@ROWCOUNT AS affected;
+    SET NOCOUNT OFF;
+    """
+
+    # hash_diff：RowHash 一樣的列完全不碰；OUTPUT $action 統計新增 / 更新筆數
+    merge_hash_sql = f"""
+    SET NOCOUNT ON;
+    DECLARE @actions TABLE (act NVARCHAR(10));
+    MERGE {tgt} AS T
+    USING {{stg}} AS S
+        ON ({on_cond})
+    WHEN MATCHED AND (T.[{ROW_HASH_COL}] IS NULL OR T.[{ROW_HASH_COL}] <> S.[{ROW_HASH_COL}]) THEN
+        UPDATE SET {upd_set}
+    WHEN NOT MATCHED THEN
+        INSERT ({ins_cols})
+        VALUES ({ins_vals})
+    OUTPUT $action INTO @actions;
+    SELECT
+        COALESCE(SUM(CASE WHEN act = 'INSERT' THEN 1 ELSE 0 END), 0) AS inserted,
+        COALESCE(SUM(CASE WHEN act = 'UPDATE' THEN 1 ELSE 0 END), 0) AS updated
+    FROM @actions;
+    SET NOCOUNT OFF;
     """
 
 
-    for attempt in range(3):
-        try:
-            with engine.begin() as conn:
-                # 確認正式表是否存在，若不存在就建立
-                table_exists = conn.execute(text(f"""
-                    SELECT COUNT(*) FROM INFORMATION_SCHEMA.TABLES 
-                    WHERE TABLE_SCHEMA = '{tgt.split('.')[0]}' 
-                      AND TABLE_NAME = '{tgt.split('.')[1]}'
-                """)).scalar()
-
-                if not table_exists:
-                    print(f"找不到正式表 {tgt}，正在自動建立...")
-                    cols_def = ",\n    ".join([f"[{col}] {sql_type_string(col_type)}"
-                                               for col, col_type in column_types.items()])
-                    pk_def = f"CONSTRAINT PK_{tgt.replace('.', '_')} PRIMARY KEY ({', '.join(f'[{k}]' for k in unique_keys)})"
-                    create_sql = f"""
-                    CREATE TABLE {tgt} (
-                        {cols_def},
-                        {pk_def}
-                    );
-                    """
-                    conn.execute(text(create_sql))
-
-                # 讀取筆數（before）
-                try:
-                    before = conn.execute(text(f"SELECT COUNT(*) FROM {target_table}")).scalar()
-                except SQLAlchemyError:
-                    before = 0  # 表示表格不存在
-                # (A) 確保暫存表存在（不存在就建立）
-                conn.execute(text(f"""
-                    IF OBJECT_ID('{stg}','U') IS NULL
-                        SELECT TOP 0 * INTO {stg} FROM {tgt};
-                """))
-
-                # (B) 清空暫存表
-                conn.execute(text(f"TRUNCATE TABLE {stg};"))
+    def merge():
+        with sql_write_slot(tgt), engine.begin() as conn:
+            # 確認正式表是否存在，若不存在就建立
+            table_exists = conn.execute(text(f"""
+                SELECT COUNT(*) FROM INFORMATION_SCHEMA.TABLES 
+                WHERE TABLE_SCHEMA = '{tgt.split('.')[0]}' 
+                  AND TABLE_NAME = '{tgt.split('.')[1]}'
+            """)).scalar()
+
+            if not table_exists:
+                print(f"找不到正式表 {tgt}，正在自動建立...")
+                cols_def = ",\n    ".join([f"[{col}] {sql_type_string(col_type)}"
+                                           for col, col_type in column_types.items()])
+                pk_def = f"CONSTRAINT PK_{tgt.replace('.', '_')} PRIMARY KEY ({', '.join(f'[{k}]' for k in unique_keys)})"
+                create_sql = f"""
+                CREATE TABLE {tgt} (
+                    {cols_def},
+                    {pk_def}
+                );
+                """
+                conn.execute(text(create_sql))
+                invalidate_schema(tgt)
+
+            # 正式表有沒有 RowHash 欄（COL_LENGTH 只查 metadata）
+            has_hash_col = conn.execute(
+                text(f"SELECT COL_LENGTH('{tgt}', '{ROW_HASH_COL}')")).scalar() is not None
+            if hash_diff and not has_hash_col:
+                print(f"🔧 {tgt} 新增 {ROW_HASH_COL} 欄位")
+                conn.execute(text(f"ALTER TABLE {tgt} ADD [{ROW_HASH_COL}] BIGINT NULL;"))
+                invalidate_schema(tgt)
+                # 暫存表是照正式表複製欄位的，舊的暫存表要重建才會有 RowHash
+                staging.reset(conn, tgt)
+
+            # 讀取筆數（before）：只有 metadata / full 模式才查
+            before = table_row_count(conn, target_table, row_counts)
+
+            # (A)(B) 暫存表不存在就建立，存在就 TRUNCATE
+            stg = staging.prepare(conn, tgt)
+            if row_counts == "full":
                 result = conn.execute(text(f"SELECT COUNT(*) FROM {stg}")).scalar()
                 print(f"📊 {stg} 資料筆數 after TRUNCATE: {result}")
 
-                # (C) 批量寫入暫存表
-                df.to_sql(stg.split('.')[-1],  # 只傳表名給 to_sql
-                        schema=stg.split('.')[0] if '.' in stg else None,
-                        con=conn,
-                        index=False,
-                        if_exists="append",
-                        dtype=column_types,
-                        method=None, # method="multi"
-                        chunksize=chunksize)
-
-                # (D) MERGE 更新正式表
-                conn.execute(text(merge_sql))
-                after = conn.execute(text(f"SELECT COUNT(*) FROM {target_table}")).scalar()
-                print(f"✅ 成功新增 {len(df)} 筆資料到 {target_table}")
-                print(f"{target_table}: 筆數從 {before} → {after}，共新增 {after - before} 筆。")
-
-                # (F) 移除暫存表
-                conn.execute(text(f"""
-                    IF OBJECT_ID('{stg}', 'U') IS NOT NULL
-                        DROP TABLE {stg};
-                """))
-                
-                print(f"暫存表 {stg} 已刪除")
-                        
-            print(f"✅ {target_table} upsert 完成（{len(df):,} rows）")
-            break
-
-        except (OperationalError, SQLAlchemyError) as e:
-            print(f"🚨 第 {attempt+1} 次失敗：{e}")
-            engine.dispose()
-            time.sleep(5)
-            if attempt + 1 == 3:
-                print("❌ 最多重試次數已達，放棄此次上傳")
-                raise
\ No newline at end of file
+            # (C) 批量寫入暫存表
+            with stage("staging_write", table=tgt, writer=writer or DEFAULT_WRITER) as s:
+                s.rows = write_staging(df, stg, conn, column_types,
+                                       writer=writer, chunksize=chunksize)
+                s.bytes = int(df.memory_usage(index=False).sum())   # 不用 deep，避免掃字串
+
+            # (D) MERGE 更新正式表
+            if hash_diff:
+                with stage("merge", table=tgt, hash_diff=True) as s:
+                    inserted, updated = conn.execute(text(merge_hash_sql.format(stg=stg))).one()
+                    s.rows = inserted + updated
+                counts = {"affected": inserted + updated, "inserted": inserted, "updated": updated,
+                          "unchanged": len(df) - inserted - updated}
+                if row_counts != "off":
+                    print(f"✅ {target_table}: 新增 {inserted:,}、更新 {updated:,}、"
+                          f"未變動 {counts['unchanged']:,} 筆")
+            else:
+                # 一般模式也會改到內容，舊的 RowHash 不再可信，清成 NULL 讓下次 hash_diff 重新比對
+                clear_hash = f", T.[{ROW_HASH_COL}] = NULL" if has_hash_col else ""
+                with stage("merge", table=tgt, hash_diff=False) as s:
+                    affected = s.rows = conn.execute(text(merge_sql.format(stg=stg, clear_hash=clear_hash))).scalar()
+                counts = {"affected": affected}
+                if row_counts != "off":
+                    print(f"✅ {target_table}: MERGE 影響 {affected:,} 筆（staging {len(df):,} 筆）")
+
+            after = table_row_count(conn, target_table, row_counts)
+            if before is not None and after is not None:
+                counts.update(before=before, after=after)
+            _print_before_after(target_table, before, after)
+
+            # (F) 暫存表留著給下一批重複使用（不再每批 DROP）
+            staging.finish(conn, stg)
+
+        print(f"✅ {target_table} upsert 完成（{len(df):,} rows）")
+        return counts
+
+    return call_with_retry(
+        merge, name=f"upsert {target_table}",
+        on_retry=lambda e, attempt: engine.dispose(),   # 丟掉可能已經斷掉的連線
+    )
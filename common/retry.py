@@ -0,0 +1,283 @@
+import os
+import random
+import re
+import threading
+import time
+from functools import wraps
+from typing import Callable, NamedTuple
+
+from ETL_SAP.sap_scripts.sap_wait import SapError
+
+# ------------------------------------------------------------
+# 共用重試策略（取代各處「抓所有例外、固定 sleep 5 秒」的寫法）：
+#   - 指數退避 + jitter：base_delay × 2^(n-1)，最多 max_delay，再隨機縮短 jitter 比例
+#     （多個 thread 同時斷線時不會同一秒一起重連）
+#   - 錯誤分類：transient（斷線、逾時、deadlock、SAP session 掉線）才重試；
+#     fatal（SQL 語法 / 權限 / 欄位錯、程式錯誤）第一次就放棄，不再白等幾分鐘
+#   - 冪等保護：idempotent=False（例如 append）只在「確定沒寫進去」的錯誤才重試
+#     （連不上、deadlock 被 rollback）；斷線發生在 commit 途中不知道寫了沒 → 不重試
+#   - 每個名稱的呼叫 / 重試次數、等待秒數、放棄原因記在 RETRY_METRICS，最後 print_retry_report()
+# 不 import pyodbc / win32com：SQLSTATE 從例外的 args 讀，SAP 例外用 sap_wait 的 SapError。
+# ------------------------------------------------------------
+
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", 3))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", 5))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", 60))
+RETRY_JITTER = float(os.getenv("RETRY_JITTER", 0.5))       # 0 → 不加 jitter；0.5 → 實際等 50%~100%
+
+TRANSIENT, FATAL = "transient", "fatal"
+
+# SQLSTATE 前兩碼 / 完整碼
+TRANSIENT_SQLSTATES = ("08", "HYT00", "HYT01", "40001")        # 連線、逾時、deadlock / serialization
+FATAL_SQLSTATES = ("42", "23", "22", "28", "21", "07", "IM")   # 語法 / 物件、constraint、資料、登入、欄位數、driver
+# 確定「沒有寫進去」的 SQLSTATE：連不上（還沒送出）、deadlock victim（server 已 rollback）
+NOT_APPLIED_SQLSTATES = ("08001", "08004", "40001")
+# SQL Server 錯誤碼（訊息裡的 (1205)）：deadlock、Azure / 叢集切換、TCP 被斷
+TRANSIENT_SQL_ERRORS = {1205, 233, 10053, 10054, 10060, 40197, 40501, 40613, 49918, 49919, 49920}
+NOT_APPLIED_SQL_ERRORS = {1205}
+
+# SAP 狀態列這些訊息重登也沒用（權限、物件不存在）；env 可以覆蓋
+SAP_FATAL_PATTERN = re.compile(
+    os.getenv("RETRY_SAP_FATAL_PATTERN", r"authoriz|no authority|does not exist|沒有權限|不存在"),
+    re.IGNORECASE)
+
+# 程式 / 資料錯誤：重跑結果一樣
+FATAL_TYPES = (TypeError, AttributeError, NameError, KeyError, IndexError, ValueError,
+               ImportError, NotImplementedError, AssertionError, ZeroDivisionError,
+               FileNotFoundError, MemoryError)
+
+# SQLAlchemy 的連線類例外（沒有 SQLSTATE 時用型別名稱判斷）
+SA_CONNECTION_ERRORS = ("OperationalError", "InterfaceError", "DisconnectionError", "TimeoutError")
+
+_SQLSTATE_RE = re.compile(r"^[0-9A-Z]{5}$")
+_SQL_ERROR_RE = re.compile(r"\((-?\d+)\)")
+
+
+class RetryPolicy(NamedTuple):
+    """max_attempts 是總共執行幾次（含第一次）。"""
+    max_attempts: int = RETRY_MAX_ATTEMPTS
+    base_delay: float = RETRY_BASE_DELAY
+    max_delay: float = RETRY_MAX_DELAY
+    jitter: float = RETRY_JITTER
+
+    def delay(self, attempt: int, rng=random) -> float:
+        """第 attempt 次失敗後要等幾秒。"""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return delay * (1 - self.jitter * rng.random())
+
+
+DEFAULT_POLICY = RetryPolicy()
+
+
+# ---------- 錯誤分類 ----------
+def _db_error_info(exc):
+    """pyodbc 例外（或 SQLAlchemy 包著的 .orig）→ (SQLSTATE, SQL Server 錯誤碼)；不是 DB 例外回傳 None。"""
+    orig = getattr(exc, "orig", None) or exc
+    args = getattr(orig, "args", ())
+    if not args or not isinstance(args[0], str) or not _SQLSTATE_RE.match(args[0]):
+        return None
+    message = " ".join(str(a) for a in args[1:])
+    numbers = {int(n) for n in _SQL_ERROR_RE.findall(message)}
+    return args[0], numbers
+
+
+def _classify_one(exc):
+    """(kind, reason)；沒辦法判斷回傳 None（交給 __cause__ / __context__）。"""
+    info = _db_error_info(exc)
+    if info:
+        sqlstate, numbers = info
+        if numbers & TRANSIENT_SQL_ERRORS or sqlstate.startswith(TRANSIENT_SQLSTATES):
+            return TRANSIENT, f"SQLSTATE {sqlstate}"
+        if sqlstate.startswith(FATAL_SQLSTATES):
+            return FATAL, f"SQLSTATE {sqlstate}"
+        return TRANSIENT, f"SQLSTATE {sqlstate}"
+    # SQLAlchemy 自己的錯誤（沒有 SQLSTATE）：連線類 transient，其餘（編譯、參數、constraint）fatal
+    module = type(exc).__module__ or ""
+    if module.startswith("sqlalchemy"):
+        name = type(exc).__name__
+        if name in SA_CONNECTION_ERRORS or getattr(exc, "connection_invalidated", False):
+            return TRANSIENT, name
+        return FATAL, name
+    if isinstance(exc, SapError):
+        if SAP_FATAL_PATTERN.search(str(exc)):
+            return FATAL, "SAP 訊息"
+        return TRANSIENT, type(exc).__name__
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return TRANSIENT, type(exc).__name__
+    if isinstance(exc, FATAL_TYPES):
+        return FATAL, type(exc).__name__
+    return None
+
+
+def classify(exc: BaseException) -> tuple[str, str]:
+    """
+    回傳 (TRANSIENT | FATAL, 原因)。
+    外層是包裝用的 RuntimeError（例如 run_zmb51_query 把原始錯誤包一層）時，往 __cause__ / __context__ 找；
+    都判斷不出來 → transient（跟以前一樣會重試）。
+    """
+    seen = set()
+    e = exc
+    while e is not None and id(e) not in seen:
+        seen.add(id(e))
+        result = _classify_one(e)
+        if result:
+            return result
+        e = e.__cause__ or e.__context__
+    return TRANSIENT, type(exc).__name__
+
+
+def describe(exc: BaseException, limit: int = 300) -> str:
+    """一行的錯誤說明（SQLAlchemy 例外的 [SQL: ...] / Background 連結不印）。"""
+    text = str(exc).strip().splitlines()
+    return (text[0] if text else type(exc).__name__)[:limit]
+
+
+def is_transient(exc: BaseException) -> bool:
+    return classify(exc)[0] == TRANSIENT
+
+
+def is_connection_error(exc: BaseException) -> bool:
+    """
+    連線斷了 / 逾時 / deadlock（交易已被 rollback）：這條連線上不能再接著做別的事。
+    跟 is_transient 不同，判斷不出來的錯誤不算（例如 driver 的 HY000、資料轉換錯誤）。
+    pyodbc 直接丟的例外（沒被 SQLAlchemy 包）也看得懂。
+    """
+    seen = set()
+    e = exc
+    while e is not None and id(e) not in seen:
+        seen.add(id(e))
+        info = _db_error_info(e)
+        if info:
+            sqlstate, numbers = info
+            if numbers & TRANSIENT_SQL_ERRORS or sqlstate.startswith(TRANSIENT_SQLSTATES):
+                return True
+        elif (type(e).__module__ or "").startswith("sqlalchemy"):
+            if type(e).__name__ in SA_CONNECTION_ERRORS or getattr(e, "connection_invalidated", False):
+                return True
+        elif isinstance(e, (TimeoutError, ConnectionError)):
+            return True
+        e = e.__cause__ or e.__context__
+    return False
+
+
+def not_applied(exc: BaseException) -> bool:
+    """確定這次操作沒有生效（可以安全重做非冪等操作）：連不上 DB、deadlock 被 rollback、SAP 端錯誤。"""
+    info = _db_error_info(exc)
+    if info:
+        sqlstate, numbers = info
+        return sqlstate in NOT_APPLIED_SQLSTATES or bool(numbers & NOT_APPLIED_SQL_ERRORS)
+    return isinstance(exc, (SapError, TimeoutError))
+
+
+# ---------- 指標 ----------
+class RetryMetrics:
+    """每個名稱的 calls / attempts / retries / 成功 / 放棄次數、退避等待秒數、總耗時（thread-safe）。"""
+
+    FIELDS = ("calls", "attempts", "retries", "succeeded", "gave_up", "fatal", "wait_s", "seconds")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._last_error = {}
+
+    def record(self, name, **fields):
+        with self._lock:
+            stats = self._stats.setdefault(name, dict.fromkeys(self.FIELDS, 0))
+            for k, v in fields.items():
+                if k == "error":
+                    self._last_error[name] = v
+                else:
+                    stats[k] += v
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {name: {**stats, "last_error": self._last_error.get(name)}
+                    for name, stats in self._stats.items()}
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._last_error.clear()
+
+
+RETRY_METRICS = RetryMetrics()
+
+
+def print_retry_report(metrics: RetryMetrics = RETRY_METRICS):
+    """只列有重試或失敗過的項目；全部一次成功就印一行。"""
+    stats = metrics.snapshot()
+    noisy = {n: s for n, s in stats.items() if s["retries"] or s["gave_up"]}
+    if not noisy:
+        if stats:
+            print(f"🔁 retry：{len(stats)} 項全部一次成功")
+        return
+    print("\n🔁 retry 統計：")
+    print(f"   {'name':<28}{'calls':>6}{'retries':>8}{'gave up':>8}{'fatal':>6}{'wait(s)':>9}{'total(s)':>9}")
+    for name, s in sorted(noisy.items()):
+        print(f"   {name:<28}{s['calls']:>6}{s['retries']:>8}{s['gave_up']:>8}{s['fatal']:>6}"
+              f"{s['wait_s']:>9.1f}{s['seconds']:>9.1f}")
+        if s["last_error"]:
+            print(f"      └ 最後錯誤：{s['last_error']}")
+
+
+# ---------- 重試 ----------
+def call_with_retry(func: Callable, args=(), kwargs=None, policy: RetryPolicy | None = None,
+                    name: str | None = None, idempotent: bool = True,
+                    on_retry: Callable | None = None, metrics: RetryMetrics = RETRY_METRICS,
+                    sleep=time.sleep, rng=random):
+    """
+    成功回傳 func 的結果；放棄時丟出最後一次的例外（原始例外，不包裝）。
+    放棄條件：fatal 錯誤、idempotent=False 且不確定有沒有生效、或次數用完。
+    on_retry(exc, attempt)：每次要重試前呼叫（例如 engine.dispose()、重新登入 SAP）。
+    """
+    policy = policy or DEFAULT_POLICY
+    kwargs = kwargs or {}
+    name = name or getattr(func, "__name__", repr(func))
+    metrics.record(name, calls=1)
+    t0 = time.perf_counter()
+    attempt = 0
+    try:
+        while True:
+            attempt += 1
+            metrics.record(name, attempts=1)
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                kind, reason = classify(e)
+                message = describe(e)
+                if kind == FATAL:
+                    metrics.record(name, gave_up=1, fatal=1, error=f"{reason}: {message}")
+                    print(f"❌ {name} 發生不可重試的錯誤（{reason}），不再重試：{message}")
+                    raise
+                if not idempotent and not not_applied(e):
+                    metrics.record(name, gave_up=1, error=f"{reason}: {message}")
+                    print(f"❌ {name} 失敗（{reason}），操作不是冪等且無法確定是否已生效，不自動重試：{message}")
+                    raise
+                if attempt >= policy.max_attempts:
+                    metrics.record(name, gave_up=1, error=f"{reason}: {message}")
+                    print(f"❌ {name} 重試 {attempt} 次仍失敗（{reason}）：{message}")
+                    raise
+                delay = policy.delay(attempt, rng)
+                print(f"⚠️ {name} 第 {attempt}/{policy.max_attempts} 次失敗（{reason}），"
+                      f"{delay:.1f}s 後重試：{message}")
+                if on_retry:
+                    on_retry(e, attempt)
+                metrics.record(name, retries=1, wait_s=delay)
+                sleep(delay)
+            else:
+                metrics.record(name, succeeded=1)
+                return result
+    finally:
+        metrics.record(name, seconds=time.perf_counter() - t0)
+
+
+def retrying(policy: RetryPolicy | None = None, name: str | None = None, idempotent: bool = True,
+             on_retry: Callable | None = None):
+    """decorator 版：@retrying(name="upload zmmidr")"""
+    def wrap(func):
+        @wraps(func)
+        def inner(*args, **kwargs):
+            return call_with_retry(func, args, kwargs, policy=policy, name=name or func.__name__,
+                                   idempotent=idempotent, on_retry=on_retry)
+        return inner
+    return wrap
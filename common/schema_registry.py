@@ -0,0 +1,163 @@
+import os
+import threading
+import time
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from ETL_SAP.common.config import get_sql_engine
+
+# ------------------------------------------------------------
+# SQL 表格 schema 快取（clean_df_by_sql_schema 用）：
+#   - 第一次用到一張表：一個查詢讀 sys.columns（欄名 + 型別）+ sys.objects.modify_date，
+#     同時編好這張表的轉換計畫（ConversionPlan：哪些欄轉字串 / 數字 / 日期）
+#   - SCHEMA_CACHE_TTL 秒內直接用快取；過期後只查 modify_date，
+#     表格沒有 DDL（modify_date 沒變）就續用，有變才重讀欄位、重編計畫
+#   - 這個 repo 自己做的 DDL（upsert_batch 建表 / 加 RowHash、upload_to_sql replace）會呼叫 invalidate()
+#   - 表格不存在也快取（None），建表時一樣 invalidate
+# ------------------------------------------------------------
+
+SCHEMA_CACHE_TTL = float(os.getenv("SCHEMA_CACHE_TTL", 600))
+
+STRING_TYPES = ("varchar", "char", "text")
+NUMBER_TYPES = ("decimal", "numeric", "float", "int")
+DATE_TYPES = ("date",)
+
+
+def split_table(table_name: str) -> tuple[str, str]:
+    """'dbo.dim_Article' → ('dbo', 'dim_Article')；沒寫 schema 當 dbo。"""
+    parts = table_name.strip().split(".")
+    return (parts[0], parts[1]) if len(parts) == 2 else ("dbo", parts[0])
+
+
+class ConversionPlan:
+    """
+    依 SQL 型別把欄位分成三組，apply() 每組一次整批轉換（不是逐欄 fillna / astype / replace）：
+      字串 → 空值變 ""、轉 str（"nan" 也變 ""）
+      數字 → to_numeric(errors="coerce")，已經是數值的欄位跳過
+      日期 → 'YYYY-MM-DD' 字串（NaT → NaN），已經是 datetime 的欄位不再 parse
+    型別判斷跟以前 clean_df_by_sql_schema 逐欄的規則一樣（依序比對，先中先贏）。
+    """
+
+    def __init__(self, columns):
+        self.strings, self.numbers, self.dates = [], [], []
+        for name, type_name in columns:
+            t = type_name.lower()
+            if any(k in t for k in STRING_TYPES):
+                self.strings.append(name)
+            elif any(k in t for k in NUMBER_TYPES):
+                self.numbers.append(name)
+            elif any(k in t for k in DATE_TYPES):
+                self.dates.append(name)
+
+    @staticmethod
+    def _date_strings(col: pd.Series) -> pd.Series:
+        if not pd.api.types.is_datetime64_any_dtype(col):
+            col = pd.to_datetime(col, errors="coerce")
+        if getattr(col.dt, "tz", None) is not None:
+            col = col.dt.tz_localize(None)             # 跟 strftime 一樣用當地時間的日期
+        days = col.to_numpy(dtype="datetime64[D]")
+        out = days.astype(str).astype(object)       # numpy 直接格式化成 YYYY-MM-DD，不逐格 strftime
+        out[np.isnat(days)] = np.nan
+        return pd.Series(out, index=col.index, name=col.name, dtype="str")
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        parts = []
+        strings = [c for c in self.strings if c in df.columns]
+        if strings:
+            parts.append(df[strings].fillna("").astype(str).replace("nan", ""))
+        numbers = [c for c in self.numbers if c in df.columns and not pd.api.types.is_numeric_dtype(df[c])]
+        if numbers:
+            parts.append(df[numbers].apply(pd.to_numeric, errors="coerce"))
+        dates = [c for c in self.dates if c in df.columns]
+        if dates:
+            parts.append(pd.concat([self._date_strings(df[c]) for c in dates], axis=1))
+        if parts:
+            converted = pd.concat(parts, axis=1)
+            df[list(converted.columns)] = converted
+        return df
+
+
+class TableSchema(NamedTuple):
+    table: str
+    columns: tuple            # ((欄名, SQL 型別), ...)，依欄位順序
+    modify_date: object       # sys.objects.modify_date；有 DDL 就會變
+    plan: ConversionPlan
+
+
+class SchemaRegistry:
+    """table → TableSchema（或 None = 表不存在）的 TTL 快取；thread-safe，查詢在 lock 外面做。"""
+
+    def __init__(self, ttl: float = SCHEMA_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._cache = {}          # key → (TableSchema | None, checked_at)
+        self.stats = {"hits": 0, "loads": 0, "revalidated": 0}
+
+    @staticmethod
+    def _key(table_name: str) -> str:
+        schema, tbl = split_table(table_name)
+        return f"{schema}.{tbl}".lower()
+
+    def _query_columns(self, engine, table_name):
+        schema, tbl = split_table(table_name)
+        with engine.connect() as conn:
+            rows = conn.execute(text("""
+                SELECT c.name, t.name, o.modify_date
+                FROM sys.columns c
+                JOIN sys.types t ON t.user_type_id = c.user_type_id
+                JOIN sys.objects o ON o.object_id = c.object_id
+                WHERE c.object_id = OBJECT_ID(:t, 'U')
+                ORDER BY c.column_id
+            """), {"t": f"{schema}.{tbl}"}).all()
+        if not rows:
+            return None
+        columns = tuple((name, type_name) for name, type_name, _ in rows)
+        return TableSchema(f"{schema}.{tbl}", columns, rows[0][2], ConversionPlan(columns))
+
+    def _query_modify_date(self, engine, table_name):
+        schema, tbl = split_table(table_name)
+        with engine.connect() as conn:
+            return conn.execute(text("SELECT modify_date FROM sys.objects WHERE object_id = OBJECT_ID(:t, 'U')"),
+                                {"t": f"{schema}.{tbl}"}).scalar()
+
+    def get(self, table_name: str, engine=None) -> TableSchema | None:
+        key = self._key(table_name)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and now - entry[1] < self.ttl:
+                self.stats["hits"] += 1
+                return entry[0]
+
+        engine = engine or get_sql_engine()
+        cached = entry[0] if entry is not None else None
+        if cached is not None and self._query_modify_date(engine, table_name) == cached.modify_date:
+            schema, stat = cached, "revalidated"               # 過期了但沒有 DDL：續用
+        else:
+            schema, stat = self._query_columns(engine, table_name), "loads"
+        with self._lock:
+            self.stats[stat] += 1
+            self._cache[key] = (schema, time.monotonic())
+        return schema
+
+    def invalidate(self, table_name: str | None = None):
+        """DDL 之後呼叫；不給 table 就全部清掉。"""
+        with self._lock:
+            if table_name is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(self._key(table_name), None)
+
+
+SCHEMA_REGISTRY = SchemaRegistry()
+
+
+def get_table_schema(table_name: str, engine=None) -> TableSchema | None:
+    return SCHEMA_REGISTRY.get(table_name, engine)
+
+
+def invalidate_schema(table_name: str | None = None):
+    SCHEMA_REGISTRY.invalidate(table_name)
@@ -0,0 +1,178 @@
+from __future__ import annotations
+import atexit
+import os
+import threading
+import uuid
+from sqlalchemy import text
+from ETL_SAP.common.config import get_sql_engine
+
+# ------------------------------------------------------------
+# Staging 策略：upsert_batch 的暫存表放哪、什麼時候建 / 清 / 刪
+#   persistent → 固定 <table>_stg，第一次建立後保留，每批只 TRUNCATE
+#                （同一張正式表並行寫入時靠 TRUNCATE 的 Sch-M lock 排隊）
+#   temp       → #<table>_stg，綁在 pool 裡那條連線的 session 上；
+#                同一條連線重複使用，不同連線（不同 pipeline / thread）天生不會互撞
+#   run        → <table>_stg_<pid>_<token>_<n>，整個 run 重複使用，結束時統一刪除
+# 每個策略的介面一致：
+#   prepare(conn, target) -> 暫存表名（保證存在、是空的、欄位跟正式表一樣）
+#   finish(conn, stg)     → MERGE 之後
+#   reset(conn, target)   → 正式表欄位變了（例如加 RowHash），舊暫存表要丟掉重建
+# reset 只處理得到目前這條連線；pool 裡其他連線的 #temp 表、別的 process 還在用的暫存表
+# 由 prepare 每次比對欄位名稱，不一樣就重建。
+# ------------------------------------------------------------
+
+DEFAULT_STAGING = os.getenv("STAGING_MODE", "temp")
+
+
+def _create_or_truncate(conn, stg: str, target: str, object_id: str):
+    # #temp 表的欄位在 tempdb 的 catalog；欄名比對用 DATABASE_DEFAULT，避免跟 tempdb 的定序衝突
+    catalog = "tempdb.sys.columns" if object_id.startswith("tempdb..") else "sys.columns"
+    stg_cols = f"SELECT name COLLATE DATABASE_DEFAULT FROM {catalog} WHERE object_id = OBJECT_ID('{object_id}')"
+    tgt_cols = f"SELECT name COLLATE DATABASE_DEFAULT FROM sys.columns WHERE object_id = OBJECT_ID('{target}')"
+    conn.execute(text(f"""
+        IF OBJECT_ID('{object_id}','U') IS NOT NULL
+           AND (EXISTS ({tgt_cols} EXCEPT {stg_cols}) OR EXISTS ({stg_cols} EXCEPT {tgt_cols}))
+            DROP TABLE {stg};
+        IF OBJECT_ID('{object_id}','U') IS NULL
+            SELECT TOP 0 * INTO {stg} FROM {target};
+        ELSE
+            TRUNCATE TABLE {stg};
+    """))
+
+
+def _drop(conn, stg: str, object_id: str):
+    conn.execute(text(f"""
+        IF OBJECT_ID('{object_id}','U') IS NOT NULL
+            DROP TABLE {stg};
+    """))
+
+
+class PersistentStaging:
+    name = "persistent"
+
+    def __init__(self, stg_table: str | None = None):
+        self.stg_table = stg_table   # None → <table>_stg
+
+    def table_for(self, target: str) -> str:
+        return self.stg_table or f"{target}_stg"
+
+    def prepare(self, conn, target: str) -> str:
+        stg = self.table_for(target)
+        _create_or_truncate(conn, stg, target, stg)
+        return stg
+
+    def finish(self, conn, stg: str):
+        pass
+
+    def reset(self, conn, target: str):
+        stg = self.table_for(target)
+        _drop(conn, stg, stg)
+
+
+class TempStaging:
+    name = "temp"
+
+    def table_for(self, target: str) -> str:
+        return "#" + target.replace(".", "_") + "_stg"
+
+    def prepare(self, conn, target: str) -> str:
+        stg = self.table_for(target)
+        _create_or_truncate(conn, stg, target, f"tempdb..{stg}")
+        return stg
+
+    def finish(self, conn, stg: str):
+        pass    # 留在 session 裡給下一批用；連線關閉時 SQL Server 自動清掉
+
+    def reset(self, conn, target: str):
+        stg = self.table_for(target)
+        _drop(conn, stg, f"tempdb..{stg}")
+
+
+class RunStaging:
+    """整個 run 共用的暫存表；每個 (正式表, thread) 一張，run 結束時 drop_all() 統一刪除。"""
+    name = "run"
+
+    def __init__(self):
+        self.token = uuid.uuid4().hex[:8]
+        self._tables: dict[tuple[str, int], str] = {}
+        self._lock = threading.Lock()
+
+    def table_for(self, target: str) -> str:
+        key = (target, threading.get_ident())
+        with self._lock:
+            if key not in self._tables:
+                self._tables[key] = f"{target}_stg_{os.getpid()}_{self.token}_{len(self._tables)}"
+            return self._tables[key]
+
+    def prepare(self, conn, target: str) -> str:
+        stg = self.table_for(target)
+        _create_or_truncate(conn, stg, target, stg)
+        return stg
+
+    def finish(self, conn, stg: str):
+        pass
+
+    def reset(self, conn, target: str):
+        stg = self.table_for(target)
+        _drop(conn, stg, stg)
+
+    def drop_all(self):
+        with self._lock:
+            tables = list(self._tables.values())
+            self._tables.clear()
+        if not tables:
+            return
+        with get_sql_engine().begin() as conn:
+            for stg in tables:
+                _drop(conn, stg, stg)
+        print(f"🧹 已刪除本次 run 的 {len(tables)} 張暫存表")
+
+
+_RUN_STAGING: RunStaging | None = None
+_RUN_LOCK = threading.Lock()
+
+
+def _run_staging() -> RunStaging:
+    global _RUN_STAGING
+    with _RUN_LOCK:
+        if _RUN_STAGING is None:
+            _RUN_STAGING = RunStaging()
+        return _RUN_STAGING
+
+
+def drop_run_staging():
+    """刪除這個 process 用 run 策略建立的暫存表（run_all_template 結束時呼叫；也註冊在 atexit）。"""
+    global _RUN_STAGING
+    with _RUN_LOCK:
+        staging, _RUN_STAGING = _RUN_STAGING, None
+    if staging is None:
+        return
+    try:
+        staging.drop_all()
+    except Exception as e:
+        print(f"⚠️ 暫存表刪除失敗（下次可手動清除 *_stg_<pid>_* 表）：{e}")
+
+
+atexit.register(drop_run_staging)
+
+
+STAGING_STRATEGIES = ("persistent", "temp", "run")
+
+
+def get_staging(staging=None, stg_table: str | None = None):
+    """
+    staging 可以是策略名稱、策略物件或 None（→ env STAGING_MODE，預設 temp）。
+    有指定 stg_table 時一律用 persistent（沿用舊的呼叫方式）。
+    """
+    if stg_table:
+        return PersistentStaging(stg_table)
+    if staging is not None and not isinstance(staging, str):
+        return staging
+    name = staging or DEFAULT_STAGING
+    if name == "persistent":
+        return PersistentStaging()
+    if name == "temp":
+        return TempStaging()
+    if name == "run":
+        return _run_staging()
+    raise ValueError(f"Unknown staging strategy: {name}（可用：{', '.join(STAGING_STRATEGIES)}）")
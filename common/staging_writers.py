@@ -0,0 +1,144 @@
+from __future__ import annotations
+import os
+import pandas as pd
+from sqlalchemy import text, types
+from typing import Callable, Mapping
+
+from ETL_SAP.common.retry import is_connection_error
+
+# ------------------------------------------------------------
+# Staging writers：把 DataFrame 寫進暫存表的不同方式
+#   to_sql           → pandas 原本的寫法（逐列 INSERT），保留作為 fallback
+#   fast_executemany → pyodbc 陣列綁定，一次送整批參數
+#   multi            → 多列 VALUES (...), (...) 的 set-based INSERT
+# 每個 writer 的簽名一致：writer(df, table, conn, column_types, chunksize) -> 寫入筆數
+# ------------------------------------------------------------
+
+DEFAULT_WRITER = os.getenv("STAGING_WRITER", "fast_executemany")
+MSSQL_MAX_PARAMS = 2100   # SQL Server 單一語句參數上限
+
+
+def split_table_name(table: str) -> tuple[str | None, str]:
+    """'dbo.ZMB51_stg' → ('dbo', 'ZMB51_stg')；沒有 schema 就回傳 None。"""
+    parts = table.split(".")
+    if len(parts) == 2:
+        return parts[0], parts[1]
+    return None, parts[-1]
+
+
+def _quoted(table: str) -> str:
+    schema, name = split_table_name(table)
+    return f"[{schema}].[{name}]" if schema else f"[{name}]"
+
+
+def _python_rows(df: pd.DataFrame, column_types=None) -> list[tuple]:
+    """轉成 DBAPI 吃得下的 tuple：NaN/NaT → None，numpy/pandas 型別 → Python 原生型別。"""
+    column_types = column_types or {}
+    obj = df.astype(object)
+    for col in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            sql_type = column_types.get(col)
+            sql_type = sql_type if isinstance(sql_type, type) else type(sql_type)
+            as_date = issubclass(sql_type, types.Date)     # Date 欄只送日期
+            obj[col] = list(df[col].dt.date if as_date else df[col].dt.to_pydatetime())
+    obj = obj.where(df.notna(), None)
+    return list(obj.itertuples(index=False, name=None))
+
+
+def write_to_sql(df, table, conn, column_types=None, chunksize: int = 200) -> int:
+    schema, name = split_table_name(table)
+    df.to_sql(name,
+              schema=schema,
+              con=conn,
+              index=False,
+              if_exists="append",
+              dtype=column_types,
+              method=None,
+              chunksize=chunksize)
+    return len(df)
+
+
+def write_fast_executemany(df, table, conn, column_types=None, chunksize: int = 50_000) -> int:
+    """
+    直接拿 pyodbc cursor 做 executemany，並開啟 fast_executemany（陣列綁定，
+    整批參數一次送到 SQL Server）。非 pyodbc 的連線（例如 SQLite）一樣能跑，
+    只是退回一般 executemany。
+    """
+    if df.empty:
+        return 0
+
+    cols = ", ".join(f"[{c}]" for c in df.columns)
+    marks = ", ".join("?" for _ in df.columns)
+    insert_sql = f"INSERT INTO {_quoted(table)} ({cols}) VALUES ({marks})"
+
+    cursor = conn.connection.cursor()     # SQLAlchemy Connection → DBAPI connection
+    try:
+        try:
+            cursor.fast_executemany = True
+        except AttributeError:
+            pass                          # 不是 pyodbc
+        for start in range(0, len(df), chunksize):
+            cursor.executemany(insert_sql, _python_rows(df.iloc[start:start + chunksize], column_types))
+    finally:
+        cursor.close()
+    return len(df)
+
+
+def write_multi_values(df, table, conn, column_types=None, chunksize: int | None = None) -> int:
+    """多列 VALUES 的 INSERT；每批筆數依欄位數換算，避免超過 2100 個參數。"""
+    schema, name = split_table_name(table)
+    rows_per_stmt = max(1, (MSSQL_MAX_PARAMS - 1) // max(1, len(df.columns)))
+    df.to_sql(name,
+              schema=schema,
+              con=conn,
+              index=False,
+              if_exists="append",
+              dtype=column_types,
+              method="multi",
+              chunksize=min(chunksize or rows_per_stmt, rows_per_stmt))
+    return len(df)
+
+
+STAGING_WRITERS: dict[str, Callable] = {
+    "to_sql": write_to_sql,
+    "fast_executemany": write_fast_executemany,
+    "multi": write_multi_values,
+}
+
+
+def get_staging_writer(name: str | None = None) -> Callable:
+    name = name or DEFAULT_WRITER
+    try:
+        return STAGING_WRITERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown staging writer: {name}（可用：{', '.join(STAGING_WRITERS)}）")
+
+
+def write_staging(
+    df: pd.DataFrame,
+    table: str,
+    conn,
+    column_types: Mapping[str, object] | None = None,
+    writer: str | None = None,
+    chunksize: int | None = None,
+) -> int:
+    """
+    依 writer 名稱寫入暫存表；快速寫法失敗（資料 / driver 錯誤）時清空暫存表並退回 to_sql。
+    連線類錯誤（SQLAlchemy OperationalError、fast_executemany 直接丟的 pyodbc 斷線 / 逾時 / deadlock）
+    直接往外丟，交給 upsert_batch 的重試處理；不在已經斷掉的連線上 DELETE + to_sql。
+    """
+    name = writer or DEFAULT_WRITER
+    write = get_staging_writer(name)
+    kwargs = {"chunksize": chunksize} if chunksize else {}
+
+    if write is write_to_sql:
+        return write(df, table, conn, column_types, **kwargs)
+
+    try:
+        return write(df, table, conn, column_types, **kwargs)
+    except Exception as e:
+        if is_connection_error(e):
+            raise
+        print(f"⚠️ staging writer `{name}` 失敗，改用 to_sql：{e}")
+        conn.execute(text(f"DELETE FROM {_quoted(table)}"))
+        return write_to_sql(df, table, conn, column_types)
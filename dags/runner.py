@@ -0,0 +1,292 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+from typing import Callable, NamedTuple, Sequence
+
+from ETL_SAP.common.retry import DEFAULT_POLICY, call_with_retry
+from ETL_SAP.common.instrument import record
+
+# ------------------------------------------------------------
+# 小型 DAG runner（取代 run_all_template 裡「註解掉就不跑」的寫法）：
+#   - 每個 Task 宣告 deps；沒有相依的分支同時跑，最多 max_workers 個 thread
+#   - pool：同一個 pool 的 task 同時最多 pools[pool] 個（SAP GUI 只有一個登入 → "sap": 1）；
+#     task 可以在執行中呼叫 release_pool() 提早歸還 slot（例如下載完了、剩下的 ETL 不用 SAP）
+#   - 上游失敗 → 下游標 upstream_failed，不相干的分支照跑
+#   - 每個 task 的狀態 / 秒數 / 錯誤寫到 logs/dags/<dag>_state.json（每次狀態改變就寫）
+#   - 部分重跑：only=[...]（可加 downstream=True），或 resume=True 跳過上次已成功的 task
+# ------------------------------------------------------------
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # 等於 ETL_SAP/
+DAG_STATE_DIR = os.getenv("DAG_STATE_DIR", os.path.join(BASE_DIR, "logs", "dags"))
+DAG_MAX_WORKERS = int(os.getenv("DAG_MAX_WORKERS", 3))
+
+_current = threading.local()     # 目前這個 worker thread 在跑的 task（release_pool 用）
+
+PENDING, RUNNING, SUCCESS, FAILED, UPSTREAM_FAILED, SKIPPED = (
+    "pending", "running", "success", "failed", "upstream_failed", "skipped")
+
+
+def release_pool():
+    """
+    在 task 裡呼叫：提早歸還這個 task 佔的 pool slot，同一個 pool 的下一個 task 可以開始，
+    這個 task 自己繼續跑完（例如 SAP 下載結束後，ETL 的尾巴跟下一個 tcode 的下載重疊）。
+    不是在 DAG task 裡（例如 run_all_template 直接呼叫）就什麼都不做。
+    """
+    release = getattr(_current, "release", None)
+    if release is not None:
+        release()
+
+
+class Task(NamedTuple):
+    """
+    fn(*args, **kwargs) 用 common/retry 的 call_with_retry 包（最多 retries 次，fatal 錯誤不重試）。
+    ok(result) 決定算不算成功；預設丟例外（重試放棄）或回傳 False 才算失敗，
+    downloader 這種「回傳 True 才是全部完成」的用 ok=bool。
+    enabled=False：預設不跑，only=[name] 指定時才跑（等於以前註解掉的 pipeline）。
+    """
+    name: str
+    fn: Callable
+    args: tuple = ()
+    kwargs: dict = {}
+    deps: tuple = ()
+    pool: str | None = None
+    retries: int = 3
+    ok: Callable | None = None
+    enabled: bool = True
+
+
+class DAG:
+    def __init__(self, name: str, tasks: Sequence[Task], pools: dict | None = None,
+                 max_workers: int | None = None, state_path: str | None = None):
+        self.name = name
+        self.tasks = {t.name: t for t in tasks}
+        if len(self.tasks) != len(tasks):
+            raise ValueError(f"DAG {name} 有重複的 task 名稱")
+        self.pools = {"sap": 1, **(pools or {})}
+        self.max_workers = max_workers or DAG_MAX_WORKERS
+        self.state_path = state_path or os.path.join(DAG_STATE_DIR, f"{name}_state.json")
+        self.order = self._toposort()
+        self._lock = threading.Lock()
+        self.state = {}
+        self._released = set()           # 已經 release_pool() 的 task（結束時不用再還 slot）
+        self._wake = Future()            # release_pool() 時完成 → 排程迴圈醒來
+
+    # ---------- 結構 ----------
+    def _toposort(self) -> list[str]:
+        for t in self.tasks.values():
+            missing = [d for d in t.deps if d not in self.tasks]
+            if missing:
+                raise ValueError(f"task {t.name} 的相依 {missing} 不存在")
+        order, visiting, done = [], set(), set()
+
+        def visit(name, path):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"DAG {self.name} 有循環相依：{' → '.join(path + [name])}")
+            visiting.add(name)
+            for d in self.tasks[name].deps:
+                visit(d, path + [name])
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+
+        for name in self.tasks:
+            visit(name, [])
+        return order
+
+    def downstream(self, names) -> set[str]:
+        out = set(names)
+        for name in self.order:                  # 拓撲順序：上游一定先被加進來
+            if any(d in out for d in self.tasks[name].deps):
+                out.add(name)
+        return out
+
+    def select(self, only=None, downstream=False, resume=False) -> list[str]:
+        """這次要跑的 task（拓撲順序）。"""
+        if only:
+            unknown = [n for n in only if n not in self.tasks]
+            if unknown:
+                raise ValueError(f"找不到 task：{unknown}（可用：{', '.join(self.order)}）")
+            chosen = self.downstream(only) if downstream else set(only)
+        else:
+            chosen = {n for n, t in self.tasks.items() if t.enabled}
+        if resume:
+            last = self.load_state().get("tasks", {})
+            chosen = {n for n in chosen if last.get(n, {}).get("status") != SUCCESS}
+        return [n for n in self.order if n in chosen]
+
+    # ---------- 狀態 ----------
+    def load_state(self) -> dict:
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_state(self):
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        tmp = f"{self.state_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2, default=str)
+        os.replace(tmp, self.state_path)         # 寫到一半中斷也不會留下壞掉的 JSON
+
+    def _set(self, name, **fields):
+        with self._lock:
+            self.state["tasks"][name].update(fields)
+            self._save_state()
+
+    # ---------- 執行 ----------
+    def _release(self, task: Task):
+        if not task.pool:
+            return
+        with self._lock:
+            if task.name in self._released:
+                return
+            self._released.add(task.name)
+            if not self._wake.done():
+                self._wake.set_result(None)
+        print(f"🔓 [{self.name}] {task.name} 歸還 pool {task.pool}")
+
+    def _execute(self, task: Task):
+        _current.release = lambda: self._release(task)
+        try:
+            return self._execute_task(task)
+        finally:
+            _current.release = None
+
+    def _execute_task(self, task: Task):
+        self._set(task.name, status=RUNNING, started=datetime.now().isoformat(timespec="seconds"))
+        print(f"▶️ [{self.name}] {task.name} 開始")
+        t0 = time.perf_counter()
+        error = None
+        try:
+            result = call_with_retry(task.fn, task.args, task.kwargs, name=f"{self.name}.{task.name}",
+                                     policy=DEFAULT_POLICY._replace(max_attempts=task.retries))
+            ok = task.ok(result) if task.ok else result is not False
+        except Exception as e:                   # 重試放棄、ok() 本身出錯都算失敗；錯誤原因寫進 state
+            result, ok, error = None, False, e
+        seconds = time.perf_counter() - t0
+        status = SUCCESS if ok else FAILED
+        record("task", seconds, ok=ok, dag=self.name, task=task.name)
+        self._set(task.name, status=status, seconds=round(seconds, 1),
+                  finished=datetime.now().isoformat(timespec="seconds"),
+                  error=None if ok else (f"{type(error).__name__}: {error}" if error else str(result)))
+        print(f"{'✅' if ok else '❌'} [{self.name}] {task.name} {status}（{seconds:.1f}s）")
+        return result
+
+    def run(self, only=None, downstream=False, resume=False) -> dict:
+        """
+        跑選到的 task；回傳 {"run_id", "seconds", "tasks": {name: 狀態}, "results": {name: 回傳值}}。
+        沒被選到的上游（only / resume 排除的）視為已滿足。
+        """
+        selected = self.select(only, downstream, resume)
+        previous = self.load_state().get("tasks", {})
+        run_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        self.state = {
+            "dag": self.name,
+            "run_id": run_id,
+            "selected": selected,
+            # 這次沒跑的 task 保留上一次的紀錄（--resume 才知道它之前成功過）
+            "tasks": {n: previous.get(n, {"status": SKIPPED}) for n in self.order},
+        }
+        for n in selected:
+            self.state["tasks"][n] = {"status": PENDING, "run_id": run_id}
+        self._save_state()
+
+        print(f"🧭 DAG {self.name}（run {run_id}）：{', '.join(selected) or '沒有要跑的 task'}")
+        t0 = time.perf_counter()
+        waiting = list(selected)
+        status = {n: PENDING for n in selected}
+        results = {}
+        pool_used = {p: 0 for p in self.pools}
+        pool_held = set()                # 還佔著 pool slot 的 task
+        running = {}
+        self._released = set()
+        self._wake = Future()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"dag-{self.name}") as ex:
+            while waiting or running:
+                for name in list(waiting):
+                    task = self.tasks[name]
+                    deps = [status.get(d, SUCCESS) for d in task.deps]   # 沒選到的上游視為成功
+                    if any(s in (FAILED, UPSTREAM_FAILED) for s in deps):
+                        waiting.remove(name)
+                        status[name] = UPSTREAM_FAILED
+                        self._set(name, status=UPSTREAM_FAILED)
+                        print(f"⏭️ [{self.name}] {name} 略過：上游失敗")
+                        continue
+                    if any(s != SUCCESS for s in deps) or len(running) >= self.max_workers:
+                        continue
+                    if task.pool and pool_used.get(task.pool, 0) >= self.pools.get(task.pool, 1):
+                        continue
+                    waiting.remove(name)
+                    status[name] = RUNNING
+                    if task.pool:
+                        pool_used[task.pool] = pool_used.get(task.pool, 0) + 1
+                        pool_held.add(name)
+                    running[ex.submit(self._execute, task)] = name
+
+                if not running:
+                    continue                     # 剛剛只標了 upstream_failed，再掃一次
+                done, _ = wait([*running, self._wake], return_when=FIRST_COMPLETED)
+                with self._lock:
+                    if self._wake.done():
+                        self._wake = Future()
+                    released = self._released & pool_held
+                for name in released | {running[fut] for fut in done if fut in running}:
+                    if name in pool_held:
+                        pool_held.discard(name)
+                        pool_used[self.tasks[name].pool] -= 1
+                for fut in done:
+                    if fut not in running:       # _wake
+                        continue
+                    name = running.pop(fut)
+                    results[name] = fut.result()
+                    status[name] = self.state["tasks"][name]["status"]
+
+        seconds = time.perf_counter() - t0
+        self.state["seconds"] = round(seconds, 1)
+        with self._lock:
+            self._save_state()
+        self.report()
+        return {"run_id": run_id, "seconds": seconds, "tasks": status, "results": results}
+
+    def report(self):
+        print(f"\n⏱️ DAG {self.name}（run {self.state.get('run_id')}）：")
+        print(f"   {'task':<16}{'status':<17}{'seconds':>9}")
+        for name in self.order:
+            t = self.state["tasks"][name]
+            if t.get("run_id") == self.state.get("run_id"):
+                status, seconds = t["status"], f"{t['seconds']:.1f}" if t.get("seconds") is not None else "-"
+            else:
+                status, seconds = SKIPPED, "-"          # 這次沒跑（上一次的狀態還留在 state 檔）
+            print(f"   {name:<16}{status:<17}{seconds:>9}")
+        print(f"   {'total':<16}{'':<17}{self.state.get('seconds', 0):>9.1f}")
+
+
+def main(dag: DAG, argv=None) -> dict:
+    """共用 CLI：python -m ETL_SAP.dags.sales_dag [--only a b] [--downstream] [--resume] [--list]"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description=f"DAG {dag.name}")
+    parser.add_argument("--only", nargs="+", metavar="TASK", help="只跑這些 task（上游視為已完成）")
+    parser.add_argument("--downstream", action="store_true", help="--only 的 task 再加上所有下游")
+    parser.add_argument("--resume", action="store_true", help="跳過上一次已經成功的 task")
+    parser.add_argument("--workers", type=int, help=f"同時執行的 task 上限（預設 DAG_MAX_WORKERS={DAG_MAX_WORKERS}）")
+    parser.add_argument("--list", action="store_true", help="列出 task、相依和上一次的狀態")
+    args = parser.parse_args(argv)
+
+    if args.workers:
+        dag.max_workers = args.workers
+    if args.list:
+        last = dag.load_state().get("tasks", {})
+        for name in dag.order:
+            t = dag.tasks[name]
+            flag = "" if t.enabled else "（預設不跑）"
+            print(f"{name:<16} deps={list(t.deps)} pool={t.pool} last={last.get(name, {}).get('status', '-')}{flag}")
+        return {}
+    return dag.run(only=args.only, downstream=args.downstream, resume=args.resume)
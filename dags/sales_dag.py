@@ -0,0 +1,100 @@
+import os
+import pandas as pd
+from dotenv import load_dotenv
+
+from ETL_SAP.dags.runner import DAG, Task, main, release_pool
+from ETL_SAP.pipelines.pipelined_runner import run_pipelined, print_timing
+from ETL_SAP.pipelines.etl_utils import get_acctwk
+from ETL_SAP.sap_scripts.downloader_zmb51 import download_zmb51
+from ETL_SAP.pipelines.etl_zmb51 import run_etl_zmb51
+from ETL_SAP.sap_scripts.downloader_zstpromo import download_zstpromo
+from ETL_SAP.pipelines.etl_zstpromo import run_etl_zstpromo
+from ETL_SAP.sap_scripts.downloader_zrssale import download_zrssale
+from ETL_SAP.pipelines.etl_zrssale import run_etl_zrssale_D2, run_etl_zrssale_D3
+from ETL_SAP.pipelines.etl_weekly_sales import run_etl_weekly_sales
+from ETL_SAP.common.config import dispose_sql_engines
+from ETL_SAP.common.staging import drop_run_staging
+from ETL_SAP.common.retry import print_retry_report
+from ETL_SAP.common.instrument import print_run_summary
+
+load_dotenv()
+
+# ------------------------------------------------------------
+# Sales DAG：
+#   zmb51 ─┐
+#          ├─→ weekly_sales（預設不跑：--only zmb51 zstpromo weekly_sales 或 --downstream）
+#   zstpromo ┘
+#   zrssale（獨立，預設不跑：--only zrssale）
+# 每個 task 都是「下載 + ETL 重疊」（pipelined_runner），task 開始時佔 "sap" pool，
+# 下載一結束就 release_pool() 歸還，所以 SAP 一次只跑一個 downloader，
+# 但前一個 tcode 的 ETL 尾巴可以跟下一個 tcode 的下載同時進行。
+#
+#   python -m ETL_SAP.dags.sales_dag                      # 全部（enabled 的 task）
+#   python -m ETL_SAP.dags.sales_dag --resume             # 只重跑上次沒成功的
+#   python -m ETL_SAP.dags.sales_dag --only zmb51 --downstream
+# ------------------------------------------------------------
+
+
+def pipelined_ok(summary) -> bool:
+    """run_pipelined 的結果：下載全部完成、而且每個 ETL 都沒有失敗。"""
+    return bool(summary) and summary["download_ok"] and all(e["error"] is None for e in summary["etl"].values())
+
+
+def sales_zmb51():
+    folder = os.getenv("EXPORT_DIR_ZMB51")
+    return run_pipelined("ZMB51", download_zmb51, (os.getenv("DATE_FILE_ZMB51"), folder),
+                         [("ZMB51", run_etl_zmb51, folder, "ZMB51_*.txt")],
+                         on_download_done=release_pool)
+
+
+def sales_zstpromo():
+    folder = os.getenv("EXPORT_DIR_ZSTPROMO")
+    return run_pipelined("ZSTPROMO", download_zstpromo, (os.getenv("DATE_FILE_ZSTPROMO"), folder),
+                         [("ZSTPROMO", run_etl_zstpromo, folder, "ZSTPROMO_*.txt")],
+                         on_download_done=release_pool)
+
+
+def sales_zrssale():
+    folder = os.getenv("EXPORT_DIR_ZRSSALE")
+    return run_pipelined("ZRSSALE", download_zrssale, (os.getenv("DATE_FILE_WALONG_SALES"), folder),
+                         [("ZRSSALE_D2", run_etl_zrssale_D2, folder, "ZRSSALE_D2*.txt"),
+                          ("ZRSSALE_D3", run_etl_zrssale_D3, folder, "ZRSSALE_D3*.txt")],
+                         on_download_done=release_pool)
+
+
+def weekly_sales_downloaded_weeks():
+    """重算 DATE_FILE_ZMB51 / DATE_FILE_ZSTPROMO 涵蓋的 AcctWk（也就是這次下載的日期區間）。"""
+    starts, ends = [], []
+    for env in ("DATE_FILE_ZMB51", "DATE_FILE_ZSTPROMO"):
+        df = pd.read_excel(os.getenv(env), engine='openpyxl')
+        starts.append(pd.to_datetime(df['Start'], errors='coerce').min())
+        ends.append(pd.to_datetime(df['End'], errors='coerce').max())
+    start, end = min(starts), max(ends)
+    if pd.isna(start) or pd.isna(end):
+        print("⚠️ 日期檔沒有 Start / End，略過 weekly_sales")
+        return None
+    return run_etl_weekly_sales(get_acctwk(start.date()), get_acctwk(end.date()))
+
+
+def print_sales_timing(result: dict):
+    """DAG 跑完之後，把各 task 的 run_pipelined 結果整理成端到端耗時表。"""
+    print_timing([r for r in result.get("results", {}).values() if isinstance(r, dict) and "download_s" in r], "Sales")
+
+
+def build_sales_dag(max_workers=None) -> DAG:
+    return DAG("sales", [
+        Task("zmb51", sales_zmb51, pool="sap", retries=1, ok=pipelined_ok),
+        Task("zstpromo", sales_zstpromo, pool="sap", retries=1, ok=pipelined_ok),
+        Task("weekly_sales", weekly_sales_downloaded_weeks, deps=("zmb51", "zstpromo"), enabled=False),
+        Task("zrssale", sales_zrssale, pool="sap", retries=1, ok=pipelined_ok, enabled=False),
+    ], max_workers=max_workers)
+
+
+if __name__ == "__main__":
+    try:
+        print_sales_timing(main(build_sales_dag()))
+    finally:
+        print_retry_report()
+        print_run_summary()
+        drop_run_staging()      # STAGING_MODE=run 時，刪掉本次 run 建的暫存表
+        dispose_sql_engines()
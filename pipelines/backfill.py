@@ -0,0 +1,206 @@
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date
+from pathlib import Path
+from typing import Callable, NamedTuple
+
+from dotenv import load_dotenv
+
+from ETL_SAP.common import instrument
+from ETL_SAP.common.config import dispose_sql_engines
+from ETL_SAP.common.instrument import print_run_summary
+from ETL_SAP.common.loader import set_sql_concurrency
+from ETL_SAP.common.retry import print_retry_report
+from ETL_SAP.common.staging import drop_run_staging
+from ETL_SAP.pipelines.etl_zmb51 import run_etl_zmb51
+from ETL_SAP.pipelines.etl_zstpromo import run_etl_zstpromo
+from ETL_SAP.pipelines.etl_zrssale import run_etl_zrssale_D2, run_etl_zrssale_D3
+from ETL_SAP.pipelines.landing_zone import landed_files
+
+load_dotenv()
+
+# ------------------------------------------------------------
+# Backfill：不碰 SAP，直接把已經封存的匯出檔重新 clean + upsert 一遍
+# （例如修好 schema / 清洗邏輯之後，重灌某一段日期）。
+#   source="processed" → <EXPORT_DIR>/processed/ 裡的 .txt（預設）
+#   source="landing"   → landing zone 的 Parquet / Feather（pipelines/landing_zone.py）
+# 依檔名裡的日期區間（_MMDDYYYY_MMDDYYYY）挑出跟 [start, end] 重疊的檔案；
+# 同一個區間被搬進 processed 好幾次（move_to_processed 加了時間戳）只取最新的一份。
+# 檔案不會被搬動，upsert 是 MERGE，重跑同一段不會重複。
+#
+# 平行度：
+#   --parallel        同時跑幾個 ETL（ZMB51 / ZSTPROMO / ZRSSALE_D2 / D3 各一個 thread）
+#   --parse-workers   每個 ETL 的 parse process 數
+#   --load-workers    每個 ETL 的 loader thread 數
+#   --sql-concurrency 整個 process 同時進行的 SQL 寫入上限（common/loader.set_sql_concurrency）
+#
+#   python -m ETL_SAP.pipelines.backfill --start 2025-01-01 --end 2025-03-31
+#   python -m ETL_SAP.pipelines.backfill --start 2025-01-01 --end 2025-03-31 --etl ZMB51 --source landing --dry-run
+# ------------------------------------------------------------
+
+BACKFILL_PARALLEL = int(os.getenv("BACKFILL_PARALLEL", 2))
+BACKFILL_SQL_CONCURRENCY = int(os.getenv("BACKFILL_SQL_CONCURRENCY", 4))
+
+
+class BackfillTarget(NamedTuple):
+    """tcode：landing zone 的 tcode；pattern：檔名 glob（不含副檔名）；folder_env：匯出資料夾的 env。"""
+    tcode: str
+    pattern: str
+    folder_env: str
+    run_etl: Callable
+
+
+BACKFILL_TARGETS = {
+    "ZMB51": BackfillTarget("ZMB51", "ZMB51_*", "EXPORT_DIR_ZMB51", run_etl_zmb51),
+    "ZSTPROMO": BackfillTarget("ZSTPROMO", "ZSTPROMO_*", "EXPORT_DIR_ZSTPROMO", run_etl_zstpromo),
+    "ZRSSALE_D2": BackfillTarget("ZRSSALE", "ZRSSALE_D2*", "EXPORT_DIR_ZRSSALE", run_etl_zrssale_D2),
+    "ZRSSALE_D3": BackfillTarget("ZRSSALE", "ZRSSALE_D3*", "EXPORT_DIR_ZRSSALE", run_etl_zrssale_D3),
+}
+
+_RANGE_RE = re.compile(r"_(\d{8})_(\d{8})")
+_COPY_SUFFIX_RE = re.compile(r"_\d{14}$")      # move_to_processed 同名時加的 _YYYYmmddHHMMSS
+
+
+def file_range(fp) -> tuple[date, date] | None:
+    """檔名裡的 _MMDDYYYY_MMDDYYYY → (start, end)；格式不對回傳 None。"""
+    m = _RANGE_RE.search(Path(fp).stem)
+    if not m:
+        return None
+    try:
+        return tuple(datetime.strptime(s, "%m%d%Y").date() for s in m.groups())
+    except ValueError:
+        return None
+
+
+def select_files(name: str, start, end, source: str = "processed", folder=None) -> list[Path]:
+    """日期區間跟 [start, end] 重疊的封存檔（依區間起日排序）；同一個檔名只留最新的一份。"""
+    target = BACKFILL_TARGETS[name]
+    start, end = _as_date(start), _as_date(end)
+    if source == "landing":
+        # 分區日期 = 檔案最早的日期，超過 end 的分區不可能重疊
+        candidates = landed_files(target.tcode, target.pattern, end=end)
+    elif source == "processed":
+        folder = folder or os.getenv(target.folder_env)
+        if not folder:
+            raise ValueError(f"{name}：沒有設定 {target.folder_env}")
+        candidates = Path(folder, "processed").glob(f"{target.pattern}.txt")
+    else:
+        raise ValueError(f"Unknown backfill source: {source}（可用：processed / landing）")
+
+    latest = {}
+    for fp in candidates:
+        rng = file_range(fp)
+        if rng is None:
+            print(f"⚠️ {name}：檔名看不出日期區間，略過 {Path(fp).name}")
+            continue
+        if rng[1] < start or rng[0] > end:
+            continue
+        key = _COPY_SUFFIX_RE.sub("", Path(fp).stem)
+        if key not in latest or fp.stat().st_mtime > latest[key][1].stat().st_mtime:
+            latest[key] = (rng, fp)
+    return [fp for rng, fp in sorted(latest.values(), key=lambda v: (v[0], v[1].name))]
+
+
+def _as_date(value) -> date:
+    return value if isinstance(value, date) else datetime.strptime(str(value), "%Y-%m-%d").date()
+
+
+def _run_one(name, files, source, parse_workers, load_workers) -> dict:
+    target = BACKFILL_TARGETS[name]
+    nbytes = sum(os.path.getsize(fp) for fp in files)
+    t0 = time.perf_counter()
+    try:
+        summary = target.run_etl(os.getenv(target.folder_env), parse_workers=parse_workers,
+                                 load_workers=load_workers, files=files, source=source)
+        error = None
+    except Exception as e:
+        summary, error = None, e
+        print(f"❌ backfill {name} 失敗：{type(e).__name__}: {e}")
+    summary = summary or {}
+    return {"name": name, "files": len(files), "loaded": summary.get("loaded", 0),
+            "rows": summary.get("rows", 0), "bytes": nbytes,
+            "seconds": time.perf_counter() - t0, "error": error}
+
+
+def backfill(start, end, names=None, source: str = "processed", parallel: int | None = None,
+             parse_workers: int | None = None, load_workers: int | None = None,
+             sql_concurrency: int | None = None, dry_run: bool = False) -> dict:
+    """
+    回傳 {"results": {name: {files, loaded, rows, bytes, seconds, error}}, "seconds", "rows", "ok"}。
+    一個 ETL 失敗不影響其他的（沒跑完的檔案再跑一次 backfill 就好，MERGE 可以重做）。
+    """
+    names = list(names or BACKFILL_TARGETS)
+    selected = {name: select_files(name, start, end, source) for name in names}
+    print(f"🔁 backfill {start} ~ {end}（source={source}）：")
+    for name, files in selected.items():
+        span = f"{file_range(files[0])[0]} ~ {file_range(files[-1])[1]}" if files else "-"
+        print(f"   {name:<12}{len(files):>5} 個檔案  {span}")
+    if dry_run:
+        return {"results": {}, "seconds": 0.0, "rows": 0, "ok": True}
+
+    set_sql_concurrency(sql_concurrency if sql_concurrency is not None else BACKFILL_SQL_CONCURRENCY)
+    todo = [name for name in names if selected[name]]
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(parallel or BACKFILL_PARALLEL, len(todo) or 1)),
+                            thread_name_prefix="backfill") as pool:
+        futures = {name: pool.submit(_run_one, name, selected[name], source, parse_workers, load_workers)
+                   for name in todo}
+        results = {name: fut.result() for name, fut in futures.items()}
+    seconds = time.perf_counter() - t0
+    rows = sum(r["rows"] for r in results.values())
+    return {"results": results, "seconds": seconds, "rows": rows,
+            "ok": all(r["error"] is None for r in results.values())}
+
+
+def print_backfill_report(summary: dict):
+    """每個 ETL 一行：檔案數、列數、MB、秒數、rows/s；最後一行是整體（wall clock）。"""
+    results = summary["results"]
+    if not results:
+        return
+    print("\n📈 backfill 吞吐量：")
+    print(f"   {'etl':<12}{'files':>7}{'rows':>13}{'MB':>9}{'sec':>9}{'rows/s':>11}{'MB/s':>8}  status")
+    for r in results.values():
+        rate = r["rows"] / r["seconds"] if r["seconds"] else 0
+        mbps = r["bytes"] / 1e6 / r["seconds"] if r["seconds"] else 0
+        status = "✅" if r["error"] is None else f"❌ {type(r['error']).__name__}"
+        print(f"   {r['name']:<12}{r['loaded']:>3}/{r['files']:<3}{r['rows']:>13,}{r['bytes'] / 1e6:>9.1f}"
+              f"{r['seconds']:>9.1f}{rate:>11,.0f}{mbps:>8.1f}  {status}")
+    total_mb = sum(r["bytes"] for r in results.values()) / 1e6
+    seconds = summary["seconds"]
+    print(f"   {'total':<12}{'':>7}{summary['rows']:>13,}{total_mb:>9.1f}{seconds:>9.1f}"
+          f"{summary['rows'] / seconds if seconds else 0:>11,.0f}{total_mb / seconds if seconds else 0:>8.1f}")
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="不碰 SAP，從 processed/ 或 landing zone 重灌一段日期")
+    parser.add_argument("--start", required=True, help="YYYY-MM-DD")
+    parser.add_argument("--end", required=True, help="YYYY-MM-DD（含）")
+    parser.add_argument("--etl", nargs="+", choices=list(BACKFILL_TARGETS), default=list(BACKFILL_TARGETS))
+    parser.add_argument("--source", choices=("processed", "landing"), default="processed")
+    parser.add_argument("--parallel", type=int, help=f"同時跑幾個 ETL（預設 {BACKFILL_PARALLEL}）")
+    parser.add_argument("--parse-workers", type=int)
+    parser.add_argument("--load-workers", type=int)
+    parser.add_argument("--sql-concurrency", type=int,
+                        help=f"同時進行的 SQL 寫入上限（預設 {BACKFILL_SQL_CONCURRENCY}，0 = 不限制）")
+    parser.add_argument("--dry-run", action="store_true", help="只列出會處理的檔案")
+    args = parser.parse_args()
+
+    instrument.start_run(f"backfill {args.start}~{args.end}")
+    summary = {"ok": False}
+    try:
+        summary = backfill(args.start, args.end, args.etl, source=args.source, parallel=args.parallel,
+                           parse_workers=args.parse_workers, load_workers=args.load_workers,
+                           sql_concurrency=args.sql_concurrency, dry_run=args.dry_run)
+        print_backfill_report(summary)
+    finally:
+        if not args.dry_run:
+            print_retry_report()
+            print_run_summary()
+            drop_run_staging()
+            dispose_sql_engines()
+    sys.exit(0 if summary["ok"] else 1)
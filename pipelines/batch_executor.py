@@ -0,0 +1,173 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterable
+
+from ETL_SAP.pipelines.etl_utils import move_to_processed
+from ETL_SAP.common.instrument import stage, count_rows
+
+# ------------------------------------------------------------
+# 多檔案 ETL 執行器：
+#   parse（讀檔 + 清洗，吃 CPU）→ process pool
+#   load （upsert，等網路 / SQL）→ loader threads
+# 中間用有上限的 queue 串起來：loader 跟不上時 parse 會自動停下來等，
+# 記憶體裡最多只有 parse_workers + queue_size 份解析結果。
+# 每個檔案在自己的 upsert commit 成功之後才會搬到 processed/。
+# ------------------------------------------------------------
+
+_DONE = object()
+
+
+def _env_int(name, default):
+    return int(os.getenv(name, default))
+
+
+def _timed_parse(parse_fn, label, fp):
+    """parse_fn 外面包一層 "parse" stage（模組層級，才能送進 process pool；子程序寫同一個 run 檔）。"""
+    with stage("parse", etl=label, file=Path(fp).name) as s:
+        result = parse_fn(fp)
+        s.rows = count_rows(result)
+    return result
+
+
+def run_file_batches(
+    files: Iterable[Path],
+    parse_fn: Callable,
+    load_fn: Callable,
+    processed_dir: Path | None = None,
+    parse_workers: int | None = None,
+    load_workers: int | None = None,
+    queue_size: int | None = None,
+    label: str = "ETL",
+) -> dict:
+    """
+    parse_fn(fp) -> result          必須是模組層級函式（要能 pickle 給子程序）
+    load_fn(fp, result) -> 筆數      在 loader thread 執行
+    processed_dir=None → 成功後不搬檔（例如 backfill 重跑 processed/ 裡的檔案）
+    files 可以是 list，也可以是邊下載邊產生的 iterable（pipelined_runner.FileFeed），
+    後者要等 iterable 結束才知道總檔數。
+
+    parse_workers / load_workers / queue_size 沒給就讀 env：
+    ETL_PARSE_WORKERS（預設 1，=1 時直接在主程序解析）、ETL_LOAD_WORKERS（預設 1）、ETL_QUEUE_SIZE（預設 2）。
+    任何一個檔案失敗：停止排新工作，等進行中的 load 完成後丟出第一個錯誤；
+    已成功的檔案照常搬走，失敗與未處理的檔案留在原地，下次重跑。
+    """
+    streaming = not isinstance(files, (list, tuple))
+    if not streaming:
+        files = list(files)
+    parse_workers = parse_workers or _env_int("ETL_PARSE_WORKERS", 1)
+    load_workers = load_workers or _env_int("ETL_LOAD_WORKERS", 1)
+    queue_size = queue_size or _env_int("ETL_QUEUE_SIZE", 2)
+
+    total = "?" if streaming else len(files)
+    print(f"🚚 {label}：共 {total} 個檔案（parse×{parse_workers}，load×{load_workers}）")
+    if not streaming and not files:
+        return {"files": 0, "loaded": 0, "rows": 0, "seconds": 0.0}
+
+    t0 = time.perf_counter()
+    work_q = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors = []
+    stats = {"files": 0, "loaded": 0, "rows": 0}
+    lock = threading.Lock()
+
+    def loader():
+        while True:
+            item = work_q.get()
+            if item is _DONE:
+                return
+            fp, result = item
+            if stop.is_set():
+                continue
+            try:
+                with stage("load", etl=label, file=fp.name) as s:
+                    rows = s.rows = load_fn(fp, result) or 0
+                if processed_dir is not None:
+                    dest = move_to_processed(fp, processed_dir)
+                    print(f"📦 {fp.name} 已移至 {dest.parent}")
+                with lock:
+                    stats["loaded"] += 1
+                    stats["rows"] += rows
+            except Exception as e:
+                print(f"❌ {label} 上傳失敗：{fp.name}：{e}")
+                with lock:
+                    errors.append(e)
+                stop.set()
+
+    threads = [threading.Thread(target=loader, name=f"{label}-loader-{i}", daemon=True)
+               for i in range(load_workers)]
+    for t in threads:
+        t.start()
+
+    def feed(fp, result):
+        # queue 滿了就等 loader 消化（backpressure），但停止時不要卡住
+        while not stop.is_set():
+            try:
+                work_q.put((fp, result), timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def parse_failed(fp, e):
+        print(f"❌ {label} 解析失敗：{fp.name}：{e}")
+        with lock:
+            errors.append(e)
+        stop.set()
+
+    try:
+        if parse_workers <= 1:
+            for fp in files:
+                if stop.is_set():
+                    break
+                stats["files"] += 1
+                try:
+                    result = _timed_parse(parse_fn, label, fp)
+                except Exception as e:
+                    parse_failed(fp, e)
+                    break
+                feed(fp, result)
+        else:
+            # 送工作的 thread 跟收結果的主 thread 分開：files 是邊下載邊產生的 feed 時，
+            # 等下一個檔案不會卡住已經解析好的結果
+            slots = threading.Semaphore(parse_workers)
+            submitted = queue.Queue()
+            with ProcessPoolExecutor(max_workers=parse_workers) as pool:
+                def submit_all():
+                    try:
+                        for fp in files:
+                            slots.acquire()
+                            if stop.is_set():
+                                break
+                            stats["files"] += 1
+                            submitted.put((fp, pool.submit(_timed_parse, parse_fn, label, fp)))
+                    finally:
+                        submitted.put(_DONE)
+
+                submitter = threading.Thread(target=submit_all, name=f"{label}-submit", daemon=True)
+                submitter.start()
+                while (item := submitted.get()) is not _DONE:
+                    fp, fut = item
+                    try:
+                        feed(fp, fut.result())
+                    except Exception as e:
+                        parse_failed(fp, e)
+                    slots.release()
+                submitter.join()
+    finally:
+        for _ in threads:
+            work_q.put(_DONE)
+        for t in threads:
+            t.join()
+
+    seconds = time.perf_counter() - t0
+    n_files = stats["files"] if streaming else len(files)
+    summary = {"files": n_files, "loaded": stats["loaded"], "rows": stats["rows"], "seconds": seconds}
+    print(f"🎉 {label}：{stats['loaded']}/{n_files} 個檔案，{stats['rows']:,} 列，"
+          f"{seconds:.1f}s（{stats['rows'] / seconds if seconds else 0:,.0f} rows/s）")
+
+    if errors:
+        raise errors[0]
+    return summary
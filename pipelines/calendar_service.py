@@ -0,0 +1,188 @@
+import json
+import os
+import threading
+import time
+from datetime import date, datetime
+import pandas as pd
+from sqlalchemy import text
+from dotenv import load_dotenv
+from ETL_SAP.common.config import get_sql_engine
+
+load_dotenv()
+
+# ------------------------------------------------------------
+# dim_Calendar 快取：
+#   來源   → SQL dim_Calendar（預設）或 Calendar.xlsx（CALENDAR_SOURCE=excel）
+#   快照   → cache/calendar_<source>.parquet（沒有 pyarrow 就用 pickle），旁邊的 .json 記來源指紋
+#   失效   → Excel 看檔案 mtime/size；SQL 看筆數 + MAX(Date) + CHECKSUM_AGG
+#            載入後 CALENDAR_TTL_SECONDS 內不重查指紋
+# 查詢都是 dict / index 對應，不再每次 read_excel + 線性搜尋。
+# ------------------------------------------------------------
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # 等於 ETL_SAP/
+
+CALENDAR_SOURCE = os.getenv("CALENDAR_SOURCE", "sql")
+CALENDAR_TABLE = os.getenv("CALENDAR_TABLE", "dbo.dim_Calendar")
+CALENDAR_XLSX = os.getenv(
+    "CALENDAR_XLSX", r"C:\Users\anniec\Documents\TAWA\AutoScript\ETL_SAP\mapping_tables\maintain\Calendar.xlsx")
+CALENDAR_CACHE_DIR = os.getenv("CALENDAR_CACHE_DIR", os.path.join(BASE_DIR, "cache"))
+CALENDAR_TTL_SECONDS = int(os.getenv("CALENDAR_TTL_SECONDS", 3600))
+
+CALENDAR_FIELDS = ("AcctWk", "PromWk", "Period")
+
+try:
+    import pyarrow  # noqa: F401
+    _SNAPSHOT_EXT = ".parquet"
+except ImportError:
+    _SNAPSHOT_EXT = ".pkl"
+
+
+def _to_date(value) -> date:
+    if type(value) is date:
+        return value
+    if isinstance(value, datetime):
+        return value.date()
+    return pd.Timestamp(value).date()
+
+
+class CalendarService:
+    def __init__(self, source=None, table=None, xlsx_path=None, cache_dir=None, ttl_seconds=None):
+        self.source = source or CALENDAR_SOURCE
+        if self.source not in ("sql", "excel"):
+            raise ValueError(f"Unknown calendar source: {self.source}（可用：sql, excel）")
+        self.table = table or CALENDAR_TABLE
+        self.xlsx_path = xlsx_path or CALENDAR_XLSX
+        self.cache_dir = cache_dir or CALENDAR_CACHE_DIR
+        self.ttl_seconds = CALENDAR_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self._checked_at = 0.0
+        self._frame = None          # index = DatetimeIndex（normalize 過），欄位 = CALENDAR_FIELDS
+        self._lookup = {}           # {field: {date: value}}
+
+    # ---------- 來源 / 指紋 ----------
+    def _source_fingerprint(self) -> str:
+        if self.source == "excel":
+            st = os.stat(self.xlsx_path)
+            return f"excel:{self.xlsx_path}:{st.st_mtime_ns}:{st.st_size}"
+        with get_sql_engine().connect() as conn:
+            n, max_date, checksum = conn.execute(text(f"""
+                SELECT COUNT(*), MAX([Date]), CHECKSUM_AGG(BINARY_CHECKSUM(*)) FROM {self.table}
+            """)).one()
+        return f"sql:{self.table}:{n}:{max_date}:{checksum}"
+
+    def _read_source(self) -> pd.DataFrame:
+        if self.source == "excel":
+            print(f"📅 讀取 {self.xlsx_path}")
+            df = pd.read_excel(self.xlsx_path, dtype={f: str for f in CALENDAR_FIELDS})
+        else:
+            print(f"📅 讀取 {self.table}")
+            cols = ", ".join(f"[{c}]" for c in ("Date", *CALENDAR_FIELDS))
+            with get_sql_engine().connect() as conn:
+                df = pd.read_sql(text(f"SELECT {cols} FROM {self.table}"), conn)
+        df["Date"] = pd.to_datetime(df["Date"]).dt.normalize()
+        df = df.dropna(subset=["Date"]).set_index("Date")[list(CALENDAR_FIELDS)]
+        return df[~df.index.duplicated()]
+
+    # ---------- 快照 ----------
+    def _snapshot_paths(self):
+        base = os.path.join(self.cache_dir, f"calendar_{self.source}")
+        return base + _SNAPSHOT_EXT, base + ".json"
+
+    def _read_snapshot(self, fingerprint):
+        data_path, meta_path = self._snapshot_paths()
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                if json.load(f).get("fingerprint") != fingerprint:
+                    return None
+            if data_path.endswith(".parquet"):
+                return pd.read_parquet(data_path)
+            return pd.read_pickle(data_path)
+        except (OSError, ValueError):
+            return None
+
+    def _write_snapshot(self, frame, fingerprint):
+        data_path, meta_path = self._snapshot_paths()
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            if data_path.endswith(".parquet"):
+                frame.to_parquet(data_path)
+            else:
+                frame.to_pickle(data_path)
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump({"fingerprint": fingerprint, "saved_at": datetime.now().isoformat()}, f)
+        except OSError as e:
+            print(f"⚠️ 行事曆快照寫入失敗：{e}")
+
+    # ---------- 載入 / 失效 ----------
+    def _install(self, frame, fingerprint):
+        self._frame = frame
+        self._fingerprint = fingerprint
+        self._lookup = {
+            field: dict(zip(frame.index.date, frame[field].to_numpy()))
+            for field in CALENDAR_FIELDS
+        }
+
+    def refresh(self, force: bool = False):
+        """重查來源指紋；有變（或 force）才重新載入，否則只更新檢查時間。"""
+        with self._lock:
+            fingerprint = self._source_fingerprint()
+            self._checked_at = time.monotonic()
+            if not force and fingerprint == self._fingerprint:
+                return
+
+            frame = None if force else self._read_snapshot(fingerprint)
+            if frame is None:
+                frame = self._read_source()
+                self._write_snapshot(frame, fingerprint)
+            self._install(frame, fingerprint)
+            print(f"📅 行事曆已載入 {len(frame):,} 天")
+
+    def invalidate(self):
+        """下次查詢時重查來源指紋。"""
+        self._checked_at = 0.0
+
+    def _ensure_loaded(self):
+        if self._frame is None or time.monotonic() - self._checked_at > self.ttl_seconds:
+            self.refresh()
+
+    # ---------- 查詢 ----------
+    def lookup(self, value, field: str = "AcctWk"):
+        """單一日期 → field 值，O(1)；查不到丟 ValueError。"""
+        self._ensure_loaded()
+        d = _to_date(value)
+        result = self._lookup[field].get(d)
+        if result is None or pd.isna(result):
+            raise ValueError(f"No {field} found for date: {d}")
+        return result
+
+    def acctwk(self, value):
+        return self.lookup(value, "AcctWk")
+
+    def promwk(self, value):
+        return self.lookup(value, "PromWk")
+
+    def period(self, value):
+        return self.lookup(value, "Period")
+
+    def map_dates(self, dates, field: str = "AcctWk") -> pd.Series:
+        """整欄日期一次對應（reindex，不逐列呼叫）；查不到的是 NaN。"""
+        self._ensure_loaded()
+        dates = pd.Series(dates)
+        keys = pd.to_datetime(dates).dt.normalize()
+        values = self._frame[field].reindex(keys).to_numpy()
+        return pd.Series(values, index=dates.index, name=field)
+
+
+_CALENDAR = None
+_CALENDAR_LOCK = threading.Lock()
+
+
+def get_calendar() -> CalendarService:
+    """整個 process 共用一個行事曆快取。"""
+    global _CALENDAR
+    with _CALENDAR_LOCK:
+        if _CALENDAR is None:
+            _CALENDAR = CalendarService()
+        return _CALENDAR
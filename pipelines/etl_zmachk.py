@@ -13,6 +13,7 @@ from sqlalchemy.types import VARCHAR, NVARCHAR, DECIMAL, INTEGER, Date, DateTime
 from ETL_SAP.sap_scripts.downloader_zmachk import download_zmachk
 from dotenv import load_dotenv
 from ETL_SAP.pipelines.etl_utils import *
+from ETL_SAP.common.key_codes import encode_keys, concat_encoded
 
 load_dotenv()
 
@@ -31,9 +32,9 @@ def run_etl_zmachk(folder_path):
         df = pd.read_excel(fp, dtype=str)
         df = df[df['Status'] == 'Y']
         df.drop(columns=['Status'], inplace=True)
-        dfs.append(df)
+        dfs.append(encode_keys(df, ["Article"]))
 
-    batch_df = pd.concat(dfs, ignore_index=True)
+    batch_df = concat_encoded(dfs, ignore_index=True)
     batch_df = batch_df.drop_duplicates(subset=['Article'])
     print("Length:", len(batch_df), " \nContent: \n", batch_df)
 
@@ -73,6 +74,7 @@ def run_etl_zmachk(folder_path):
             "Wacine Ordering": "Wachine_Ordering",
 
         }, inplace=True)
+    encode_keys(batch_df, ["MCH"])      # Article / MCH 維持 categorical，clean_df_by_sql_schema 時才轉回字串
 
     # 數字清洗
     batch_df['Valid_From_Date'] = pd.to_datetime(batch_df['Valid_From_Date']).dt.strftime('%Y-%m-%d')
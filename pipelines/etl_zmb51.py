@@ -12,55 +12,50 @@ from sqlalchemy.types import VARCHAR, NVARCHAR, DECIMAL, INTEGER, Date, DateTime
 from ETL_SAP.sap_scripts.downloader_zmb51 import download_zmb51
 from dotenv import load_dotenv
 from ETL_SAP.pipelines.etl_utils import *
+from ETL_SAP.pipelines.landing_zone import iter_export, landed_files
+from ETL_SAP.pipelines.batch_executor import run_file_batches
+from ETL_SAP.pipelines.keyed_accumulator import KeyedAccumulator
+from ETL_SAP.common.key_codes import encode_keys
 
 load_dotenv()
 
+ZMB51_AGG = {
+    'Quantity': 'sum',
+    'Cost': 'sum',
+    'BUn' : 'first'
+}
+
+ZMB51_DTYPES = {
+    'Site': str,
+    'Article': str,
+    'MvT': str,
+    'Cost Ctr': str,
+    'Art. Doc.': str,
+}
+
+ZMB51_COLUMN_TYPES = {
+    "Site": NVARCHAR(10),
+    "Article": NVARCHAR(20),
+    "BUn": NVARCHAR(10),
+    "Date": Date(),
+    "Quantity": DECIMAL(18, 6),
+    "Cost": DECIMAL(18, 6),
+}
+
+
+def parse_zmb51_file(fp):
+    """讀 + 清洗單一 ZMB51 檔案，回傳 Article/Site/Date 彙總後的結果（在 process pool 執行）。"""
+    print(f"🔹 開始清理 {Path(fp).name} ...")
+
+    # 逐塊讀取 + 清洗，每塊直接折進 Article/Site/Date 的累加器（記憶體只跟不同 key 的數量有關）
+    # （同一個 Article/Site/Date 可能跨塊，所以 upsert 要等整個檔案讀完）
+    acc = KeyedAccumulator(['Article', 'Site', 'Date'], ZMB51_AGG)
+    for chunk in iter_export(fp, "ZMB51", dtype=ZMB51_DTYPES):   # .txt 或 landing 的 .parquet
+        chunk['Pstng Date'] = pd.to_datetime(chunk['Pstng Date'], format='%m/%d/%Y')
+        chunk.dropna(subset=['Article', 'Site', 'Pstng Date'], inplace=True)
 
-def run_etl_zmb51(folder_path):
-
-    BATCH_SIZE = 1  
-    txt_files = sorted(Path(folder_path).glob("ZMB51_*.txt"))
-    n_batches = ceil(len(txt_files) / BATCH_SIZE)
-    # n_batches = 3
-    processed_dir = Path(folder_path, "processed")
-    processed_dir.mkdir(exist_ok=True)
-
-    print(f"Total {len(txt_files)} files, {n_batches} batches.")
-
-    for b in range(n_batches):
-        batch_files = txt_files[b*BATCH_SIZE : (b+1)*BATCH_SIZE]
-        if not batch_files:
-            break
-
-        print(f"🚚 處理批次 {b+1}/{n_batches}，檔案數 {len(batch_files)} …")
-
-        # -------- 讀 + 清洗 --------
-
-        print("🔹 開始清理 Zmb51 檔案...")
-
-        dtype_dict = {
-        'Site': str,
-        'Article': str,
-        'MvT': str,
-        'Cost Ctr': str,
-        'Art. Doc.': str,
-        }
-        
-        dfs = []
-        for fp in batch_files:
-            df = (
-                pd.read_csv(fp, sep="\t", skiprows=2, dtype=dtype_dict, low_memory=False,)
-                    .iloc[:, 1:]                            # 去掉空白首欄
-            )
-            df.columns = df.columns.str.strip()
-            df['Pstng Date'] = pd.to_datetime(df['Pstng Date'], format='%m/%d/%Y')
-            df.dropna(subset=['Article', 'Site', 'Pstng Date'], inplace=True)
-            dfs.append(df)
-
-        batch_df = pd.concat(dfs, ignore_index=True)
-        
         # 欄位正名
-        batch_df = batch_df.rename(columns={
+        chunk = chunk.rename(columns={
             "Quantity i": "Quantity",
             "Amount LC":  "Cost",
             "Pstng Date": "Date",
@@ -68,53 +63,69 @@ def run_etl_zmb51(folder_path):
         })
 
         # 數字清洗
-        batch_df[["Quantity", "Cost"]] = batch_df[["Quantity", "Cost"]].apply(fast_numeric)
-        
-        batch_df['Quantity'] = batch_df['Quantity'] * -1
-        batch_df['Cost'] = batch_df['Cost'] * -1
-
-        groupby_df = batch_df.groupby(['Article', 'Site', 'Date']).agg({
-        'Quantity': 'sum',
-        'Cost': 'sum',
-        'BUn' : 'first'
-        }).reset_index()    
-
-        print(f"🚚 批次 {b+1} 清洗後資料：\n{groupby_df.head(2)}\n"
-            f"🚚 批次 {b+1} 清洗後資料筆數：{len(groupby_df)}\n")
-
-        # 上傳至 SQL Server
-        print(f"🔹 開始上傳 ZMB51 資料到 {os.getenv("SQL_DB")}...")
-        
-        engine = get_sql_engine()
-        column_types = {
-            "Site": NVARCHAR(10),
-            "Article": NVARCHAR(20),
-            "BUn": NVARCHAR(10),
-            "Date": Date(),
-            "Quantity": DECIMAL(18, 6),
-            "Cost": DECIMAL(18, 6),
-        }
-        upsert_batch(
-            df=groupby_df,
-            target_table=os.getenv("TABLE_ZMB51"),
-            unique_keys=["Article", "Site", "Date"],
-            column_types=column_types,
-        )
-        
-        # upload_to_sql(groupby_df, os.getenv("TABLE_ZMB51"), column_types, if_exists="append")
-        print(f"✅ 批次 {b+1} 已匯入 {os.getenv("TABLE_ZMB51")} {len(groupby_df):,} 列\n")
-
-        # ---------- 移動到 processed ----------
-        for fp in batch_files:
-            dest = processed_dir / fp.name
-            # 若同名檔已存在就加時間戳避免覆寫
-            if dest.exists():
-                timestamp = datetime.now().strftime("%Y%m%d%H%M")
-                dest = processed_dir / f"{fp.stem}_{timestamp}{fp.suffix}"
-            shutil.move(fp, dest)
-        print(f"批次 {b+1} 檔案已移至 {processed_dir}\n")
+        chunk[["Quantity", "Cost"]] = chunk[["Quantity", "Cost"]].apply(parse_sap_number)
+
+        acc.add(encode_keys(chunk, ("Article", "Site")))   # 累加器直接用字典編號，不再 hash 字串
+
+    # 正負號在加總之後才反轉（-Σx = Σ-x），不用每一列都乘 -1
+    groupby_df = acc.result()
+    groupby_df[['Quantity', 'Cost']] = -groupby_df[['Quantity', 'Cost']]
+    return groupby_df
+
+
+def load_zmb51(fp, groupby_df):
+    print(f"🚚 {Path(fp).name} 清洗後資料：\n{groupby_df.head(2)}\n"
+          f"🚚 {Path(fp).name} 清洗後資料筆數：{len(groupby_df)}\n")
+
+    # 上傳至 SQL Server
+    upsert_batch(
+        df=groupby_df,
+        target_table=os.getenv("TABLE_ZMB51"),
+        unique_keys=["Article", "Site", "Date"],
+        column_types=ZMB51_COLUMN_TYPES,
+        hash_diff=True,       # 重跑同一週只改有變的列
+    )
+
+    # upload_to_sql(groupby_df, os.getenv("TABLE_ZMB51"), column_types, if_exists="append")
+    print(f"✅ {Path(fp).name} 已匯入 {os.getenv("TABLE_ZMB51")} {len(groupby_df):,} 列\n")
+    return len(groupby_df)
+
+
+def run_etl_zmb51(folder_path, parse_workers=None, load_workers=None, files=None, source="export"):
+    """
+    files=None → 處理資料夾裡所有 ZMB51_*.txt；也可以給 pipelined_runner.FileFeed 邊下載邊處理。
+    source="landing" → 改讀 landing zone 的 ZMB51（files=None 時全部；檔案不搬）。
+    source="processed" → 重跑 processed/ 裡封存的檔案（pipelines/backfill.py 挑好 files；檔案不搬）。
+    回傳 run_file_batches 的統計（files / loaded / rows / seconds）。
+    """
+
+    if source == "landing":
+        txt_files = landed_files("ZMB51", "ZMB51_*") if files is None else files
+        processed_dir = None
+    elif source == "processed":
+        txt_files = sorted(Path(folder_path, "processed").glob("ZMB51_*.txt")) if files is None else files
+        processed_dir = None
+    else:
+        txt_files = sorted(Path(folder_path).glob("ZMB51_*.txt")) if files is None else files
+        processed_dir = Path(folder_path, "processed")
+        processed_dir.mkdir(parents=True, exist_ok=True)
+
+    print(f"🔹 開始上傳 ZMB51 資料到 {os.getenv("SQL_DB")}...")
+
+    # 解析在 process pool、上傳在 loader threads，兩邊重疊執行；
+    # 每個檔案 upsert 成功後才搬到 processed
+    summary = run_file_batches(
+        txt_files,
+        parse_fn=parse_zmb51_file,
+        load_fn=load_zmb51,
+        processed_dir=processed_dir,
+        parse_workers=parse_workers,
+        load_workers=load_workers,
+        label="ZMB51",
+    )
 
     print("🎉 全部批次處理結束")
+    return summary
 
 
 
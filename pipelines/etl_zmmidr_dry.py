@@ -2,25 +2,15 @@ import os
 import pandas as pd
 from ETL_SAP.common.loader import upload_to_sql
 from ETL_SAP.common.config import get_sql_engine
+from ETL_SAP.pipelines.sap_numbers import parse_sap_number
+from ETL_SAP.pipelines.landing_zone import landed_path
+from ETL_SAP.pipelines.zmmidr_export import read_zmmidr_export
 from datetime import datetime
 from sqlalchemy.types import VARCHAR, NVARCHAR, DECIMAL, INTEGER, Date, DateTime
 from sap_scripts.downloader_zmmidr_dry import download_zmmidr_all
 
-def clean_number(val):
-    if pd.isna(val):
-        return 0.0
-    val = str(val).replace(',', '').strip()
-    if val.endswith('-') and val[:-1].replace('.', '', 1).isdigit():
-        val = '-' + val[:-1]  # 處理尾巴負號
-    try:
-        return float(val)
-    except:
-        return 0.0
-
 def load_zmmidr_file(filepath, region):
-    df = pd.read_excel(filepath, dtype={'Article No': str, 'MCH': str})
-    df.drop(df.index[-1], inplace=True)  # 刪除合計列
-    df['Article No'] = df['Article No'].str.lstrip('0')
+    df = read_zmmidr_export(filepath)   # .txt 或 landing 的 .parquet（pipelines/zmmidr_export）
     df = df.rename(columns={'Article No': 'Article'})
     df['Article'] = df['Article'].astype(int)
     df.insert(0, 'Region', region)
@@ -30,18 +20,22 @@ def load_zmmidr_file(filepath, region):
     # df = df[['Article', 'Unrestricted-Use Stock', 'On order Stock']]
     return df
 
-def run_etl_zmmidr(folder_path):
+def run_etl_zmmidr(folder_path, source="export"):
+    """source="landing" → 讀 landing zone 裡最新一天的 Zmmidr_<region> 快照。"""
     print("🔹 開始清理 Zmmidr 檔案...")
 
     region_files = {
-        '9801': 'Zmmidr_9801.XLSX',
-        '9900': 'Zmmidr_9900.XLSX',
-        '9905': 'Zmmidr_9905.XLSX',
-        '9901': 'Zmmidr_9901.XLSX',
-        '9902': 'Zmmidr_9902.XLSX',
+        '9801': 'Zmmidr_9801.txt',
+        '9900': 'Zmmidr_9900.txt',
+        '9905': 'Zmmidr_9905.txt',
+        '9901': 'Zmmidr_9901.txt',
+        '9902': 'Zmmidr_9902.txt',
     }
 
-    dfs = {r: load_zmmidr_file(os.path.join(folder_path, f), r) for r, f in region_files.items()}
+    def path(f):
+        return landed_path("ZMMIDR", os.path.splitext(f)[0]) if source == "landing" else os.path.join(folder_path, f)
+
+    dfs = {r: load_zmmidr_file(path(f), r) for r, f in region_files.items()}
 
     # 合併 EC 區域
     df_ec = pd.concat([dfs['9905'], dfs['9901'], dfs['9902']], ignore_index=True)
@@ -73,8 +67,8 @@ def run_etl_zmmidr(folder_path):
     df_all.insert(0, 'Article NoDC', df_all['Region'].astype(str) + df_all['Article'].astype(str))
 
     # 數字清洗
-    df_all['Unrestricted-Use Stock'] = df_all['Unrestricted-Use Stock'].apply(clean_number)
-    df_all['On order Stock'] = df_all['On order Stock'].apply(clean_number)
+    df_all['Unrestricted-Use Stock'] = parse_sap_number(df_all['Unrestricted-Use Stock']).fillna(0.0)
+    df_all['On order Stock'] = parse_sap_number(df_all['On order Stock']).fillna(0.0)
 
     # 導出 Excel
     export_path = os.path.join(folder_path, "df_Zmmidr.xlsx")
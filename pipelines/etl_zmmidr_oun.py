@@ -16,6 +16,9 @@ from datetime import datetime
 from sqlalchemy.types import VARCHAR, NVARCHAR, DECIMAL, INTEGER, Date, DateTime
 from ETL_SAP.sap_scripts.downloader_zmmidr_oun import download_zmmidr_OUn
 from ETL_SAP.pipelines.etl_utils import *
+from ETL_SAP.pipelines.landing_zone import landed_files
+from ETL_SAP.pipelines.zmmidr_export import read_zmmidr_export
+from ETL_SAP.common.key_codes import encode_keys, concat_encoded
 from dotenv import load_dotenv
 
 from ETL_SAP.sap_scripts.downloader_zmmidr_bun import download_zmmidr_BUn
@@ -24,35 +27,37 @@ from ETL_SAP.pipelines.etl_zmmidr_bun import run_etl_zmmidr_BUn
 load_dotenv()
 
 def load_zmmidr_file(filepath, dc):
-    df = pd.read_excel(filepath, dtype={'Article No': str, 'MCH': str})
-    df.drop(df.index[-1], inplace=True)  # 刪除合計列
-    df['Article No'] = df['Article No'].str.lstrip('0')
+    df = read_zmmidr_export(filepath)   # .txt 或 landing 的 .parquet（pipelines/zmmidr_export）
     df = df.rename(columns={'Article No': 'Article'})
     df.insert(0, 'DC', dc)
 
-    return df
+    return encode_keys(df)      # DC / Article / MCH → categorical，寫 SQL 前才轉回字串
 
-def run_etl_zmmidr_OUn(folder_path):
+def run_etl_zmmidr_OUn(folder_path, source="export"):
+    """source="landing" → 讀 landing zone 裡的 Zmmidr_oun_* 快照（每個檔名取最新一天）。"""
     print("🔹 開始清理 Zmmidr_OUn 檔案...")
     
-    # 遍歷所有 Excel 檔案，格式如 Zmmidr_106_9801_06012025.xlsx
-    file_pattern = re.compile(r'Zmmidr_oun_(\d{3})_(\d{4})_\d{8}\.xlsx')
+    # 遍歷所有匯出檔，格式如 Zmmidr_106_9801_06012025.txt
+    file_pattern = re.compile(r'Zmmidr_oun_(\d{3})_(\d{4})_\d{8}\.txt')
     dept_dfs = defaultdict(list)
     processed_dir = os.path.join(folder_path, "processed")
     os.makedirs(processed_dir, exist_ok=True)
 
-    for fname in os.listdir(folder_path):
+    if source == "landing":
+        candidates = {fp.stem + ".txt": str(fp) for fp in landed_files("ZMMIDR", "Zmmidr_oun_*")}
+    else:
+        candidates = {fname: os.path.join(folder_path, fname) for fname in os.listdir(folder_path)}
+    for fname, full_path in candidates.items():
         m = file_pattern.match(fname)
         if not m:
             continue
         dept, dc = m.groups()
-        full_path = os.path.join(folder_path, fname)
         df = load_zmmidr_file(full_path, dc)
         dept_dfs[dept].append(df)
 
     # 各 Dept 先 concat，自成一張；再 concat 全部
     combined_all = [
-        pd.concat(df_list, ignore_index=True)
+        concat_encoded(df_list, ignore_index=True)
         for df_list in dept_dfs.values()
     ]
 
@@ -60,13 +65,13 @@ def run_etl_zmmidr_OUn(folder_path):
         print("⚠️ 沒有任何可合併的資料，跳過 Zmmidr_OUn 上傳流程")
         return 
 
-    df_all = pd.concat(combined_all, ignore_index=True)
+    df_all = concat_encoded(combined_all, ignore_index=True)
 
     print(f"✅ 合併完成，共 {len(df_all)} 筆")
 
     # 數字清洗
-    df_all['Unrestricted-Use Stock'] = df_all['Unrestricted-Use Stock'].apply(clean_number)
-    df_all['On order Stock'] = df_all['On order Stock'].apply(clean_number)
+    df_all['Unrestricted-Use Stock'] = parse_sap_number(df_all['Unrestricted-Use Stock'])
+    df_all['On order Stock'] = parse_sap_number(df_all['On order Stock'])
     df_all.insert(0, 'Date', datetime.today().date())
 
     if df_all.duplicated(subset=['Date', 'DC', 'Article']).any():
@@ -113,8 +118,7 @@ def run_etl_zmmidr_OUn(folder_path):
     # upload_to_sql(df_all, os.getenv("TABLE_ZMMIDR_OUn"), column_types, 'replace')
 
     # ---------- 移動到 processed ----------
-    kill_excel()
-    time.sleep(2)
+    # 匯出檔是 Text with Tabs，沒有 Excel 佔住檔案，直接搬
     for filename in os.listdir(folder_path):
         if "Zmmidr_" in filename:
             src_path = os.path.join(folder_path, filename)
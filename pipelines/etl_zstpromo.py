@@ -12,38 +12,44 @@ from sqlalchemy.types import VARCHAR, NVARCHAR, DECIMAL, INTEGER, Date, DateTime
 from ETL_SAP.sap_scripts.downloader_zstpromo import download_zstpromo
 from dotenv import load_dotenv
 from ETL_SAP.pipelines.etl_utils import *
+from ETL_SAP.pipelines.landing_zone import iter_export, landed_files
+from ETL_SAP.pipelines.batch_executor import run_file_batches
+from ETL_SAP.pipelines.keyed_accumulator import KeyedAccumulator
+from ETL_SAP.common.key_codes import encode_keys
 from ETL_SAP.pipelines.etl_zmb51 import run_etl_zmb51
 
 load_dotenv()
 
-def run_etl_zstpromo(folder_path):
-    BATCH_SIZE = 1
-    txt_files = sorted(Path(folder_path).glob("ZSTPROMO_*.txt"))
-    n_batches = ceil(len(txt_files) / BATCH_SIZE)
-    processed_dir = Path(folder_path, "processed")
-    processed_dir.mkdir(exist_ok=True)
-
-    print(f"Total {len(txt_files)} files, {n_batches} batches.")
-
-    for b in range(n_batches):
-        batch_files = txt_files[b * BATCH_SIZE : (b + 1) * BATCH_SIZE]
-        if not batch_files:
-            break
-
-        print(f"🚚 處理批次 {b+1}/{n_batches}，檔案數 {len(batch_files)} …")
-
-        dfs = []
-        for fp in batch_files:
-            df = pd.read_csv(fp, sep="\t", skiprows=2, dtype=str, low_memory=False).iloc[:, 1:]  
-            df.columns = df.columns.str.strip()
-            df['Bill. Date'] = pd.to_datetime(df['Bill. Date'], format='%m/%d/%Y')
-            df.dropna(subset=['Article', 'Payer', 'Bill. Date'], inplace=True)
-            dfs.append(df)
-
-        batch_df = pd.concat(dfs, ignore_index=True)
+ZSTPROMO_AGG = {
+    "Amt": 'sum',
+    'Quantity': 'sum',
+    'Cost': 'sum',
+    'SUn' : 'first'
+}
+
+ZSTPROMO_COLUMN_TYPES = {
+    "Article": NVARCHAR(20),
+    "Site":    NVARCHAR(10),
+    "Date":    Date(),
+    "Amt":     DECIMAL(18,6),
+    "Quantity":DECIMAL(18,6),
+    "Cost":    DECIMAL(18,6),
+    "SUn":     NVARCHAR(10),
+}
+
+
+def parse_zstpromo_file(fp):
+    """讀 + 清洗單一 ZSTPROMO 檔案，回傳 Article/Site/Date 彙總後的結果（在 process pool 執行）。"""
+    print(f"🔹 開始清理 {Path(fp).name} ...")
+
+    # 逐塊讀取 + 清洗，每塊直接折進 Article/Site/Date 的累加器（跟 ZMB51 同一套）
+    acc = KeyedAccumulator(['Article', 'Site', 'Date'], ZSTPROMO_AGG)
+    for chunk in iter_export(fp, "ZSTPROMO"):   # .txt 或 landing 的 .parquet
+        chunk['Bill. Date'] = pd.to_datetime(chunk['Bill. Date'], format='%m/%d/%Y')
+        chunk.dropna(subset=['Article', 'Payer', 'Bill. Date'], inplace=True)
 
         # 欄位正名
-        batch_df = batch_df.rename(columns={
+        chunk = chunk.rename(columns={
             "Payer": "Site",
             "Bill.qty":  "Quantity",
             "Bill. Date": "Date",
@@ -52,54 +58,62 @@ def run_etl_zstpromo(folder_path):
         })
 
         # 數字清洗
-        batch_df[["Quantity", "Amt", "Cost"]] = batch_df[["Quantity", "Amt", "Cost"]].apply(fast_numeric)
-
-        groupby_df = batch_df.groupby(['Article', 'Site', 'Date']).agg({
-            "Amt": 'sum',
-            'Quantity': 'sum',
-            'Cost': 'sum',
-            'SUn' : 'first'
-            }).reset_index()    
-
-        print(f"🚚 批次 {b+1} 清洗後資料：\n{groupby_df.head(2)}\n"
-            f"🚚 批次 {b+1} 清洗後資料筆數：{len(groupby_df)}\n")
-        
-
-        # 上傳至 SQL Server
-        print(f"🔹 開始上傳 ZSTPROMO 資料到 {os.getenv('SQL_DB')}...")
-
-        engine = get_sql_engine()
-        column_types = {
-            "Article": NVARCHAR(20),
-            "Site":    NVARCHAR(10),
-            "Date":    Date(),
-            "Amt":     DECIMAL(18,6),
-            "Quantity":DECIMAL(18,6),
-            "Cost":    DECIMAL(18,6),
-            "SUn":     NVARCHAR(10),
-        }
-
-        upsert_batch(
-            df=groupby_df,
-            target_table=os.getenv("TABLE_ZSTPROMO"),
-            unique_keys=["Article", "Site", "Date"],
-            column_types=column_types
-         )
-        
-        # upload_to_sql(groupby_df, os.getenv("TABLE_ZSTPROMO"), column_types, if_exists="append")
-        print(f"✅ 批次 {b+1} 已匯入 {os.getenv("TABLE_ZSTPROMO")} {len(groupby_df):,} 列\n")
-
-        # ---------- 移動到 processed ----------
-        for fp in batch_files:
-            dest = processed_dir / fp.name
-            # 若同名檔已存在就加時間戳避免覆寫
-            if dest.exists():
-                timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-                dest = processed_dir / f"{fp.stem}_{timestamp}{fp.suffix}"
-            shutil.move(fp, dest)
-        print(f"批次 {b+1} 檔案已移至 {processed_dir}\n")
+        chunk[["Quantity", "Amt", "Cost"]] = chunk[["Quantity", "Amt", "Cost"]].apply(parse_sap_number)
+
+        acc.add(encode_keys(chunk, ("Article", "Site")))   # 累加器直接用字典編號，不再 hash 字串
+
+    return acc.result()
+
+
+def load_zstpromo(fp, groupby_df):
+    print(f"🚚 {Path(fp).name} 清洗後資料：\n{groupby_df.head(2)}\n"
+          f"🚚 {Path(fp).name} 清洗後資料筆數：{len(groupby_df)}\n")
+
+    # 上傳至 SQL Server
+    upsert_batch(
+        df=groupby_df,
+        target_table=os.getenv("TABLE_ZSTPROMO"),
+        unique_keys=["Article", "Site", "Date"],
+        column_types=ZSTPROMO_COLUMN_TYPES
+     )
+
+    # upload_to_sql(groupby_df, os.getenv("TABLE_ZSTPROMO"), column_types, if_exists="append")
+    print(f"✅ {Path(fp).name} 已匯入 {os.getenv("TABLE_ZSTPROMO")} {len(groupby_df):,} 列\n")
+    return len(groupby_df)
+
+
+def run_etl_zstpromo(folder_path, parse_workers=None, load_workers=None, files=None, source="export"):
+    """
+    files=None → 處理資料夾裡所有 ZSTPROMO_*.txt；也可以給 pipelined_runner.FileFeed 邊下載邊處理。
+    source="landing" → 改讀 landing zone 的 ZSTPROMO（files=None 時全部；檔案不搬）。
+    source="processed" → 重跑 processed/ 裡封存的檔案（pipelines/backfill.py 挑好 files；檔案不搬）。
+    回傳 run_file_batches 的統計（files / loaded / rows / seconds）。
+    """
+    if source == "landing":
+        txt_files = landed_files("ZSTPROMO", "ZSTPROMO_*") if files is None else files
+        processed_dir = None
+    elif source == "processed":
+        txt_files = sorted(Path(folder_path, "processed").glob("ZSTPROMO_*.txt")) if files is None else files
+        processed_dir = None
+    else:
+        txt_files = sorted(Path(folder_path).glob("ZSTPROMO_*.txt")) if files is None else files
+        processed_dir = Path(folder_path, "processed")
+        processed_dir.mkdir(parents=True, exist_ok=True)
+
+    print(f"🔹 開始上傳 ZSTPROMO 資料到 {os.getenv('SQL_DB')}...")
+
+    summary = run_file_batches(
+        txt_files,
+        parse_fn=parse_zstpromo_file,
+        load_fn=load_zstpromo,
+        processed_dir=processed_dir,
+        parse_workers=parse_workers,
+        load_workers=load_workers,
+        label="ZSTPROMO",
+    )
 
     print("🎉 全部批次處理結束")
+    return summary
 
 
 if __name__ == "__main__":
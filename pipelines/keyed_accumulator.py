@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+
+# ------------------------------------------------------------
+# 串流 groupby：每讀一塊就折進累加器，不保留各塊的部分結果。
+#   acc = KeyedAccumulator(["Article", "Site", "Date"], {"Quantity": "sum", "Cost": "sum", "BUn": "first"})
+#   for chunk in ...: acc.add(chunk)
+#   df = acc.result()          # 跟 groupby(keys).agg(agg).reset_index() 一樣的結果（依 key 排序）
+# 每個 key 欄位各有一本字典（值 → int 編號），三個編號壓成一個 int64 當組合 key；
+# sum 存在 float64 陣列、first 存編號（int32），記憶體只跟「不同 key 的數量」有關，跟原始列數無關。
+# 支援 sum / first（跟 groupby 一樣：sum 略過 NaN、first 取第一個非空值、key 有空值的列不算）。
+# key 欄位已經是 categorical（common/key_codes.encode_keys）時直接用它的編號，不再對字串做 hash，
+# result() 的 key 欄位也維持 categorical（寫 SQL 前才 decode）。
+# ------------------------------------------------------------
+
+SUPPORTED_AGGS = ("sum", "first")
+
+
+class _Codebook:
+    """值 → 連續的 int 編號（第一次出現的順序）；用 pd.Index 的 hash table 查。"""
+
+    def __init__(self):
+        self.values = None
+        self.dtype = None             # 輸入是 categorical 時：最新的 CategoricalDtype
+        self._cat_map = None          # categories 的位置 → 本字典的編號
+
+    def __len__(self):
+        return 0 if self.values is None else len(self.values)
+
+    def _encode_categorical(self, values: pd.Series) -> np.ndarray:
+        # 只對 categories（不重複、通常比列數少很多）做 hash，各列直接查表
+        if self.dtype is None or not values.cat.categories.equals(self.dtype.categories):
+            self.dtype = values.dtype
+            self._cat_map = self.encode(pd.Series(values.cat.categories))
+        return self._cat_map[values.cat.codes.to_numpy()]
+
+    def encode(self, values: pd.Series) -> np.ndarray:
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            return self._encode_categorical(values)
+        if self.values is None:
+            self.values = pd.Index(pd.unique(values))
+            return self.values.get_indexer(values)
+        codes = self.values.get_indexer(values)
+        missing = codes < 0
+        if missing.any():
+            self.values = self.values.append(pd.Index(pd.unique(values[missing])))
+            codes[missing] = self.values.get_indexer(values[missing])
+        return codes
+
+    def decode(self, codes: np.ndarray):
+        if self.dtype is not None:
+            cat_codes = self.dtype.categories.get_indexer(self.values)
+            if (cat_codes >= 0).all():        # 都在最新的 categories 裡 → 維持 categorical
+                return pd.Categorical.from_codes(cat_codes[codes], dtype=self.dtype)
+        return self.values.take(codes)
+
+    @property
+    def nbytes(self) -> int:
+        return 0 if self.values is None else int(self.values.memory_usage())
+
+
+class KeyedAccumulator:
+    """keys：分組欄位；agg：{欄位: "sum" | "first"}（順序就是 result() 的欄位順序）。"""
+
+    def __init__(self, keys, agg: dict, capacity: int = 1024):
+        bad = {c: f for c, f in agg.items() if f not in SUPPORTED_AGGS}
+        if bad:
+            raise ValueError(f"KeyedAccumulator 不支援的彙總：{bad}（可用：{', '.join(SUPPORTED_AGGS)}）")
+        self.keys = list(keys)
+        self.agg = dict(agg)
+        self.bits = 63 // len(self.keys)             # 每個 key 編號可用的位元數（3 個 key → 各 21 bits）
+        self._books = {k: _Codebook() for k in self.keys}
+        self._first_books = {c: _Codebook() for c, f in self.agg.items() if f == "first"}
+        self._slots = pd.Index(np.empty(0, dtype=np.int64))   # 組合 key → 位置
+        self._capacity = capacity
+        self._sums = {c: np.zeros(capacity) for c, f in self.agg.items() if f == "sum"}
+        self._firsts = {c: np.full(capacity, -1, dtype=np.int32) for c in self._first_books}
+        self.rows_in = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    @property
+    def nbytes(self) -> int:
+        """累加器目前佔的記憶體（組合 key + 陣列 + 字典）。"""
+        return (self._slots.nbytes + sum(a.nbytes for a in (*self._sums.values(), *self._firsts.values()))
+                + sum(b.nbytes for b in (*self._books.values(), *self._first_books.values())))
+
+    def _pack(self, chunk: pd.DataFrame) -> np.ndarray:
+        packed = np.zeros(len(chunk), dtype=np.int64)
+        for k in self.keys:
+            codes = self._books[k].encode(chunk[k])
+            if len(self._books[k]) >= 1 << self.bits:
+                raise OverflowError(f"{k} 的不同值超過 {1 << self.bits:,} 個，KeyedAccumulator 無法編碼")
+            packed = (packed << self.bits) | codes.astype(np.int64)
+        return packed
+
+    def _grow(self, size: int):
+        if size <= self._capacity:
+            return
+        capacity = self._capacity = max(size, self._capacity * 2)
+        for c, arr in self._sums.items():
+            self._sums[c] = np.concatenate([arr, np.zeros(capacity - len(arr))])
+        for c, arr in self._firsts.items():
+            self._firsts[c] = np.concatenate([arr, np.full(capacity - len(arr), -1, dtype=np.int32)])
+
+    def add(self, chunk: pd.DataFrame) -> int:
+        """把一塊資料折進來；回傳目前不同 key 的數量。"""
+        chunk = chunk.dropna(subset=self.keys)
+        self.rows_in += len(chunk)
+        if chunk.empty:
+            return len(self)
+
+        # 塊內先 factorize：每個不同 key 只查一次累加器
+        inverse, uniq = pd.factorize(self._pack(chunk))
+        pos = self._slots.get_indexer(uniq) if len(self._slots) else np.full(len(uniq), -1, dtype=np.intp)
+        new = pos < 0
+        if new.any():
+            pos[new] = np.arange(len(self._slots), len(self._slots) + new.sum())
+            self._slots = self._slots.append(pd.Index(uniq[new]))
+            self._grow(len(self._slots))
+
+        for c in self._sums:
+            values = np.nan_to_num(chunk[c].to_numpy(dtype="float64", na_value=np.nan), nan=0.0)
+            self._sums[c][pos] += np.bincount(inverse, weights=values, minlength=len(uniq))
+        for c, book in self._first_books.items():
+            col = chunk[c]
+            valid = col.notna().to_numpy()
+            if not valid.any():
+                continue
+            groups, first_row = np.unique(inverse[valid], return_index=True)
+            target = pos[groups]
+            unset = self._firsts[c][target] < 0
+            if unset.any():
+                values = col[valid].iloc[first_row[unset]]
+                self._firsts[c][target[unset]] = book.encode(values)
+        return len(self)
+
+    def result(self) -> pd.DataFrame:
+        cols = [*self.keys, *self.agg]
+        n = len(self._slots)
+        if not n:
+            return pd.DataFrame(columns=cols)
+        packed = self._slots.to_numpy()
+        mask = (1 << self.bits) - 1
+        data = {}
+        for i, k in enumerate(self.keys):
+            shift = self.bits * (len(self.keys) - 1 - i)
+            data[k] = self._books[k].decode((packed >> shift) & mask)
+        for c in self.agg:
+            if c in self._sums:
+                data[c] = self._sums[c][:n].copy()
+            else:
+                codes = self._firsts[c][:n]
+                book = self._first_books[c]
+                if not len(book):                        # 整欄都是空值
+                    data[c] = np.full(n, None, dtype=object)
+                else:
+                    data[c] = pd.Series(book.decode(np.maximum(codes, 0))).where(codes >= 0, None)
+        return pd.DataFrame(data)[cols].sort_values(self.keys, ignore_index=True)
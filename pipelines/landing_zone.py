@@ -0,0 +1,230 @@
+import os
+import re
+import time
+from datetime import date
+from pathlib import Path
+from typing import Iterator, NamedTuple
+
+import pandas as pd
+
+from ETL_SAP.common.instrument import record
+from ETL_SAP.pipelines.sap_export_reader import iter_sap_export, read_sap_columns, DEFAULT_CHUNKSIZE
+from ETL_SAP.pipelines.sap_numbers import parse_sap_number
+
+# ------------------------------------------------------------
+# Landing zone：SAP 匯出檔第一次被 ETL 讀到時，順便轉成有型別、壓縮過的 Parquet（或 Feather），
+#   <LANDING_DIR>/tcode=ZMB51/date=2025-01-05/ZMB51_01052025_01112025_SCA.parquet
+#   date = 檔案裡最早的日期（ZMMIDR 這種快照沒有日期欄 → 落地當天）
+# 之後重跑 / 補資料直接讀 landing（run_etl_xxx(..., source="landing")），
+# 不用再解析 tab 分隔文字；數字 / 日期已經轉好，parse 函式裡的 parse_sap_number、
+# to_datetime 遇到已經是數值 / 日期的欄位會直接跳過。
+#   LANDING_ZONE=1      → 讀原始匯出檔時順便落地（預設關閉）
+#   LANDING_DIR         → 位置（預設 ETL_SAP/landing）
+#   LANDING_FORMAT      → parquet（預設）/ feather
+# 需要 pyarrow；沒裝時落地自動跳過，ETL 照常跑。
+# ------------------------------------------------------------
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # 等於 ETL_SAP/
+LANDING_DIR = os.getenv("LANDING_DIR", os.path.join(BASE_DIR, "landing"))
+LANDING_ENABLED = os.getenv("LANDING_ZONE", "0") == "1"
+LANDING_FORMAT = os.getenv("LANDING_FORMAT", "parquet")
+LANDING_SUFFIXES = {"parquet": ".parquet", "feather": ".feather"}
+
+
+class LandingSpec(NamedTuple):
+    """raw 欄位名稱（rename 之前）：哪一欄是日期、哪些是 SAP 數字。"""
+    date_col: str | None
+    date_format: str | None
+    number_cols: tuple
+    collapse_spaces: bool = False
+
+
+LANDING_SPECS = {
+    "ZMB51": LandingSpec("Pstng Date", "%m/%d/%Y", ("Quantity i", "Amount LC", "Amount in LC")),
+    "ZSTPROMO": LandingSpec("Bill. Date", "%m/%d/%Y", ("Bill.qty", "Sales Amou", "Cost")),
+    "ZRSSALE": LandingSpec(
+        "Bill. Date", "%m/%d/%Y",
+        ("Bill.qty", "BillQtySKU", "Sales Amou", "Cost", "SAP Tax", "ArtTax", "TaxRate %", "CRVRate",
+         "Net", "Net Value", "N Weight", "Discount", "WSale", "POS Tax", "Net Sale"),
+        collapse_spaces=True),
+    "ZMMIDR": LandingSpec(None, None, ("D/C MAP", "Unrestricted-Use Stock", "Allocation Qty", "On order Stock",
+                                       "Unrestricted Stock Value", "PTD MVMT", "YTD MVMT")),
+}
+
+_PARTITION_RE = re.compile(r"date=(\d{4}-\d{2}-\d{2})$")
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError:
+        return None
+
+
+def is_landed(fp) -> bool:
+    return Path(fp).suffix in LANDING_SUFFIXES.values()
+
+
+def to_typed(chunk: pd.DataFrame, spec: LandingSpec) -> pd.DataFrame:
+    """raw 字串 → 日期 / float64（其他欄位維持字串）。"""
+    if spec.date_col and spec.date_col in chunk.columns:
+        chunk[spec.date_col] = pd.to_datetime(chunk[spec.date_col], format=spec.date_format)
+    cols = [c for c in spec.number_cols if c in chunk.columns]
+    if cols:
+        chunk[cols] = chunk[cols].apply(parse_sap_number)
+    return chunk
+
+
+def arrow_schema(columns, spec: LandingSpec, pa):
+    """landing 檔的 schema 只看 spec：date_col → timestamp、number_cols → float64、其他一律 string。"""
+    return pa.schema([(c, pa.timestamp("ns") if c == spec.date_col
+                       else pa.float64() if c in spec.number_cols
+                       else pa.string()) for c in columns])
+
+
+# ---------- 路徑 ----------
+def landed_files(tcode: str, pattern: str = "*", start=None, end=None, landing_dir=None) -> list[Path]:
+    """
+    landing 裡 tcode 的檔案（依分區日期、檔名排序）；pattern 比對 stem（例如 "ZRSSALE_D2*"）。
+    start / end：只取分區日期在範圍內的（含頭尾）。
+    """
+    root = Path(landing_dir or LANDING_DIR, f"tcode={tcode.upper()}")
+    if not root.is_dir():
+        return []
+    start = pd.Timestamp(start).date() if start is not None else None
+    end = pd.Timestamp(end).date() if end is not None else None
+    out = []
+    for part in sorted(root.iterdir()):
+        m = _PARTITION_RE.search(part.name)
+        if not m:
+            continue
+        day = date.fromisoformat(m.group(1))
+        if (start and day < start) or (end and day > end):
+            continue
+        out.extend(sorted(fp for fp in part.glob(f"{pattern}.*") if is_landed(fp)))
+    return out
+
+
+def landed_path(tcode: str, stem: str, landing_dir=None) -> Path | None:
+    """同一個匯出檔（stem）已經落地過 → 回傳路徑（好幾個分區都有時取日期最新的）。"""
+    found = landed_files(tcode, stem, landing_dir=landing_dir)
+    return found[-1] if found else None
+
+
+# ---------- 讀 ----------
+def iter_landed(fp, chunksize: int | None = None, columns=None) -> Iterator[pd.DataFrame]:
+    """逐批讀 landing 檔（Parquet 依 batch、Feather 依 record batch）；跟 iter_sap_export 一樣記一筆 "read"。"""
+    pa = _pyarrow()
+    if pa is None:
+        raise ImportError(f"讀 landing 檔 {Path(fp).name} 需要 pyarrow")
+    if Path(fp).suffix == ".parquet":
+        batches = (b.to_pandas() for b in pa.parquet.ParquetFile(fp).iter_batches(
+            batch_size=chunksize or DEFAULT_CHUNKSIZE, columns=columns))
+    else:
+        reader = pa.ipc.open_file(pa.memory_map(str(fp)))
+        batches = (reader.get_batch(i).to_pandas() for i in range(reader.num_record_batches))
+        if columns:
+            batches = (df[columns] for df in batches)
+    read_s, rows, ok = 0.0, 0, False
+    try:
+        while True:
+            t0 = time.perf_counter()
+            df = next(batches, None)
+            read_s += time.perf_counter() - t0
+            if df is None:
+                break
+            rows += len(df)
+            yield df
+        ok = True
+    finally:
+        record("read", read_s, rows=rows, nbytes=os.path.getsize(fp), ok=ok, file=Path(fp).name, landed=True)
+
+
+def iter_export(fp, tcode: str, chunksize: int | None = None, dtype=str, land: bool | None = None,
+                landing_dir=None) -> Iterator[pd.DataFrame]:
+    """
+    parse 函式統一用這個讀檔：
+      - fp 是 landing 檔 → 直接讀 Parquet / Feather（已經有型別）
+      - fp 是 SAP 匯出檔 → iter_sap_export + 轉型別；land=True（預設看 LANDING_ZONE）時同時寫一份到 landing，
+        整個檔案讀完才放進分區（讀到一半失敗不會留下半個檔）
+    要落地時一律用 dtype=str 讀（忽略呼叫端的 dtype）：不讓 pandas 逐塊猜型別，
+    schema 由 arrow_schema(spec) 決定，每一塊都一樣；呼叫端拿到的也就跟之後讀 landing 檔一樣。
+    """
+    tcode = tcode.upper()
+    if is_landed(fp):
+        yield from iter_landed(fp, chunksize)
+        return
+
+    spec = LANDING_SPECS[tcode]
+    land = LANDING_ENABLED if land is None else land
+    pa = _pyarrow() if land else None
+    if land and pa is None:
+        print("⚠️ 沒有安裝 pyarrow，略過 landing")
+    existing = landed_path(tcode, Path(fp).stem, landing_dir) if pa is not None else None
+    # 已經落地過就不重寫；快照（沒有日期欄，每天同一個檔名）只看今天的分區
+    if existing is not None and (spec.date_col or existing.parent.name == f"date={date.today().isoformat()}"):
+        pa = None
+    root = Path(landing_dir or LANDING_DIR, f"tcode={tcode}")
+    tmp = root / f".{Path(fp).stem}{LANDING_SUFFIXES[LANDING_FORMAT]}.part"
+    writer, schema, first_day, done = None, None, None, False
+    try:
+        for chunk in iter_sap_export(fp, chunksize=chunksize, dtype=str if pa is not None else dtype,
+                                     collapse_spaces=spec.collapse_spaces):
+            chunk = to_typed(chunk, spec)
+            if pa is not None:
+                if writer is None:
+                    root.mkdir(parents=True, exist_ok=True)
+                    schema = arrow_schema(chunk.columns, spec, pa)
+                    writer = (pa.parquet.ParquetWriter(tmp, schema, compression="zstd")
+                              if LANDING_FORMAT == "parquet" else
+                              pa.ipc.new_file(str(tmp), schema,
+                                              options=pa.ipc.IpcWriteOptions(compression="zstd")))
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+                if spec.date_col and spec.date_col in chunk.columns and chunk[spec.date_col].notna().any():
+                    day = chunk[spec.date_col].min().date()
+                    first_day = day if first_day is None else min(first_day, day)
+            yield chunk
+        done = True
+    finally:
+        if writer is not None:
+            writer.close()
+            if done:
+                part = root / f"date={(first_day or date.today()).isoformat()}"
+                part.mkdir(parents=True, exist_ok=True)
+                dest = part / f"{Path(fp).stem}{LANDING_SUFFIXES[LANDING_FORMAT]}"
+                os.replace(tmp, dest)
+                print(f"🛬 {Path(fp).name} 已落地：{dest}")
+            else:
+                tmp.unlink(missing_ok=True)
+
+
+def read_export(fp, tcode: str, **kwargs) -> pd.DataFrame:
+    """一次讀完（小檔 / ZMMIDR 這種要整份資料的）。"""
+    chunks = list(iter_export(fp, tcode, **kwargs))
+    if chunks:
+        return pd.concat(chunks, ignore_index=True)
+    if is_landed(fp):
+        return pd.DataFrame()
+    cols = read_sap_columns(fp, LANDING_SPECS[tcode.upper()].collapse_spaces)
+    return pd.DataFrame(columns=cols[1:])
+
+
+def land_file(fp, tcode: str, landing_dir=None) -> Path | None:
+    """只落地不做 ETL（例如把 processed/ 裡的歷史檔一次轉好）；回傳 landing 路徑。"""
+    for _ in iter_export(fp, tcode, land=True, landing_dir=landing_dir):
+        pass
+    return landed_path(tcode, Path(fp).stem, landing_dir)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="把 SAP 匯出檔（例如 processed/ 裡的歷史檔）轉進 landing zone")
+    parser.add_argument("tcode", choices=list(LANDING_SPECS))
+    parser.add_argument("files", nargs="+")
+    args = parser.parse_args()
+    for f in args.files:
+        print(f"{f} → {land_file(f, args.tcode)}")
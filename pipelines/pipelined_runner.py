@@ -0,0 +1,157 @@
+import os
+import queue
+import threading
+import time
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Callable, Sequence
+
+from ETL_SAP.pipelines.etl_utils import retry_call
+from ETL_SAP.common.instrument import record
+
+# ------------------------------------------------------------
+# 下載 → ETL 重疊執行（producer / consumer）：
+#   downloader 每匯出完一個檔案就呼叫 on_file(path)，
+#   FileFeed 把檔案交給對應的 ETL（run_etl_xxx(folder, files=feed)），
+#   ETL 在自己的 thread 裡邊收邊 parse / upsert，SAP 等待時間跟 SQL 上傳時間重疊。
+# 上一次沒處理完、還留在資料夾裡的檔案會先被送進去。
+# ETL 中途失敗：沒處理到的檔案留在原地，下載結束後再用一般模式（glob 資料夾）retry。
+# ------------------------------------------------------------
+
+_DONE = object()
+
+
+class FileFeed:
+    """一個 ETL 的檔案來源：put() 丟進新檔案，close() 之後 iteration 結束。"""
+
+    def __init__(self, folder, pattern: str):
+        self.folder = Path(folder)
+        self.pattern = pattern
+        self._q = queue.Queue()
+        # 建立時（下載開始前）就先掃：只會拿到上一次留下、已經寫完的檔案
+        self._leftover = sorted(self.folder.glob(pattern)) if self.folder.is_dir() else []
+
+    def matches(self, path) -> bool:
+        return fnmatch(Path(path).name, self.pattern)
+
+    def put(self, path) -> bool:
+        if not self.matches(path):
+            return False
+        self._q.put(Path(path))
+        return True
+
+    def close(self):
+        self._q.put(_DONE)
+
+    def __iter__(self):
+        seen = set()
+        # 先處理資料夾裡已經有的（上一次中斷留下來的）
+        for fp in self._leftover:
+            if fp.exists():
+                seen.add(fp.resolve())
+                yield fp
+        self._leftover = []
+        while (fp := self._q.get()) is not _DONE:
+            if fp.resolve() in seen or not fp.exists():
+                continue
+            seen.add(fp.resolve())
+            yield fp
+
+
+class Consumer:
+    """run_etl(folder, files=feed) 在背景 thread 跑；記錄開始 / 結束時間和錯誤。"""
+
+    def __init__(self, name: str, run_etl: Callable, folder, pattern: str):
+        self.name = name
+        self.run_etl = run_etl
+        self.folder = folder
+        # ETL thread 比 downloader 先開始，downloader 可能還沒建 EXPORT_DIR（例如先 sap_login 才 makedirs）
+        os.makedirs(folder, exist_ok=True)
+        self.feed = FileFeed(folder, pattern)
+        self.error = None
+        self.started = self.finished = None
+        self.thread = threading.Thread(target=self._run, name=f"{name}-etl", daemon=True)
+
+    def _run(self):
+        self.started = time.perf_counter()
+        try:
+            self.run_etl(self.folder, files=self.feed)
+        except Exception as e:
+            print(f"❌ {self.name} 邊下載邊上傳失敗：{e}（下載結束後重試）")
+            self.error = e
+            for _ in self.feed:        # 把 feed 收完，producer 不會卡住
+                pass
+        finally:
+            self.finished = time.perf_counter()
+            record("etl", self.finished - self.started, ok=self.error is None, error=self.error, etl=self.name)
+
+
+def run_pipelined(label: str, download: Callable, download_args: tuple, consumers: Sequence[tuple],
+                  download_kwargs: dict | None = None, on_download_done: Callable | None = None) -> dict:
+    """
+    download(*download_args, on_file=..., **download_kwargs)  用 retry_call 包，失敗會重試
+    consumers: [(name, run_etl, folder, pattern), ...]        例如 ("ZRSSALE_D2", run_etl_zrssale_D2, dir, "ZRSSALE_D2_*.txt")
+    on_download_done()：下載結束（成功或放棄）、開始等 ETL 之前呼叫，
+      DAG task 用它歸還 "sap" pool（dags/runner.release_pool），下一個 tcode 不用等這裡的 ETL 尾巴
+    回傳 {"label", "download_ok", "download_s", "etl_tail_s", "seconds", "etl": {name: {"seconds", "error"}}}
+      etl_tail_s = 下載結束之後 ETL 還多花的時間（完全重疊時接近 0）
+    """
+    t0 = time.perf_counter()
+    workers = [Consumer(*c) for c in consumers]
+    for w in workers:
+        w.thread.start()
+
+    def on_file(path):
+        for w in workers:
+            w.feed.put(path)
+
+    print(f"🔹 {label}：下載與 ETL 同時進行（{', '.join(w.name for w in workers)}）")
+    download_ok = False
+    try:
+        download_ok = bool(retry_call(download, args=download_args,
+                                      kwargs={**(download_kwargs or {}), "on_file": on_file},
+                                      name=f"{label} download"))
+    finally:
+        download_end = time.perf_counter()
+        record("download", download_end - t0, ok=download_ok, label=label)
+        for w in workers:
+            w.feed.close()
+        if on_download_done is not None:
+            on_download_done()
+        for w in workers:
+            w.thread.join()
+
+    # 邊下載邊上傳失敗的 ETL：用一般模式把資料夾裡剩下的檔案重跑
+    for w in workers:
+        if w.error is not None:
+            retry_start = time.perf_counter()
+            if retry_call(w.run_etl, args=(w.folder,), name=f"{w.name} ETL") is not False:
+                w.error = None
+            w.finished += time.perf_counter() - retry_start
+
+    end = time.perf_counter()
+    summary = {
+        "label": label,
+        "download_ok": download_ok,
+        "download_s": download_end - t0,
+        "etl_tail_s": end - download_end,
+        "seconds": end - t0,
+        "etl": {w.name: {"seconds": w.finished - w.started, "error": w.error} for w in workers},
+    }
+    print(f"⏱️ {label}：下載 {summary['download_s']:.1f}s，下載後 ETL 再 {summary['etl_tail_s']:.1f}s，"
+          f"合計 {summary['seconds']:.1f}s")
+    return summary
+
+
+def print_timing(summaries: Sequence[dict], title: str = "Sales"):
+    """整條 chain 的端到端耗時表（run_all_template 最後印）。"""
+    if not summaries:
+        return
+    print(f"\n⏱️ {title} 端到端耗時：")
+    print(f"   {'step':<12}{'download(s)':>13}{'etl tail(s)':>13}{'total(s)':>10}  status")
+    for s in summaries:
+        problems = ([] if s["download_ok"] else ["download 未完成"]) + \
+            [f"{name} ETL 失敗" for name, e in s["etl"].items() if e["error"] is not None]
+        status = "、".join(problems) or "ok"
+        print(f"   {s['label']:<12}{s['download_s']:>13.1f}{s['etl_tail_s']:>13.1f}{s['seconds']:>10.1f}  {status}")
+    print(f"   {'total':<12}{'':>13}{'':>13}{sum(s['seconds'] for s in summaries):>10.1f}")
@@ -0,0 +1,73 @@
+import os
+import time
+import pandas as pd
+from typing import Iterator
+from ETL_SAP.common.instrument import record
+
+# SAP「Text with Tabs」匯出格式：
+#   第 1~2 行：報表標題 / 空行（preamble）
+#   第 3 行  ：欄位名稱，最前面多一個空白欄
+#   之後     ：資料列，每列最前面同樣是空白欄
+SAP_PREAMBLE_LINES = 2
+DEFAULT_CHUNKSIZE = int(os.getenv("SAP_READ_CHUNKSIZE", 200_000))
+
+
+def read_sap_columns(fp, collapse_spaces: bool = False, encoding: str | None = None) -> list[str]:
+    """只讀 header 那一行，回傳整理好的欄位名稱（含最前面的空白欄）。"""
+    header = pd.read_csv(fp, sep="\t", skiprows=SAP_PREAMBLE_LINES, nrows=0, encoding=encoding)
+    cols = header.columns.str.strip()
+    if collapse_spaces:
+        cols = cols.str.replace(r"\s+", " ", regex=True)
+    return cols.tolist()
+
+
+def iter_sap_export(
+    fp,
+    chunksize: int | None = None,
+    dtype=str,
+    collapse_spaces: bool = False,
+    encoding: str | None = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    逐塊讀取 SAP 匯出的 tab 分隔檔，每塊最多 chunksize 列。
+    header / preamble 只處理一次；空白首欄在解析時就略過，不會被載入。
+    記憶體用量只跟 chunksize 有關，跟檔案大小無關。
+    讀檔時間（不含呼叫端處理每塊的時間）、列數、檔案大小記成一筆 "read" stage。
+    """
+    t0 = time.perf_counter()
+    cols = read_sap_columns(fp, collapse_spaces=collapse_spaces, encoding=encoding)
+    reader = pd.read_csv(
+        fp,
+        sep="\t",
+        skiprows=SAP_PREAMBLE_LINES + 1,     # preamble + header
+        header=None,
+        names=cols,
+        usecols=cols[1:],                    # 去掉空白首欄
+        dtype=dtype,
+        encoding=encoding,
+        chunksize=chunksize or DEFAULT_CHUNKSIZE,
+        low_memory=False,
+    )
+    read_s, rows, ok = time.perf_counter() - t0, 0, False
+    try:
+        with reader:
+            while True:
+                t0 = time.perf_counter()
+                chunk = next(reader, None)
+                read_s += time.perf_counter() - t0
+                if chunk is None:
+                    break
+                rows += len(chunk)
+                yield chunk
+        ok = True
+    finally:
+        record("read", read_s, rows=rows, nbytes=os.path.getsize(fp), ok=ok, file=os.path.basename(fp))
+
+
+def read_sap_export(fp, **kwargs) -> pd.DataFrame:
+    """一次讀完整個檔案（小檔或需要整份資料時用）。"""
+    chunks = list(iter_sap_export(fp, **kwargs))
+    if not chunks:
+        cols = read_sap_columns(fp, kwargs.get("collapse_spaces", False), kwargs.get("encoding"))
+        return pd.DataFrame(columns=cols[1:])
+    return pd.concat(chunks, ignore_index=True)
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+# 去掉符號、逗號之後必須是純數字（可含小數點；Excel 轉字串可能出現 1e-05）
+_MAGNITUDE = r"(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?"
+# 負號只能一個：前面（-1234）或尾巴（1234-）
+_SIGNED = rf"-?{_MAGNITUDE}|{_MAGNITUDE}-"
+
+
+def parse_sap_number(col: pd.Series) -> pd.Series:
+    """
+    SAP 數字欄位 → float64，整欄向量化處理（不逐格呼叫 Python 函式）：
+      '1,234.50' → 1234.5      千分位逗號
+      '1,234-'   → -1234.0     尾巴負號（'-1234' 也照樣支援）
+      '' / '-' / 空白 / NaN / 非數字 → NaN
+      '-5-' / '--5' / '5--'  → NaN     負號只能有一個（前面或尾巴），不會變成正數
+    已經是數值型別的欄位直接轉 float64；Excel 讀進來的混合欄位先轉字串再解析。
+    """
+    if pd.api.types.is_numeric_dtype(col) and not pd.api.types.is_bool_dtype(col):
+        return col.astype("float64")
+
+    s = col.astype(str).str.strip().str.replace(",", "", regex=False)
+    # 只有格式正確的才 astype(float)，避免 to_numeric(errors="coerce") 對每個壞值丟例外
+    valid = s.str.fullmatch(_SIGNED).fillna(False).astype(bool).to_numpy()
+    good = s[valid]
+    out = np.full(len(s), np.nan)
+    out[valid] = good.str.strip("-").astype("float64").to_numpy()
+
+    # 格式正確的值最多只有一個負號（前面或尾巴）
+    negative = (good.str.startswith("-") | good.str.endswith("-")).to_numpy(dtype=bool)
+    out[np.flatnonzero(valid)[negative]] *= -1
+    return pd.Series(out, index=col.index, name=col.name)
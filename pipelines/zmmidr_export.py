@@ -0,0 +1,24 @@
+import pandas as pd
+
+from ETL_SAP.pipelines.landing_zone import read_export, LANDING_SPECS
+from ETL_SAP.pipelines.sap_numbers import parse_sap_number
+
+# ------------------------------------------------------------
+# ZMMIDR（BUn / OUn / 乾貨）共用的讀檔清洗：
+#   Text with Tabs 匯出（或 landing 的 Parquet / Feather）→ 去掉合計列、Article No 去前導 0、數字欄轉 float
+# 各 ETL 只留自己的部分（DC / Region / Dept 欄位、encode_keys 等）。
+# ------------------------------------------------------------
+
+# Text with Tabs 匯出裡數字都是 SAP 顯示格式（1,234.000-），讀進來先轉 float；跟 landing 的 spec 同一份
+ZMMIDR_NUMBER_COLS = LANDING_SPECS["ZMMIDR"].number_cols
+
+
+def read_zmmidr_export(fp) -> pd.DataFrame:
+    """SAP 匯出用 streaming reader 讀（不開 Excel，全部欄位先當字串）；.txt 或 landing 檔都可以。"""
+    df = read_export(fp, "ZMMIDR")
+    df = df[df['Article No'].str.strip().fillna('') != ''].copy()   # 刪除合計列（沒有 Article No）
+    df['Article No'] = df['Article No'].str.strip().str.lstrip('0')
+    for col in ZMMIDR_NUMBER_COLS:
+        if col in df.columns:
+            df[col] = parse_sap_number(df[col])
+    return df
@@ -15,6 +15,11 @@ from ETL_SAP.sap_scripts.downloader_zrssale import download_zrssale
 from ETL_SAP.pipelines.etl_zrssale import run_etl_zrssale_D2, run_etl_zrssale_D3
 from ETL_SAP.pipelines.etl_StoreRP import run_etl_storeRP
 from ETL_SAP.sap_scripts.downloader_storeRP import download_storeRP
+from ETL_SAP.dags.sales_dag import build_sales_dag, print_sales_timing
+from ETL_SAP.common.config import dispose_sql_engines
+from ETL_SAP.common.staging import drop_run_staging
+from ETL_SAP.common.retry import print_retry_report
+from ETL_SAP.common.instrument import print_run_summary
 
 from dotenv import load_dotenv
 
@@ -34,22 +39,11 @@ if __name__ == "__main__":
 
     '''Sales''' 
 
-    if retry_call(download_zmb51, args=(os.getenv("DATE_FILE_ZMB51"), os.getenv("EXPORT_DIR_ZMB51"))):
-        retry_call(run_etl_zmb51, args=(os.getenv("EXPORT_DIR_ZMB51"),))
+    # ZMB51 / ZSTPROMO 互相獨立，weekly_sales 等兩個都完成：相依和平行交給 dags/sales_dag
+    # （每個 task 都是下載 + ETL 重疊；部分重跑：python -m ETL_SAP.dags.sales_dag --resume / --only zmb51）
+    print_sales_timing(build_sales_dag().run())
 
-    if retry_call(download_zstpromo, args=(os.getenv("DATE_FILE_ZSTPROMO"), os.getenv("EXPORT_DIR_ZSTPROMO"))):
-        retry_call(run_etl_zstpromo, args=(os.getenv("EXPORT_DIR_ZSTPROMO"),))
-
-    
-    # try:
-    #     retry_call(run_etl_weekly_sales, args=(202541, 202541))
-    # except Exception as e:
-    #     print(f"Error exporting to Excel: {e}")
-
-
-    # if retry_call(download_zrssale, args=(os.getenv("DATE_FILE_WALONG_SALES"), os.getenv("EXPORT_DIR_ZRSSALE"))):
-    #     retry_call(run_etl_zrssale_D2, args=(os.getenv("EXPORT_DIR_ZRSSALE"),))
-    #     retry_call(run_etl_zrssale_D3, args=(os.getenv("EXPORT_DIR_ZRSSALE"),))
+    # weekly_sales / zrssale 已經是 sales DAG 的 task（兩個都預設不跑：--only weekly_sales / --only zrssale）
 
     '''Article Master File''' 
 
@@ -64,4 +58,8 @@ if __name__ == "__main__":
 
 
 
+    print_retry_report()    # 哪些步驟重試過、等了多久、最後為什麼放棄
+    print_run_summary()     # 各階段（sap.* / read / parse / clean / staging_write / merge）耗時，logs/runs/<run_id>.jsonl
+    drop_run_staging()      # STAGING_MODE=run 時，刪掉本次 run 建的暫存表
+    dispose_sql_engines()   # 所有 pipeline 共用同一個連線池，最後統一關閉
     print("\n所有 ETL pipelines 執行完成！")
\ No newline at end of file
@@ -2,9 +2,7 @@ import os
 import time
 import pandas as pd
 import datetime
-import pyperclip
 from requests import session
-import win32com.client
 from ETL_SAP.sap_scripts.sap_utils import *
 from ETL_SAP.sap_scripts.login import sap_login
 from dotenv import load_dotenv
@@ -50,10 +48,7 @@ def run_storeRP_query(session, site_range_type, export_dir, filename):
             }
         }[site_range_type]
 
-        time.sleep(1)
-        session.findById("wnd[0]/tbar[0]/okcd").text = "ZMACHK"
-        session.findById("wnd[0]").sendVKey(0)
-        time.sleep(1)
+        run_tcode(session, "ZMACHK", ready_id="wnd[0]/usr/ctxtMATNR-LOW")
         
         # Article 範圍
         session.findById("wnd[0]/usr/ctxtMATNR-LOW").text = article_info["low"]
@@ -75,20 +70,16 @@ def run_storeRP_query(session, site_range_type, export_dir, filename):
         wait_for_export_menu(session)
 
         session.findById("wnd[0]/mbar/menu[0]/menu[3]/menu[1]").select()
-        time.sleep(1)
-        session.findById("wnd[1]/usr/ctxtDY_PATH").text = export_dir
+        find(session, "wnd[1]/usr/ctxtDY_PATH").text = export_dir
         session.findById("wnd[1]/usr/ctxtDY_FILENAME").text = filename
         session.findById("wnd[1]/tbar[0]/btn[11]").press()  # 用覆蓋存檔的按鈕
         print(f"✅ 匯出完成：{filename}")
         close_exported_excel(filename)
 
         print(f"✅ 成功匯出：{os.path.join(export_dir, filename)}")
-        time.sleep(1)
 
         # 返回主畫面
-        session.findById("wnd[0]/tbar[0]/okcd").text = "/n"
-        session.findById("wnd[0]").sendVKey(0)
-        time.sleep(1)
+        run_tcode(session, "/n")
         
         return True
     
@@ -4,8 +4,6 @@ import os
 import time
 import pandas as pd
 import datetime
-import pyperclip
-import win32com.client
 from ETL_SAP.sap_scripts.sap_utils import *
 from ETL_SAP.sap_scripts.login import sap_login
 from dotenv import load_dotenv
@@ -18,13 +16,10 @@ def run_zmmidr_query(session, dc_code, dept_code, period_str, export_dir, filena
     """執行 ZMMIDR 查詢並匯出結果"""
     try:
         print(f"🟡 開始查詢 {dc_code}")
-        session.findById("wnd[0]/tbar[0]/okcd").text = "ZMMIDR"
-        session.findById("wnd[0]").sendVKey(0)
-        time.sleep(2)
+        run_tcode(session, "ZMMIDR", ready_id="wnd[0]/usr/ctxtS_WERKS-LOW")
 
         session.findById("wnd[0]/usr/ctxtS_WERKS-LOW").text = dc_code
         session.findById("wnd[0]/usr/ctxtP_MON").text = period_str
-        time.sleep(1)
 
         session.findById("wnd[0]/usr/ctxtS_MATKL-LOW").text = f"{dept_code}00000"
         if dept_code != 103:
@@ -38,22 +33,13 @@ def run_zmmidr_query(session, dc_code, dept_code, period_str, export_dir, filena
         print(f"等待查詢結果...")
         wait_for_table(session, "wnd[0]/usr/cntlGRID1/shellcont/shell/shellcont[1]/shell", timeout=1800)     # 30 分鐘
         select_layout(session, "AC-ZMMIDR")
-        wait_for_export_menu(session)
-
-        session.findById("wnd[0]/mbar/menu[0]/menu[3]/menu[1]").select()
-        time.sleep(1)
-        session.findById("wnd[1]/usr/ctxtDY_PATH").text = export_dir
-        session.findById("wnd[1]/usr/ctxtDY_FILENAME").text = filename
-
-        session.findById("wnd[1]/tbar[0]/btn[11]").press()  # 用覆蓋存檔的按鈕
 
+        # Text with Tabs 直接存檔：不會開 Excel，ETL 用 sap_export_reader 讀
+        export_local_file(session, export_dir, filename)
         print(f"✅ 匯出完成：{filename}")
-        close_exported_excel(filename)
 
         # 回到主畫面
-        session.findById("wnd[0]/tbar[0]/okcd").text = "/n"
-        session.findById("wnd[0]").sendVKey(0)
-        time.sleep(1)
+        run_tcode(session, "/n")
 
         return True
 
@@ -130,7 +116,7 @@ def download_zmmidr_BUn(EXPORT_DIR):
                 continue
         
             # 建立合法檔名
-            filename = f"Zmmidr_bun_{done_key}.xlsx"
+            filename = f"Zmmidr_bun_{done_key}.txt"
             success = safe_query(
                 session=session,
                 dept_code=dept_code,
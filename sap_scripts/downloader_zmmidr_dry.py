@@ -4,28 +4,21 @@ import os
 import time
 import pandas as pd
 import datetime
-import pyperclip
-import win32com.client
 from ETL_SAP.sap_scripts.sap_utils import *
 # from ETL_SAP.sap_scripts.sap_utils import get_multiple_sessions, wait_for_table, wait_for_export_menu, close_exported_excel
 
 # === 查詢函式 ===
-def run_zmmidr_query(session, dc_code, period_str, mch_text, EXPORT_DIR):
-    """執行 ZMMIDR 查詢並匯出結果"""
+def run_zmmidr_query(session, dc_code, period_str, mch_file, EXPORT_DIR):
+    """執行 ZMMIDR 查詢並匯出結果（Text with Tabs，不經過 Excel）"""
     try:
         print(f"🟡 開始查詢 {dc_code}")
-        session.findById("wnd[0]/tbar[0]/okcd").text = "ZMMIDR"
-        session.findById("wnd[0]").sendVKey(0)
-        time.sleep(2)
+        run_tcode(session, "ZMMIDR", ready_id="wnd[0]/usr/ctxtS_WERKS-LOW")
 
         session.findById("wnd[0]/usr/ctxtS_WERKS-LOW").text = dc_code
         session.findById("wnd[0]/usr/ctxtP_MON").text = period_str
         session.findById("wnd[0]/usr/btn%_S_MATKL_%_APP_%-VALU_PUSH").press()
-        time.sleep(1)
 
-        pyperclip.copy(mch_text)
-        session.findById("wnd[1]/tbar[0]/btn[24]").press()
-        time.sleep(1)
+        upload_selection_file(session, mch_file)                 # MCH 清單從檔案上傳，不用剪貼簿
         session.findById("wnd[1]/tbar[0]/btn[8]").press()
 
         session.findById("wnd[0]/usr/radP_OUNIT").select()
@@ -33,22 +26,13 @@ def run_zmmidr_query(session, dc_code, period_str, mch_text, EXPORT_DIR):
         print(f"⌛ 等待查詢結果...")
 
         wait_for_table(session)
-        wait_for_export_menu(session)
-
-        session.findById("wnd[0]/mbar/menu[0]/menu[3]/menu[1]").select()
-        time.sleep(1)
-        filename = f"Zmmidr_{dc_code}.xlsx"
-        session.findById("wnd[1]/usr/ctxtDY_PATH").text = EXPORT_DIR
-        session.findById("wnd[1]/usr/ctxtDY_FILENAME").text = filename
-        session.findById("wnd[1]/tbar[0]/btn[0]").press()
 
+        filename = f"Zmmidr_{dc_code}.txt"
+        export_local_file(session, EXPORT_DIR, filename)
         print(f"✅ 匯出完成：{filename}")
-        close_exported_excel(filename)
 
         # 回到主畫面
-        session.findById("wnd[0]/tbar[0]/okcd").text = "/n"
-        session.findById("wnd[0]").sendVKey(0)
-        time.sleep(1)
+        run_tcode(session, "/n")
 
     except Exception as e:
         print(f"❌ D/C {dc_code} 發生錯誤：{e}")
@@ -57,8 +41,7 @@ def run_zmmidr_query(session, dc_code, period_str, mch_text, EXPORT_DIR):
 def download_zmmidr_all(MCH_FILE, EXPORT_DIR):
 
     # === SAP GUI session ===
-    sap_gui = win32com.client.GetObject("SAPGUI")
-    application = sap_gui.GetScriptingEngine
+    application = get_scripting_engine()
     session = application.Children(0).Children(0)
     print("✅ 已連接 SAP GUI")
 
@@ -68,16 +51,16 @@ def download_zmmidr_all(MCH_FILE, EXPORT_DIR):
     if not os.path.exists(EXPORT_DIR):
         os.makedirs(EXPORT_DIR)
 
-    # === 載入 MCH 並轉為文字 ===
+    # === 載入 MCH，寫成上傳用的文字檔（每個 D/C 共用一份）===
     mch_df = pd.read_excel(MCH_FILE, sheet_name="CM", header=1)
     mch_df = mch_df[mch_df['Dept - EN'] == 'Dry Grocery']
     mch_list = mch_df["MCH"].dropna().astype(str).tolist()
-    mch_text = "\r\n".join(mch_list)
+    mch_file = write_selection_file(mch_list, os.path.join(EXPORT_DIR, "upload", "MCH_Dry_Grocery.txt"))
     period_str = datetime.datetime.today().strftime("%m/%Y")
 
     # === 逐個執行所有 D/C ===
     for dc_code in DC_CODES:
-        run_zmmidr_query(session, dc_code, period_str, mch_text, EXPORT_DIR)
+        run_zmmidr_query(session, dc_code, period_str, mch_file, EXPORT_DIR)
 
     print("🎉 所有 D/C 查詢與匯出已完成")
 
@@ -98,8 +81,7 @@ if __name__ == "__main__":
 # import time
 # import pandas as pd
 # import datetime
-# import pyperclip
-# import win32com.client
+# # import win32com.client
 # from ETL_SAP.sap_scripts.sap_utils import get_multiple_sessions, wait_for_table, wait_for_export_menu
 
 
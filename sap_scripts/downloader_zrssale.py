@@ -2,14 +2,16 @@ import os
 import time
 import pandas as pd
 import datetime
-import pyperclip
-import win32com.client
 from ETL_SAP.sap_scripts.sap_utils import *
 from ETL_SAP.sap_scripts.login import sap_login
+from ETL_SAP.sap_scripts.session_pool import SAP_SESSIONS
+from ETL_SAP.sap_scripts.range_planner import get_planner, download_ranges, SplitRange
 from dotenv import load_dotenv
 
 load_dotenv()
 
+ZRSSALE_TIMER = StepTimer("ZRSSALE")   # 每次查詢各步驟耗時，download 結束時印出
+
 
 # =========單次查詢函式 ==========
 
@@ -31,10 +33,8 @@ def run_zrssale_query(session, start_date, end_date, site_range_type, export_dir
                 
         print(f"🟡 查詢 {site_range_type}: {start_date} ~ {end_date}")
 
-        time.sleep(1)
-        session.findById("wnd[0]/tbar[0]/okcd").text = "ZRSSALE"
-        session.findById("wnd[0]").sendVKey(0)
-        time.sleep(1)
+        ZRSSALE_TIMER.start()
+        run_tcode(session, "ZRSSALE", ready_id="wnd[0]/usr/ctxtVTWEG")
 
         # Site 範圍
         session.findById("wnd[0]/usr/ctxtVTWEG").text = site_range_type
@@ -49,10 +49,14 @@ def run_zrssale_query(session, start_date, end_date, site_range_type, export_dir
         # session.findById("wnd[0]/usr/ctxtFKDAT-LOW").text = "06/01/2025"
         # session.findById("wnd[0]/usr/ctxtFKDAT-HIGH").text = "06/02/2025"
 
-        # 執行查詢
-        session.findById("wnd[0]").sendVKey(8)
-        # 避免查詢卡死
-        wait_for_table(session, timeout=2400)   # 40 分鐘
+        ZRSSALE_TIMER.lap("selection")
+
+        # 執行查詢（記錄秒數 / 列數給 range planner；逾時 → SplitRange 切半重排）
+        with get_planner().track("ZRSSALE", site_range_type, start_date, end_date) as q:
+            session.findById("wnd[0]").sendVKey(8)
+            # 避免查詢卡死
+            q["rows"] = wait_for_table(session, timeout=get_planner().timeout).RowCount   # 預設 40 分鐘
+        ZRSSALE_TIMER.lap("query")
         # wait_for_export_menu_for_local_file(session)
 
         # 等待查詢結果
@@ -67,22 +71,22 @@ def run_zrssale_query(session, start_date, end_date, site_range_type, export_dir
         session.findById("wnd[1]/usr/ctxtDY_FILENAME").text      = filename
         session.findById("wnd[1]/usr/ctxtDY_FILE_ENCODING").text = "4110"
         # session.findById("wnd[1]/tbar[0]/btn[0]").press()        # Save
-        time.sleep(2)
-        session.findById("wnd[1]/tbar[0]/btn[11]").press()  # 用覆蓋存檔的按鈕
+        find(session, "wnd[1]/tbar[0]/btn[11]").press()  # 用覆蓋存檔的按鈕
 
         full_path = os.path.join(export_dir, filename)
         wait_for_file(full_path)
-        time.sleep(2)
+        ZRSSALE_TIMER.lap("export")
 
         print(f"✅ 成功匯出：{os.path.join(export_dir, filename)}")
 
         # 返回主畫面
-        session.findById("wnd[0]/tbar[0]/okcd").text = "/n"
-        session.findById("wnd[0]").sendVKey(0)
-        time.sleep(1)
+        run_tcode(session, "/n")
+        ZRSSALE_TIMER.lap("back")
         
         return True
 
+    except SplitRange:
+        raise
     except Exception as e:
         raise RuntimeError(f"{start_date}~{end_date} {site_range_type} 執行查詢函式 run_zmb51_query 時發生錯誤：{e}")
 
@@ -97,6 +101,8 @@ def safe_query(session, start_date, end_date, site_range_type, export_dir, filen
                 return True, session  # 成功查詢與匯出
             else:
                 raise Exception("Safe Query Error: Query did not complete successfully")
+        except SplitRange:
+            raise
         except Exception as e:
             print(f"⚠️ {site_range_type} 第 {attempt} 次查詢失敗：{e}")
             log_error("zmb51", str(e), start=start_date, end=end_date, site_range=site_range_type)
@@ -107,16 +113,20 @@ def safe_query(session, start_date, end_date, site_range_type, export_dir, filen
                 print("🔁 已重新登入 SAP")
             except Exception as login_err:
                 log_error("zmb51", f"Login Failed: {login_err}", start=start_date, end=end_date, site_range=site_range_type)
-                return False
+                return False, session
             
-    return False
+    return False, session
 
 
 
 # ========== 主流程 ==========
-def download_zrssale(DATE_FILE, EXPORT_DIR):
+def download_zrssale(DATE_FILE, EXPORT_DIR, n_sessions=None, on_file=None):
+    """
+    n_sessions > 1（或 env SAP_SESSIONS）→ 用 SessionPool 多個 session 平行查詢。
+    查詢區間由 range_planner 依歷史調整（SAP_ADAPTIVE_RANGES=0 → 照 DATE_FILE 的週）。
+    on_file(path)：每個檔案匯出完成就呼叫（pipelined_runner 拿來邊下載邊跑 ETL）。
+    """
 
-    session = sap_login()
     if not os.path.exists(EXPORT_DIR):
         os.makedirs(EXPORT_DIR)
 
@@ -128,6 +138,7 @@ def download_zrssale(DATE_FILE, EXPORT_DIR):
         dates_df[col] = pd.to_datetime(dates_df[col], errors='coerce').dt.strftime('%m/%d/%Y')
     dates_df = dates_df.dropna(subset=['Start', 'End'])
 
+    weeks = {"D2": [], "D3": []}
     for _, row in dates_df.iterrows():
 
         for site_range_type in [
@@ -139,29 +150,47 @@ def download_zrssale(DATE_FILE, EXPORT_DIR):
             end_date = row["End"]
 
             done_key = f"{site_range_type}_{start_date}_{end_date}"
-            filename = f"ZRSSALE_{done_key.replace('/', '')}.txt"
-            file_path = os.path.join(EXPORT_DIR, filename)
-
 
             # 檢查是否已完成
             if is_already_done(f"zrssale_{site_range_type}", done_key):
                 print(f"✅ 已完成：{done_key}，略過")
                 continue
 
-            success, session = safe_query(
-                session=session,
-                start_date=start_date,
-                end_date=end_date,
-                site_range_type=site_range_type,
-                export_dir=EXPORT_DIR,
-                filename=filename
-            )
-            
-            if success:
-                record_done(f"zrssale_{site_range_type}", done_key)
-            else:
-                print(f"❌ 主流程 download_zrssale發生錯誤，中斷於：{done_key}，將於下次重新執行時繼續查詢")
-                return
+            weeks[site_range_type].append((start_date, end_date, done_key))
+
+    # range planner 依查詢歷史合併 / 切開區間；檔名用實際查詢的區間
+    def filename(job):
+        return f"ZRSSALE_{job.site}_{job.start}_{job.end}".replace("/", "") + ".txt"
+
+    def exported(job):
+        if on_file:
+            on_file(os.path.join(EXPORT_DIR, filename(job)))
+
+    def query(session, job):
+        ok = run_zrssale_query(session, job.start, job.end, job.site, EXPORT_DIR, filename(job))
+        if ok:
+            exported(job)
+        return ok
+
+    def serial_query(session, job):
+        ok, session = safe_query(session, job.start, job.end, job.site, EXPORT_DIR, filename(job))
+        if ok:
+            exported(job)
+        return ok, session
+
+    def failed(job, error):
+        log_error("zrssale", str(error), start=job.start, end=job.end, site_range=job.site)
+
+    success = download_ranges(
+        "ZRSSALE", weeks, query, serial_query,
+        on_done=lambda site, done_key: record_done(f"zrssale_{site}", done_key),
+        on_failure=failed,
+        n_sessions=n_sessions or SAP_SESSIONS,
+    )
+    ZRSSALE_TIMER.report()
+    if not success:
+        print("❌ 主流程 download_zrssale 未全部完成，將於下次重新執行時繼續查詢")
+        return
 
     print("🎉 ZRSSALE 所有查詢與匯出已完成")
     return True
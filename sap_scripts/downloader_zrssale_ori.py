@@ -2,8 +2,6 @@ import os
 import time
 import pandas as pd
 import datetime
-import pyperclip
-import win32com.client
 from ETL_SAP.sap_scripts.sap_utils import *
 from ETL_SAP.sap_scripts.login import sap_login
 from dotenv import load_dotenv
@@ -17,10 +15,7 @@ def run_zrssale_query(session, start_date, end_date, site_range_type, export_dir
     try:
         print(f"🟡 查詢 {site_range_type}: {start_date} ~ {end_date}")
 
-        time.sleep(1)
-        session.findById("wnd[0]/tbar[0]/okcd").text = "ZRSSALE"
-        session.findById("wnd[0]").sendVKey(0)
-        time.sleep(1)
+        run_tcode(session, "ZRSSALE", ready_id="wnd[0]/usr/ctxtVTWEG")
 
         # Site 範圍
         session.findById("wnd[0]/usr/ctxtVTWEG").text = site_range_type
@@ -53,19 +48,15 @@ def run_zrssale_query(session, start_date, end_date, site_range_type, export_dir
         session.findById("wnd[1]/usr/ctxtDY_FILENAME").text      = filename
         session.findById("wnd[1]/usr/ctxtDY_FILE_ENCODING").text = "4110"
         # session.findById("wnd[1]/tbar[0]/btn[0]").press()        # Save
-        time.sleep(2)
-        session.findById("wnd[1]/tbar[0]/btn[11]").press()  # 用覆蓋存檔的按鈕
+        find(session, "wnd[1]/tbar[0]/btn[11]").press()  # 用覆蓋存檔的按鈕
 
         full_path = os.path.join(export_dir, filename)
         wait_for_file(full_path)
-        time.sleep(2)
 
         print(f"✅ 成功匯出：{os.path.join(export_dir, filename)}")
 
         # 返回主畫面
-        session.findById("wnd[0]/tbar[0]/okcd").text = "/n"
-        session.findById("wnd[0]").sendVKey(0)
-        time.sleep(1)
+        run_tcode(session, "/n")
         
         return True
 
@@ -2,7 +2,6 @@ import os
 import time
 import pandas as pd
 import datetime
-import win32com.client
 from ETL_SAP.sap_scripts.sap_utils import *
 from ETL_SAP.sap_scripts.login import sap_login
 from dotenv import load_dotenv
@@ -13,8 +12,7 @@ load_dotenv()
 def run_zstpromo_query(session, start_date, end_date, export_path, export_dir, filename):
     try:
         print(f"🟡 查詢 ZSTPROMO: {start_date} ~ {end_date}")
-        session.findById("wnd[0]/tbar[0]/okcd").text = "ZSTPROMO"
-        session.findById("wnd[0]").sendVKey(0)
+        run_tcode(session, "ZSTPROMO", ready_id="wnd[0]/usr/ctxtVKORG-LOW")
         session.findById("wnd[0]").maximize()
 
         # 輸入條件
@@ -70,16 +68,13 @@ def run_zstpromo_query(session, start_date, end_date, export_path, export_dir, f
         session.findById("wnd[1]/usr/ctxtDY_FILENAME").text      = filename
         session.findById("wnd[1]/usr/ctxtDY_FILE_ENCODING").text = "4110"
         # session.findById("wnd[1]/tbar[0]/btn[0]").press()        # Save
-        time.sleep(2)
-        session.findById("wnd[1]/tbar[0]/btn[11]").press()  # 用覆蓋存檔的按鈕
+        find(session, "wnd[1]/tbar[0]/btn[11]").press()  # 用覆蓋存檔的按鈕
 
         wait_for_file(export_path)
         print(f"✅ 匯出完成：{export_path}")
 
         # 返回主畫面
-        session.findById("wnd[0]/tbar[0]/okcd").text = "/n"
-        session.findById("wnd[0]").sendVKey(0)
-        time.sleep(1)
+        run_tcode(session, "/n")
 
         return True
 
@@ -107,7 +102,8 @@ def safe_query(session, start_date, end_date, export_path, EXPORT_DIR, filename,
     return False
 
 
-def download_zstpromo(DATE_FILE, EXPORT_DIR):
+def download_zstpromo(DATE_FILE, EXPORT_DIR, on_file=None):
+    """on_file(path)：每個檔案匯出完成就呼叫（pipelined_runner 拿來邊下載邊跑 ETL）。"""
     session = sap_login()
     if not os.path.exists(EXPORT_DIR):
         os.makedirs(EXPORT_DIR)
@@ -132,6 +128,8 @@ def download_zstpromo(DATE_FILE, EXPORT_DIR):
         success, session = safe_query(session, start_date, end_date, export_path, EXPORT_DIR, filename)
         if success:
             record_done("zstpromo", done_key)
+            if on_file:
+                on_file(export_path)
         else:
             print(f"❌ 中斷於：{done_key}，將於下次重新執行時繼續查詢")
             return
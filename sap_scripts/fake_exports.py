@@ -0,0 +1,204 @@
+import numpy as np
+import pandas as pd
+
+# ------------------------------------------------------------
+# 假的 SAP「Text with Tabs」匯出檔（fake_gui 存檔時用，也給 benchmark 產測試資料）
+#   格式跟真的一樣：第 1 行報表標題、第 2 行空行、第 3 行欄位名稱，
+#   每一行最前面一個空白欄；日期 MM/DD/YYYY，數字有千分位、負數是尾巴負號（1,234.50-）
+#   欄位名稱 = 各 ETL rename 之前看到的原始名稱
+# ------------------------------------------------------------
+
+EXPORT_COLUMNS = {
+    "ZMB51": ["Site", "Article", "Article Description", "MvT", "Cost Ctr", "Art. Doc.", "Item",
+              "Pstng Date", "Quantity i", "BUn", "Amount LC", "Crcy"],
+    "ZSTPROMO": ["SOrg.", "Payer", "Bill.Doc.", "Item", "Bill. Date", "Article", "Description",
+                 "Bill.qty", "SU", "Sales Amou", "Cost", "Curr."],
+    "ZRSSALE": ["SOrg.", "Sold-to", "Ship-to", "Payer", "Name 1", "Bill.Doc.", "Bill. Date", "Item",
+                "Article", "Description", "Mdse Cat.", "Bill.qty", "SU", "BillQtySKU", "Sales Amou",
+                "Curr.", "SAP Tax", "Cost", "AAGM", "Sales Doc.", "SOType", "ArtTax", "ArtCRV",
+                "CRVDesc", "Site", "Ship-to st", "Ship-to Ci", "DChl", "ItCa", "PsSt", "TaxRate %",
+                "CRVRate", "Net", "Reg", "Search Ter", "Postal Cod", "N Weight", "IncoT", "Inco. 2",
+                "MTyp", "Descript.", "Discount", "WSale", "Customer", "POS Tax", "Net Sale", "Tx"],
+    # 兩個 Article Description（英 / 中），讀進來第二個會變成 "Article Description.1"
+    "ZMMIDR": ["Article No", "Article Description", "Article Description", "MCH", "Pack size", "Unit",
+               "D/C MAP", "Unrestricted-Use Stock", "Allocation Qty", "On order Stock",
+               "Unrestricted Stock Value", "PTD MVMT", "YTD MVMT", "SCA Assortment", "Assortment grade",
+               "Asrt.Grade Description"],
+}
+
+# ZRSSALE 各通路的欄位名稱差異（對應 etl_zrssale 的 pre_renames / extra_renames）
+ZRSSALE_VARIANTS = {
+    "D2": {"Net": "Net Value"},
+    "D3": {"Ship-to Ci": "Ship-to City"},
+}
+
+REPORT_TITLES = {
+    "ZMB51": "Material Document List",
+    "ZSTPROMO": "Store Promotion Sales",
+    "ZRSSALE": "Retail Sales Report",
+    "ZMMIDR": "D/C Inventory Report",
+}
+
+
+def sap_number(values, decimals=3) -> pd.Series:
+    """數字 → SAP 顯示格式：千分位、負數尾巴負號。"""
+    values = np.asarray(values, dtype="float64")
+    text = pd.Series(np.abs(values)).map(f"{{:,.{decimals}f}}".format)
+    return text.where(values >= 0, text + "-")
+
+
+def _dates(rng, start, end, n):
+    labels = pd.date_range(pd.Timestamp(start), max(pd.Timestamp(start), pd.Timestamp(end))).strftime("%m/%d/%Y")
+    return labels.to_numpy()[rng.integers(0, len(labels), n)]     # 先格式化每一天，再抽樣
+
+
+def _articles(rng, n, n_articles=20_000):
+    return (1_000_000 + rng.integers(0, n_articles, n)).astype(str)
+
+
+def _sites(rng, n, low=1000, high=5999):
+    return rng.integers(low, high + 1, n).astype(str)
+
+
+def make_zmb51(n_rows, start, end, rng, site_low=1000, site_high=5999, **_) -> pd.DataFrame:
+    qty = rng.integers(1, 50, n_rows).astype(float)
+    sign = np.where(rng.random(n_rows) < 0.9, 1.0, -1.0)   # 251 出 / 252 沖回
+    return pd.DataFrame({
+        "Site": _sites(rng, n_rows, site_low, site_high),
+        "Article": _articles(rng, n_rows),
+        "Article Description": "ITEM",
+        "MvT": np.where(sign > 0, "251", "252"),
+        "Cost Ctr": "",
+        "Art. Doc.": (4_900_000_000 + rng.integers(0, 99_999_999, n_rows)).astype(str),
+        "Item": rng.integers(1, 20, n_rows).astype(str),
+        "Pstng Date": _dates(rng, start, end, n_rows),
+        "Quantity i": sap_number(qty * sign),
+        "BUn": rng.choice(["EA", "CS", "LB"], n_rows),
+        "Amount LC": sap_number(qty * sign * rng.uniform(0.5, 30, n_rows), 2),
+        "Crcy": "USD",
+    })
+
+
+def make_zstpromo(n_rows, start, end, rng, **_) -> pd.DataFrame:
+    qty = rng.integers(1, 40, n_rows).astype(float)
+    price = rng.uniform(0.5, 30, n_rows)
+    return pd.DataFrame({
+        "SOrg.": "S100",
+        "Payer": _sites(rng, n_rows, 1003, 1099),
+        "Bill.Doc.": (90_000_000 + rng.integers(0, 9_999_999, n_rows)).astype(str),
+        "Item": (rng.integers(1, 50, n_rows) * 10).astype(str),
+        "Bill. Date": _dates(rng, start, end, n_rows),
+        "Article": _articles(rng, n_rows),
+        "Description": "ITEM",
+        "Bill.qty": sap_number(qty),
+        "SU": rng.choice(["EA", "CS"], n_rows),
+        "Sales Amou": sap_number(qty * price, 2),
+        "Cost": sap_number(qty * price * 0.7, 2),
+        "Curr.": "USD",
+    })
+
+
+def make_zrssale(n_rows, start, end, rng, channel="D3", **_) -> pd.DataFrame:
+    qty = rng.integers(1, 20, n_rows).astype(float)
+    amt = qty * rng.uniform(0.5, 40, n_rows)
+    df = pd.DataFrame({
+        "SOrg.": "S100",
+        "Sold-to": (200_000 + rng.integers(0, 5000, n_rows)).astype(str),
+        "Ship-to": (200_000 + rng.integers(0, 5000, n_rows)).astype(str),
+        "Payer": (200_000 + rng.integers(0, 5000, n_rows)).astype(str),
+        "Name 1": "CUSTOMER",
+        "Bill.Doc.": (91_000_000 + rng.integers(0, 9_999_999, n_rows)).astype(str),
+        "Bill. Date": _dates(rng, start, end, n_rows),
+        "Item": (rng.integers(1, 50, n_rows) * 10).astype(str),
+        "Article": _articles(rng, n_rows),
+        "Description": "ITEM",
+        "Mdse Cat.": (10_000 + rng.integers(0, 900, n_rows)).astype(str),
+        "Bill.qty": sap_number(qty),
+        "SU": "EA",
+        "BillQtySKU": sap_number(qty),
+        "Sales Amou": sap_number(amt, 2),
+        "Curr.": "USD",
+        "SAP Tax": sap_number(amt * 0.0925, 2),
+        "Cost": sap_number(amt * 0.7, 2),
+        "AAGM": "01",
+        "Sales Doc.": (10_000_000 + rng.integers(0, 9_999_999, n_rows)).astype(str),
+        "SOType": "ZOR",
+        "ArtTax": sap_number(amt * 0.0925, 2),
+        "ArtCRV": "",
+        "CRVDesc": "",
+        "Site": _sites(rng, n_rows, 1000, 1999),
+        "Ship-to st": rng.choice(["CA", "NV", "TX"], n_rows),
+        "Ship-to Ci": "CITY",
+        "DChl": channel,
+        "ItCa": "NORM",
+        "PsSt": "",
+        "TaxRate %": sap_number(np.full(n_rows, 9.25)),
+        "CRVRate": sap_number(np.zeros(n_rows)),
+        "Net": sap_number(amt, 2),
+        "Reg": rng.choice(["CA", "NV", "TX"], n_rows),
+        "Search Ter": "",
+        "Postal Cod": (90000 + rng.integers(0, 9999, n_rows)).astype(str),
+        "N Weight": sap_number(qty * 0.5),
+        "IncoT": "",
+        "Inco. 2": "",
+        "MTyp": rng.choice(["ZTTG", "ZNON"], n_rows, p=[0.8, 0.2]),
+        "Descript.": "Trading Goods",
+        "Discount": sap_number(np.zeros(n_rows), 2),
+        "WSale": sap_number(amt * 0.8, 2),
+        "Customer": "",
+        "POS Tax": sap_number(amt * 0.0925, 2),
+        "Net Sale": sap_number(amt, 2),
+        "Tx": "O1",
+    })[EXPORT_COLUMNS["ZRSSALE"]]
+    return df.rename(columns=ZRSSALE_VARIANTS.get(channel, {}))
+
+
+def make_zmmidr(n_rows, start, end, rng, dept="106", **_) -> pd.DataFrame:
+    # 一個 D/C 一份快照，一個 article 一列（start / end 用不到）
+    n_rows = min(n_rows, 20_000)
+    stock = rng.integers(0, 2_000, n_rows).astype(float)
+    price = rng.uniform(0.5, 30, n_rows)
+    df = pd.DataFrame({
+        "Article No": pd.Series(rng.choice(20_000, n_rows, replace=False) + 1_000_000).map("{:018d}".format),
+        "Article Description": "ITEM",
+        "Article Description 2": "品項",
+        "MCH": (int(dept) * 100_000 + rng.integers(0, 99_999, n_rows)).astype(str),
+        "Pack size": rng.choice(["12x500g", "24x330ml", "6x1kg"], n_rows),
+        "Unit": rng.choice(["CS", "EA"], n_rows),
+        "D/C MAP": sap_number(price, 2),
+        "Unrestricted-Use Stock": sap_number(stock),
+        "Allocation Qty": sap_number(rng.integers(0, 200, n_rows)),
+        "On order Stock": sap_number(rng.integers(0, 500, n_rows)),
+        "Unrestricted Stock Value": sap_number(stock * price, 2),
+        "PTD MVMT": sap_number(-rng.integers(0, 300, n_rows)),
+        "YTD MVMT": sap_number(-rng.integers(0, 3_000, n_rows)),
+        "SCA Assortment": rng.choice(["Y", "N"], n_rows),
+        "Assortment grade": rng.choice(["A", "B", "C"], n_rows),
+        "Asrt.Grade Description": "GRADE",
+    })
+    df.columns = EXPORT_COLUMNS["ZMMIDR"]
+    return df
+
+
+GENERATORS = {
+    "ZMB51": make_zmb51,
+    "ZSTPROMO": make_zstpromo,
+    "ZRSSALE": make_zrssale,
+    "ZMMIDR": make_zmmidr,
+}
+
+
+def make_export(tcode, n_rows, start, end, seed=0, **kwargs) -> pd.DataFrame:
+    """tcode 的假資料（全部是 SAP 顯示用的字串）；沒有產生器的 tcode 丟 KeyError。"""
+    rng = np.random.default_rng(seed)
+    return GENERATORS[tcode.upper()](n_rows, start, end, rng, **kwargs)
+
+
+def write_sap_export(path, df: pd.DataFrame, title="Dynamic List Display", encoding="utf-8"):
+    """寫成 SAP Text with Tabs：標題 + 空行 + header，每行最前面多一個空白欄。"""
+    with open(path, "w", encoding=encoding, newline="") as f:
+        f.write(f"{pd.Timestamp.today():%m/%d/%Y}\t{title}\n\n")
+        f.write("\t" + "\t".join(df.columns) + "\n")
+        out = df.copy(deep=False)
+        out.insert(0, "", "")
+        out.to_csv(f, sep="\t", header=False, index=False, lineterminator="\n")
@@ -0,0 +1,494 @@
+import os
+import re
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from ETL_SAP.sap_scripts.fake_exports import GENERATORS, REPORT_TITLES, make_export, write_sap_export
+from ETL_SAP.sap_scripts.sap_wait import SapError
+
+# ------------------------------------------------------------
+# 假的 SAP GUI Scripting（SAP_GUI_BACKEND=fake）：不用 Windows / SAP 就能跑 downloader
+#   FakeSAP        = GetScriptingEngine 回傳的 application（OpenConnection / Children / findById）
+#   FakeConnection = 一個登入連線，最多 6 個 session（CreateSession / CloseSession）
+#   FakeSession    = 一個視窗：busy / findById / CreateSession，模擬 downloader 用到的畫面流程
+#                    /n 主畫面 → tcode 選擇畫面 → F8 查詢（grid）→ 匯出選單 → 格式 / 存檔視窗
+# 時間：SAP 秒數 × time_scale = 實際等待秒數（預設 0.01，40 秒的查詢 0.4 秒跑完）
+#   查詢秒數 = query_base + 每千列 query_per_1k_rows，乘上 lognormal 雜訊
+#   列數     = 選擇畫面的日期區間天數 × rows_per_day
+# 失敗注入：fail_rate（查詢失敗，狀態列 E 訊息）、disconnect_rate（整個連線斷掉）、
+#           hang_rate（grid 永遠不出來，測 timeout）
+# 存檔時在背景 thread 寫出真的 Text with Tabs 檔（fake_exports），wait_for_file 照常運作。
+# 每次查詢都記在 FakeSAP.queries，benchmark / range planner 可以拿來對照。
+# ------------------------------------------------------------
+
+FAKE_SAP_TIME_SCALE = float(os.getenv("FAKE_SAP_TIME_SCALE", 0.01))
+MAX_SESSIONS = 6
+
+GRID_ID = "wnd[0]/usr/cntlGRID1/shellcont/shell"
+LAYOUT_GRID_ID = "wnd[1]/usr/ssubD0500_SUBSCREEN:SAPLSLVC_DIALOG:0501/cntlG51_CONTAINER/shellcont/shell"
+
+# tcode → 選擇畫面的日期欄位（算查詢天數用）
+DATE_FIELDS = {
+    "ZMB51": ("wnd[0]/usr/ctxtBUDAT-LOW", "wnd[0]/usr/ctxtBUDAT-HIGH"),
+    "ZSTPROMO": ("wnd[0]/usr/ctxtFKDAT-LOW", "wnd[0]/usr/ctxtFKDAT-HIGH"),
+    "ZRSSALE": ("wnd[0]/usr/ctxtFKDAT-LOW", "wnd[0]/usr/ctxtFKDAT-HIGH"),
+}
+
+# 匯出選單 → 打開的視窗（format = 選格式，save = 直接存檔）
+EXPORT_MENUS = {
+    "wnd[0]/mbar/menu[0]/menu[1]/menu[2]": "format",
+    "wnd[0]/mbar/menu[0]/menu[3]/menu[2]": "format",
+    "wnd[0]/mbar/menu[0]/menu[3]/menu[1]": "save",
+}
+
+POPUP_CONTROLS = {
+    "format": re.compile(r"wnd\[1\](/usr/subSUBSCREEN_STEPLOOP.*|/tbar\[0\]/btn\[(0|12)\])?$"),
+    "save": re.compile(r"wnd\[1\](/usr/ctxtDY_(PATH|FILENAME|FILE_ENCODING)|/tbar\[0\]/btn\[(0|11|12)\])?$"),
+    "multisel": re.compile(r"wnd\[1\](/usr/.*|/tbar\[0\]/btn\[(0|8|12|16|23|24)\])?$"),
+    "upload": re.compile(r"wnd\[2\](/usr/ctxtDY_(PATH|FILENAME)|/tbar\[0\]/btn\[(0|12)\])?$"),
+    "options": re.compile(r"wnd\[1\](/usr/cntlOPTION_CONTAINER/shellcont/shell|/tbar\[0\]/btn\[(0|12)\])?$"),
+    "layout": re.compile(r"wnd\[1\](/usr/ssubD0500_SUBSCREEN.*|/tbar\[0\]/btn\[(0|12)\])?$"),
+}
+
+LOGIN_FIELDS = ("wnd[0]/usr/txtRSYST-MANDT", "wnd[0]/usr/txtRSYST-BNAME", "wnd[0]/usr/pwdRSYST-BCODE")
+
+DEFAULT_LAYOUTS = ["/AC-251", "AC-ZSTPROMO", "/AC-ZMACHK", "/AC-ZMMIDR", "/AC-STORERP"]
+
+
+class FakeSAPError(Exception):
+    """找不到元件（跟真的 SAP 一樣，元件還沒出來時 findById 會丟例外）。"""
+
+
+class FakeSessionClosed(SapError):
+    """session / 連線已經關掉：wait_until 不會一直等下去。"""
+
+
+class FakeControl:
+    """findById 回傳的元件；text 存在 session 上，其他屬性（selected、caretPosition…）只是記著。"""
+
+    def __init__(self, session, element_id):
+        self._session = session
+        self.Id = element_id
+
+    @property
+    def text(self):
+        return self._session.fields.get(self.Id, "")
+
+    @text.setter
+    def text(self, value):
+        self._session.fields[self.Id] = str(value)
+
+    @property
+    def MessageType(self):
+        return self._session.status[0]
+
+    @property
+    def Text(self):
+        return self._session.status[1]
+
+    @property
+    def RowCount(self):
+        return self._session._row_count(self.Id)
+
+    def GetCellValue(self, row, column):
+        return self._session._cell_value(self.Id, row, column)
+
+    def press(self):
+        self._session._press(self.Id)
+
+    def select(self):
+        self._session._select(self.Id)
+
+    def sendVKey(self, key):
+        self._session._vkey(self.Id, key)
+
+    def clickCurrentCell(self):
+        self._session._close_popup()
+
+    def setCurrentCell(self, row, column):
+        pass
+
+    def setFocus(self):
+        pass
+
+    def maximize(self):
+        pass
+
+
+class FakeSession:
+    def __init__(self, connection, number):
+        self.connection = connection
+        self.sap = connection.sap
+        self.number = number
+        self.fields = {}
+        self.screen = "login" if connection.needs_login else "main"
+        self.tcode = None
+        self.popup = None
+        self.grid_rows = None       # 查詢完成後的列數
+        self.pending = None         # (ready_at, action)：busy 期間要完成的動作
+        self.closed = False
+        self.export = None          # 查詢結果（DataFrame 產生參數）
+        self.status = ("", "")      # 狀態列 (MessageType, Text)
+        self.selection = []         # 多值視窗從檔案上傳的值
+
+    # ---------- GUI Scripting API ----------
+    @property
+    def Id(self):
+        return f"{self.connection.Id}/ses[{self.number}]"
+
+    @property
+    def Parent(self):
+        return self.connection
+
+    @property
+    def busy(self):
+        self._check_alive()
+        self._advance()
+        return self.pending is not None
+
+    def findById(self, element_id):
+        self._check_alive()
+        self._advance()
+        if self.pending is not None:
+            raise FakeSAPError(f"session busy: {element_id}")
+        if not self._exists(element_id):
+            raise FakeSAPError(f"The control could not be found by id: {element_id}")
+        return FakeControl(self, element_id)
+
+    def CreateSession(self):
+        self._check_alive()
+        self.connection._create_session()
+
+    # ---------- 狀態 ----------
+    def _check_alive(self):
+        if self.closed or self.connection.closed:
+            raise FakeSessionClosed(f"session {self.Id} 已關閉")
+
+    def _busy_for(self, sap_seconds, action):
+        self.pending = (time.monotonic() + sap_seconds * self.sap.time_scale, action)
+
+    def _advance(self):
+        if self.pending is not None and time.monotonic() >= self.pending[0]:
+            _, action = self.pending
+            self.pending = None
+            if action:
+                action()
+
+    def _exists(self, element_id):
+        if element_id in ("wnd[0]", "wnd[0]/tbar[0]/okcd", "wnd[0]/sbar"):
+            return True
+        if element_id.startswith("wnd[2]"):
+            return self.popup == "upload" and bool(POPUP_CONTROLS["upload"].match(element_id))
+        if element_id.startswith("wnd[1]"):
+            popup = "multisel" if self.popup == "upload" else self.popup     # 上傳視窗開著時底下的多值視窗還在
+            return popup is not None and bool(POPUP_CONTROLS[popup].match(element_id))
+        if self.popup is not None:
+            return False
+        if self.screen == "login":
+            return element_id in LOGIN_FIELDS
+        if self.screen == "main":
+            return element_id.startswith("wnd[0]/tbar") or element_id == "wnd[0]/mbar"
+        if self.screen == "selection":
+            return element_id.startswith(("wnd[0]/usr/", "wnd[0]/tbar", "wnd[0]/mbar"))
+        # screen == "grid"
+        # ZMMIDR 的 grid 在 GRID1 底下一層（.../shellcont[1]/shell）
+        return (element_id.startswith(GRID_ID) or element_id.startswith(("wnd[0]/tbar", "wnd[0]/mbar"))
+                or element_id in EXPORT_MENUS)
+
+    def _row_count(self, element_id):
+        if element_id.startswith(GRID_ID):
+            return self.grid_rows
+        if element_id == LAYOUT_GRID_ID:
+            return len(self.sap.layouts)
+        return 0
+
+    def _cell_value(self, element_id, row, column):
+        if element_id == LAYOUT_GRID_ID:
+            return self.sap.layouts[row]
+        return ""
+
+    # ---------- 動作 ----------
+    def _vkey(self, element_id, key):
+        self.status = ("", "")
+        if element_id == "wnd[1]":
+            if key == 0:
+                self._close_popup()
+            return
+        if key == 0:
+            okcd = self.fields.pop("wnd[0]/tbar[0]/okcd", "").strip()
+            if self.screen == "login":
+                self._busy_for(self.sap.screen_seconds, self._logged_in)
+            elif okcd:
+                self._busy_for(self.sap.screen_seconds, lambda: self._enter(okcd))
+        elif key == 2 and self.screen == "selection":
+            self.popup = "options"
+        elif key == 8 and self.screen == "selection":
+            self._execute()
+        elif key == 3:
+            self._busy_for(self.sap.screen_seconds, lambda: self._enter("/n"))
+
+    def _logged_in(self):
+        self.connection.needs_login = False
+        self.screen = "main"
+
+    def _enter(self, okcd):
+        self.popup = None
+        self.grid_rows = None
+        self.selection = []
+        if okcd.lower().startswith("/n"):
+            okcd = okcd[2:]
+            self.screen, self.tcode = "main", None
+            self.fields = {}
+            if not okcd:
+                return
+        self.tcode = okcd.upper()
+        self.screen = "selection"
+        self.fields = {}
+
+    def _press(self, element_id):
+        if element_id == "wnd[0]/tbar[1]/btn[8]":
+            return self._vkey("wnd[0]", 8)
+        if element_id == "wnd[0]/tbar[1]/btn[33]":
+            self.popup = "layout"
+        elif element_id.startswith("wnd[0]/usr/btn%_") and element_id.endswith("VALU_PUSH"):
+            self.popup = "multisel"
+        elif element_id in ("wnd[1]/tbar[0]/btn[0]", "wnd[1]/tbar[0]/btn[11]"):
+            if self.popup == "format":
+                self.popup = "save"
+            elif self.popup == "save":
+                self._save()
+            else:
+                self._close_popup()
+        elif element_id in ("wnd[1]/tbar[0]/btn[8]", "wnd[1]/tbar[0]/btn[12]"):
+            self._close_popup()
+        elif element_id == "wnd[1]/tbar[0]/btn[24]":
+            self._busy_for(self.sap.screen_seconds / 2, None)   # 從剪貼簿上傳
+        elif element_id == "wnd[1]/tbar[0]/btn[23]":
+            self.popup = "upload"                                # 從文字檔上傳 → 選檔視窗
+        elif element_id == "wnd[2]/tbar[0]/btn[0]":
+            self._upload()
+        elif element_id == "wnd[2]/tbar[0]/btn[12]":
+            self.popup = "multisel"
+
+    def _select(self, element_id):
+        if element_id in EXPORT_MENUS:
+            self.popup = EXPORT_MENUS[element_id]
+
+    def _close_popup(self):
+        self.popup = None
+
+    def _upload(self):
+        path = os.path.join(self.fields.get("wnd[2]/usr/ctxtDY_PATH", ""),
+                            self.fields.get("wnd[2]/usr/ctxtDY_FILENAME", ""))
+        self.popup = "multisel"
+        if not os.path.isfile(path):
+            self.status = ("E", f"File {path} cannot be opened")
+            return
+        with open(path, encoding="utf-8") as f:
+            self.selection = [line.strip() for line in f if line.strip()]
+        self._busy_for(self.sap.screen_seconds / 2, None)
+
+    # ---------- 查詢 / 匯出 ----------
+    def _date_range(self):
+        """選擇畫面的日期區間 → (天數, start, end)；沒有日期欄位的 tcode 算 1 天。"""
+        low_id, high_id = DATE_FIELDS.get(self.tcode, (None, None))
+        low, high = self.fields.get(low_id), self.fields.get(high_id)
+        if not low:
+            today = pd.Timestamp.today().normalize()
+            return 1, today, today
+        start = pd.to_datetime(low, format="%m/%d/%Y")
+        end = pd.to_datetime(high, format="%m/%d/%Y") if high else start
+        return max((end - start).days + 1, 1), start, end
+
+    def _execute(self):
+        sap = self.sap
+        n_days, start, end = self._date_range()
+        n_rows = int(n_days * sap.rows_per_day * sap.rng.lognormal(0, 0.3))
+        seconds = (sap.query_base + sap.query_per_1k_rows * n_rows / 1000) * sap.rng.lognormal(0, sap.noise)
+        record = {"tcode": self.tcode, "start": start, "end": end, "days": n_days, "rows": n_rows,
+                  "seconds": seconds, "session": self.Id, "outcome": "ok"}
+
+        roll = sap.rng.random()
+        if roll < sap.disconnect_rate:
+            record["outcome"] = "disconnect"
+            self._busy_for(seconds / 2, self.connection.close)
+        elif roll < sap.disconnect_rate + sap.fail_rate:
+            record["outcome"] = "error"
+
+            def fail():
+                self.status = ("E", f"{self.tcode} 查詢失敗（模擬）")
+            self._busy_for(seconds / 2, fail)
+        elif roll < sap.disconnect_rate + sap.fail_rate + sap.hang_rate:
+            record["outcome"] = "hang"
+            self._busy_for(10 ** 9, None)
+        else:
+            def show_grid():
+                self.screen = "grid"
+                self.grid_rows = n_rows
+            self._busy_for(seconds, show_grid)
+            self.export = {"tcode": self.tcode, "n_rows": n_rows, "start": start, "end": end,
+                           "channel": self.fields.get("wnd[0]/usr/ctxtVTWEG", "D3") or "D3",
+                           "seed": len(sap.queries)}
+        sap._log(record)
+
+    def _save(self):
+        path = os.path.join(self.fields.get("wnd[1]/usr/ctxtDY_PATH", ""),
+                            self.fields.get("wnd[1]/usr/ctxtDY_FILENAME", ""))
+        export = self.export
+        self.popup = None
+        seconds = self.sap.export_per_1k_rows * (export["n_rows"] if export else 0) / 1000
+        self._busy_for(seconds, None)
+
+        def write():
+            time.sleep(seconds * self.sap.time_scale)
+            self.sap.write_export(path, export)
+        threading.Thread(target=write, name="fake-sap-export", daemon=True).start()
+
+
+class FakeSessions:
+    """connection.Children：Count + 用 index 呼叫。"""
+
+    def __init__(self, items):
+        self._items = items
+
+    @property
+    def Count(self):
+        return len(self._items)
+
+    def __call__(self, i):
+        return self._items[i]
+
+    def __iter__(self):
+        return iter(list(self._items))
+
+
+class FakeConnection:
+    def __init__(self, sap, number):
+        self.sap = sap
+        self.number = number
+        self.closed = False
+        self.needs_login = True
+        self.sessions = [FakeSession(self, 0)]
+
+    @property
+    def Id(self):
+        return f"/app/con[{self.number}]"
+
+    @property
+    def Children(self):
+        self.sessions = [s for s in self.sessions if not s.closed]
+        return FakeSessions(self.sessions)
+
+    def _create_session(self):
+        with self.sap.lock:
+            used = {s.number for s in self.sessions if not s.closed}
+            free = [n for n in range(MAX_SESSIONS) if n not in used]
+            if not free:
+                raise FakeSAPError("已達 session 上限")
+            self.sessions.append(FakeSession(self, free[0]))
+
+    def CloseSession(self, session_id=None):
+        """給 session Id 只關那一個；其他（close_all_sap_sessions 傳 0）→ 整個連線關掉。"""
+        if isinstance(session_id, str):
+            for s in self.sessions:
+                if s.Id == session_id:
+                    s.closed = True
+            return
+        self.close()
+
+    def close(self):
+        self.closed = True
+        for s in self.sessions:
+            s.closed = True
+
+
+class FakeSAP:
+    def __init__(self, time_scale=None, screen_seconds=0.5, query_base=5.0, query_per_1k_rows=0.5,
+                 export_per_1k_rows=0.05, rows_per_day=5_000, noise=0.3,
+                 fail_rate=0.0, disconnect_rate=0.0, hang_rate=0.0, layouts=None, seed=0):
+        self.time_scale = FAKE_SAP_TIME_SCALE if time_scale is None else time_scale
+        self.screen_seconds = screen_seconds
+        self.query_base = query_base
+        self.query_per_1k_rows = query_per_1k_rows
+        self.export_per_1k_rows = export_per_1k_rows
+        self.rows_per_day = rows_per_day
+        self.noise = noise
+        self.fail_rate = fail_rate
+        self.disconnect_rate = disconnect_rate
+        self.hang_rate = hang_rate
+        self.layouts = layouts or DEFAULT_LAYOUTS
+        self.rng = np.random.default_rng(seed)
+        self.lock = threading.RLock()
+        self.connections = []
+        self.queries = []
+        self.logins = 0
+
+    # ---------- GUI Scripting API ----------
+    @property
+    def Children(self):
+        return FakeSessions(self.connections)
+
+    def OpenConnection(self, system, sync=True):
+        with self.lock:
+            self.connections = [c for c in self.connections if not c.closed]
+            for i, c in enumerate(self.connections):
+                c.number = i
+            conn = FakeConnection(self, len(self.connections))
+            self.connections.append(conn)
+            self.logins += 1
+            return conn
+
+    def findById(self, element_id):
+        m = re.fullmatch(r"/app/con\[(\d+)\](?:/ses\[(\d+)\])?", element_id)
+        if m:
+            with self.lock:
+                for c in self.connections:
+                    if c.number != int(m.group(1)) or c.closed:
+                        continue
+                    if m.group(2) is None:
+                        return c
+                    for s in c.Children:
+                        if s.number == int(m.group(2)):
+                            return s
+        raise FakeSAPError(f"The control could not be found by id: {element_id}")
+
+    # ---------- 匯出 / 紀錄 ----------
+    def write_export(self, path, export):
+        if export and export["tcode"] in GENERATORS:
+            df = make_export(export["tcode"], export["n_rows"], export["start"], export["end"],
+                             seed=export["seed"], channel=export["channel"])
+            write_sap_export(path, df, title=REPORT_TITLES.get(export["tcode"], "Dynamic List Display"))
+        else:
+            # 沒有產生器的 tcode（ZMACHK、StoreRP…）→ 只寫個小的 tab 檔，讓 wait_for_file 過得去
+            n_rows = export["n_rows"] if export else 0
+            write_sap_export(path, pd.DataFrame({"Article": [str(1_000_000 + i) for i in range(min(n_rows, 100))]}))
+
+    def _log(self, record):
+        with self.lock:
+            self.queries.append(record)
+
+    def query_log(self) -> pd.DataFrame:
+        with self.lock:
+            return pd.DataFrame(self.queries)
+
+
+_FAKE_SAP = None
+_FAKE_LOCK = threading.Lock()
+
+
+def get_fake_sap() -> FakeSAP:
+    global _FAKE_SAP
+    with _FAKE_LOCK:
+        if _FAKE_SAP is None:
+            _FAKE_SAP = FakeSAP()
+        return _FAKE_SAP
+
+
+def set_fake_sap(sap: FakeSAP | None):
+    """換掉 process 共用的 FakeSAP（benchmark 設定延遲 / 失敗率用）。"""
+    global _FAKE_SAP
+    with _FAKE_LOCK:
+        _FAKE_SAP = sap
@@ -0,0 +1,32 @@
+import os
+
+# ------------------------------------------------------------
+# SAP GUI Scripting 的來源：
+#   SAP_GUI_BACKEND=win32（預設）→ win32com GetObject("SAPGUI").GetScriptingEngine
+#   SAP_GUI_BACKEND=fake          → fake_gui.FakeSAP（Linux / 沒有 SAP 也能跑 downloader）
+# login / close_all_sap_sessions / session_pool 都從這裡拿 application，
+# downloader 本身只拿到 session 物件，不用改。
+# ------------------------------------------------------------
+
+GUI_BACKENDS = ("win32", "fake")
+
+
+def gui_backend() -> str:
+    backend = os.getenv("SAP_GUI_BACKEND", "win32").lower()
+    if backend not in GUI_BACKENDS:
+        raise ValueError(f"Unknown SAP_GUI_BACKEND: {backend}（可用：{', '.join(GUI_BACKENDS)}）")
+    return backend
+
+
+def is_fake_gui() -> bool:
+    return gui_backend() == "fake"
+
+
+def get_scripting_engine():
+    """SAP GUI Scripting 的 application 物件（OpenConnection / Children / findById）。"""
+    if is_fake_gui():
+        from ETL_SAP.sap_scripts.fake_gui import get_fake_sap
+        return get_fake_sap()
+
+    import win32com.client
+    return win32com.client.GetObject("SAPGUI").GetScriptingEngine
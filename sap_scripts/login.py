@@ -1,10 +1,10 @@
 import os
 import time
-import win32com.client
 from dotenv import load_dotenv
 import subprocess
-import pyautogui
 from ETL_SAP.sap_scripts.sap_utils import close_all_sap_sessions
+from ETL_SAP.sap_scripts.sap_wait import wait_until, wait_idle, find
+from ETL_SAP.sap_scripts.gui_backend import get_scripting_engine, is_fake_gui
 
 # 載入 .env 檔案
 load_dotenv()
@@ -16,6 +16,7 @@ def is_saplogon_running():
 
 # 關閉所有 SAP GUI 的彈出視窗
 def close_all_sap_popups():
+    import pyautogui
     for win in pyautogui.getWindowsWithTitle("SAP GUI"):
         try:
             win.activate()
@@ -31,22 +32,19 @@ def sap_login():
     client = os.getenv("SAP_CLIENT", "800")
     system = os.getenv("SAP_SYSTEM", "ECC Production")
     try:
-        if not is_saplogon_running():
+        if not is_fake_gui() and not is_saplogon_running():
             os.system("start saplogon.exe")
-            time.sleep(5)
 
-        # 連接到 SAP GUI Scripting
-        SapGuiAuto = win32com.client.GetObject("SAPGUI")
-        application = SapGuiAuto.GetScriptingEngine
+        # 連接到 SAP GUI Scripting（saplogon 剛啟動時 GetObject 會失敗，等到可用為止）
+        application = wait_until(get_scripting_engine, timeout=60, desc="SAP Logon")
         connection = application.OpenConnection(system, True)
         session = connection.Children(0)
-        time.sleep(2)
 
-        session.findById("wnd[0]/usr/txtRSYST-MANDT").text = client
+        find(session, "wnd[0]/usr/txtRSYST-MANDT").text = client
         session.findById("wnd[0]/usr/txtRSYST-BNAME").text = username
         session.findById("wnd[0]/usr/pwdRSYST-BCODE").text = password
         session.findById("wnd[0]").sendVKey(0)
-        time.sleep(2)  # 等待登入完成
+        wait_idle(session)  # 等待登入完成
 
         # 多重登入處理：強制踢掉其他 session
         try:
@@ -0,0 +1,316 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, NamedTuple, Sequence
+
+import numpy as np
+
+from ETL_SAP.sap_scripts.run_ledger import LEDGER_PATH
+
+# ------------------------------------------------------------
+# 依查詢歷史調整 SAP 查詢的日期區間：
+#   每次查詢記下 (tcode, site, 天數, 列數, 秒數, 結果)，存在 run_ledger 同一個 SQLite
+#   用最近 SAP_RANGE_HISTORY 筆估「秒數 ≈ a + b × 天數」，
+#   連續的週合併、太重的週切開，讓每個查詢的預估時間落在 SAP_QUERY_BUDGET 秒內
+#   查詢逾時（wait_for_table timeout）→ 丟 SplitRange，區間對半切後重排
+# 沒有歷史紀錄時照 DATE_FILE 原本的週跑（跟以前一樣）。
+# ledger 的完成紀錄還是以原本的週為單位：一週被切開時，所有片段都成功才記錄。
+# ------------------------------------------------------------
+
+DATE_FMT = "%m/%d/%Y"
+
+QUERY_BUDGET = float(os.getenv("SAP_QUERY_BUDGET", 600))         # 每個查詢的目標秒數
+QUERY_TIMEOUT = float(os.getenv("SAP_QUERY_TIMEOUT", 2400))       # wait_for_table 上限（原本固定 40 分鐘）
+QUERY_MAX_ROWS = int(os.getenv("SAP_QUERY_MAX_ROWS", 0)) or None   # 每個匯出檔的列數上限（0 = 不限）
+RANGE_MAX_DAYS = int(os.getenv("SAP_RANGE_MAX_DAYS", 31))
+RANGE_HISTORY = int(os.getenv("SAP_RANGE_HISTORY", 20))
+ADAPTIVE_RANGES = os.getenv("SAP_ADAPTIVE_RANGES", "1") == "1"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS query_stats (
+    tcode       TEXT NOT NULL,
+    site        TEXT NOT NULL,
+    start_date  TEXT NOT NULL,
+    end_date    TEXT NOT NULL,
+    days        INTEGER NOT NULL,
+    rows        INTEGER,
+    seconds     REAL NOT NULL,
+    outcome     TEXT NOT NULL,
+    recorded_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_query_stats ON query_stats (tcode, site, recorded_at);
+"""
+
+
+def _date(value):
+    return datetime.strptime(value, DATE_FMT).date() if isinstance(value, str) else value
+
+
+def _fmt(d) -> str:
+    return d.strftime(DATE_FMT)
+
+
+def days_between(start, end) -> int:
+    return (_date(end) - _date(start)).days + 1
+
+
+class SplitRange(Exception):
+    """查詢逾時，區間要切開重跑；parts = [(start, end), ...]（MM/DD/YYYY）。"""
+
+    def __init__(self, parts, message="query timed out"):
+        super().__init__(message)
+        self.parts = parts
+
+
+class RangeJob(NamedTuple):
+    site: str
+    start: str          # MM/DD/YYYY
+    end: str
+    keys: tuple         # 這段區間涵蓋到的原始週 done_key
+
+
+class RangePlanner:
+    def __init__(self, path=None, budget=None, max_days=None, max_rows=None, history=None, timeout=None):
+        self.path = path or LEDGER_PATH
+        self.budget = budget or QUERY_BUDGET
+        self.max_days = max_days or RANGE_MAX_DAYS
+        self.max_rows = QUERY_MAX_ROWS if max_rows is None else max_rows
+        self.history = history or RANGE_HISTORY
+        self.timeout = timeout or QUERY_TIMEOUT
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    # ---------- 歷史 ----------
+    def record(self, tcode, site, start, end, seconds, rows=None, outcome="ok"):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO query_stats VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (tcode, site, _fmt(_date(start)), _fmt(_date(end)), days_between(start, end),
+                 rows, float(seconds), outcome, datetime.now().isoformat(timespec="seconds")))
+
+    def _recent(self, tcode, site):
+        with self._lock:
+            return self._conn.execute("""
+                SELECT days, rows, seconds, outcome FROM query_stats
+                WHERE tcode = ? AND site = ? AND outcome IN ('ok', 'timeout')
+                ORDER BY recorded_at DESC, rowid DESC LIMIT ?
+            """, (tcode, site, self.history)).fetchall()
+
+    def model(self, tcode, site):
+        """
+        回傳 (a, b, rows_per_day)：秒數 ≈ a + b × 天數；沒有歷史回傳 None。
+        天數都一樣（只跑過整週）時無法分出固定成本 → a = 0，b = 每天秒數的中位數。
+        逾時的紀錄秒數是下限，照樣算進去（估計只會偏保守）。
+        """
+        rows = self._recent(tcode, site)
+        if not rows:
+            return None
+        days = np.array([r[0] for r in rows], dtype=float)
+        seconds = np.array([r[2] for r in rows], dtype=float)
+        a, b = 0.0, float(np.median(seconds / days))
+        if len(set(days)) >= 2:
+            fit_b, fit_a = np.polyfit(days, seconds, 1)
+            if fit_b > 0:
+                a, b = max(float(fit_a), 0.0), float(fit_b)
+        counted = [(r[1], r[0]) for r in rows if r[1] is not None and r[3] == "ok"]
+        rows_per_day = float(np.median([n / d for n, d in counted])) if counted else None
+        return a, b, rows_per_day
+
+    def estimate(self, tcode, site, days):
+        m = self.model(tcode, site)
+        return None if m is None else m[0] + m[1] * days
+
+    def days_per_query(self, tcode, site):
+        """預算內一個查詢最多幾天；沒有歷史 → None（照原本的週）。"""
+        m = self.model(tcode, site)
+        if m is None:
+            return None
+        a, b, rows_per_day = m
+        days = (self.budget - a) / b if self.budget > a else 1
+        if self.max_rows and rows_per_day:
+            days = min(days, self.max_rows / rows_per_day)
+        return int(max(1, min(days, self.max_days)))
+
+    # ---------- 排程 ----------
+    def plan(self, tcode, site, weeks: Sequence[tuple]) -> list[RangeJob]:
+        """
+        weeks = [(start, end, done_key), ...]（還沒完成的週）
+        連續的週先接起來，再依 days_per_query 切成一段一段。
+        """
+        weeks = sorted(weeks, key=lambda w: _date(w[0]))
+        per_query = self.days_per_query(tcode, site)
+        if per_query is None:
+            return [RangeJob(site, s, e, (k,)) for s, e, k in weeks]
+
+        runs, current = [], []
+        for w in weeks:
+            if current and _date(w[0]) != _date(current[-1][1]) + timedelta(days=1):
+                runs.append(current)
+                current = []
+            current.append(w)
+        if current:
+            runs.append(current)
+
+        jobs = []
+        for run in runs:
+            day, last = _date(run[0][0]), _date(run[-1][1])
+            while day <= last:
+                end = min(day + timedelta(days=per_query - 1), last)
+                jobs.append(RangeJob(site, _fmt(day), _fmt(end), _overlapping(run, day, end)))
+                day = end + timedelta(days=1)
+        return jobs
+
+    @staticmethod
+    def halves(start, end):
+        """把區間對半切；只有一天時回傳 None（不能再切）。"""
+        s, e = _date(start), _date(end)
+        n = (e - s).days + 1
+        if n <= 1:
+            return None
+        mid = s + timedelta(days=n // 2 - 1)
+        return [(_fmt(s), _fmt(mid)), (_fmt(mid + timedelta(days=1)), _fmt(e))]
+
+    @contextmanager
+    def track(self, tcode, site, start, end):
+        """
+        包住「執行查詢 → 等 grid」：記錄秒數和列數（呼叫端設 q["rows"]）。
+        TimeoutError 且區間超過一天 → 丟 SplitRange（記錄為 timeout）。
+        """
+        q = {"rows": None}
+        t0 = time.perf_counter()
+        try:
+            yield q
+        except TimeoutError:
+            self.record(tcode, site, start, end, time.perf_counter() - t0, outcome="timeout")
+            parts = self.halves(start, end)
+            if parts:
+                raise SplitRange(parts, f"{tcode} {site} {start}~{end} 逾時，切成 {parts}")
+            raise
+        except Exception:
+            self.record(tcode, site, start, end, time.perf_counter() - t0, outcome="error")
+            raise
+        self.record(tcode, site, start, end, time.perf_counter() - t0, rows=q["rows"])
+
+
+def _overlapping(weeks, start, end) -> tuple:
+    return tuple(k for s, e, k in weeks if _date(s) <= end and _date(e) >= start)
+
+
+class CoverageTracker:
+    """原始週 done_key ↔ 實際查詢區間：一週的所有片段都成功才算完成。"""
+
+    def __init__(self, weeks: Sequence[tuple], jobs: Sequence[RangeJob]):
+        self.weeks = {k: (_date(s), _date(e)) for s, e, k in weeks}
+        self.remaining = {k: 0 for k in self.weeks}
+        self._lock = threading.Lock()
+        for job in jobs:
+            for k in job.keys:
+                self.remaining[k] += 1
+
+    def split(self, job: RangeJob, parts) -> list[RangeJob]:
+        new_jobs = []
+        with self._lock:
+            for k in job.keys:
+                self.remaining[k] -= 1
+            for s, e in parts:
+                keys = tuple(k for k in job.keys
+                             if self.weeks[k][0] <= _date(e) and self.weeks[k][1] >= _date(s))
+                for k in keys:
+                    self.remaining[k] += 1
+                new_jobs.append(RangeJob(job.site, s, e, keys))
+        return new_jobs
+
+    def complete(self, job: RangeJob) -> list[str]:
+        """這個區間成功 → 回傳因此全部完成的 done_key。"""
+        done = []
+        with self._lock:
+            for k in job.keys:
+                self.remaining[k] -= 1
+                if self.remaining[k] == 0:
+                    done.append(k)
+        return done
+
+
+_PLANNER = None
+_PLANNER_LOCK = threading.Lock()
+
+
+def get_planner() -> RangePlanner:
+    global _PLANNER
+    with _PLANNER_LOCK:
+        if _PLANNER is None:
+            _PLANNER = RangePlanner()
+        return _PLANNER
+
+
+def download_ranges(tcode: str, weeks_by_site: dict, query: Callable, safe_query: Callable,
+                    on_done: Callable, n_sessions: int = 1, login: Callable | None = None,
+                    on_failure: Callable | None = None, adaptive: bool | None = None,
+                    label: str | None = None) -> bool:
+    """
+    ZMB51 / ZRSSALE 共用的下載排程：
+      weeks_by_site = {site: [(start, end, done_key), ...]}（還沒完成的週）
+      query(session, job) -> bool              單次查詢（SessionPool 用）
+      safe_query(session, job) -> (ok, session) 含重試 / 重登（單一 session 用）
+      on_done(site, done_key)                  一週完成時呼叫（記 ledger）
+      on_failure(job, error)                   SessionPool 放棄某個區間時呼叫
+      login()                                  預設 session_pool.fresh_login
+    回傳 True 表示全部完成。
+    """
+    from ETL_SAP.sap_scripts.session_pool import SessionPool, SplitJob, fresh_login
+
+    login = login or fresh_login
+    label = label or tcode
+    planner = get_planner()
+    adaptive = ADAPTIVE_RANGES if adaptive is None else adaptive
+    weeks = [(s, e, k) for ws in weeks_by_site.values() for s, e, k in ws]
+
+    jobs = []
+    for site, ws in weeks_by_site.items():
+        site_jobs = planner.plan(tcode, site, ws) if adaptive else [RangeJob(site, s, e, (k,)) for s, e, k in ws]
+        if len(site_jobs) != len(ws):
+            per_query = planner.days_per_query(tcode, site)
+            print(f"📐 {label} {site}：{len(ws)} 週 → {len(site_jobs)} 個查詢（每個最多 {per_query} 天）")
+        jobs.extend(site_jobs)
+    tracker = CoverageTracker(weeks, jobs)
+
+    def finished(job):
+        for k in tracker.complete(job):
+            on_done(job.site, k)
+
+    if n_sessions > 1:
+        def pool_query(session, job):
+            try:
+                return query(session, job)
+            except SplitRange as e:
+                print(f"✂️ {e}")
+                raise SplitJob(tracker.split(job, e.parts))
+
+        result = SessionPool(n_sessions, login=login, label=label).run(
+            jobs, pool_query, on_success=finished, on_failure=on_failure)
+        return not result["failed"]
+
+    session = login()
+    todo = deque(jobs)
+    while todo:
+        job = todo.popleft()
+        try:
+            success, session = safe_query(session, job)
+        except SplitRange as e:
+            print(f"✂️ {e}")
+            todo.extendleft(reversed(tracker.split(job, e.parts)))
+            session = login()      # 逾時的查詢還卡在 session 上，重新登入
+            continue
+        if not success:
+            print(f"❌ {label} 發生錯誤，中斷於：{job.site} {job.start}~{job.end}，將於下次重新執行時繼續查詢")
+            return False
+        finished(job)
+    return True
@@ -0,0 +1,179 @@
+import atexit
+import glob
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ------------------------------------------------------------
+# 下載完成紀錄（run ledger），取代 logs/<flow>_done.txt：
+#   - SQLite，PRIMARY KEY (flow, key) → 每個 flow 的紀錄放在一起，查詢是精確比對
+#   - 第一次用到某個 flow 時整批載入成 set，之後 is_done 是 O(1)
+#   - record 先進記憶體，累積 RUN_LEDGER_BATCH 筆或距上次寫入超過
+#     RUN_LEDGER_FLUSH_SECONDS 秒才寫檔；程式結束時（atexit）一定會 flush
+#   - 舊的 <flow>_done.txt 在第一次用到該 flow 時自動匯入（原檔保留）
+# ------------------------------------------------------------
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # 等於 ETL_SAP/
+LOG_ROOT = os.path.join(BASE_DIR, "logs")
+
+LEDGER_PATH = os.getenv("RUN_LEDGER_DB", os.path.join(LOG_ROOT, "run_ledger.sqlite3"))
+LEDGER_BATCH = int(os.getenv("RUN_LEDGER_BATCH", 50))
+LEDGER_FLUSH_SECONDS = float(os.getenv("RUN_LEDGER_FLUSH_SECONDS", 5))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS done (
+    flow    TEXT NOT NULL,
+    key     TEXT NOT NULL,
+    done_at TEXT NOT NULL,
+    PRIMARY KEY (flow, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS migrated (
+    flow        TEXT PRIMARY KEY,
+    source      TEXT NOT NULL,
+    n_keys      INTEGER NOT NULL,
+    migrated_at TEXT NOT NULL
+);
+"""
+
+
+def make_key(*keys) -> str:
+    """跟舊 done.txt 一樣用 '_' 串起來，匯入的舊紀錄才對得上。"""
+    return "_".join(str(k) for k in keys)
+
+
+class RunLedger:
+    def __init__(self, path=None, log_root=None, batch_size=None, flush_seconds=None):
+        self.path = path or LEDGER_PATH
+        self.log_root = log_root or LOG_ROOT
+        self.batch_size = batch_size or LEDGER_BATCH
+        self.flush_seconds = LEDGER_FLUSH_SECONDS if flush_seconds is None else flush_seconds
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+        self._lock = threading.RLock()
+        self._done: dict[str, set] = {}        # flow → keys（已載入的 flow）
+        self._pending: list[tuple] = []
+        self._last_flush = time.monotonic()
+
+    # ---------- 舊 done.txt 匯入 ----------
+    def _migrate_txt(self, flow: str):
+        txt = os.path.join(self.log_root, f"{flow}_done.txt")
+        if not os.path.exists(txt):
+            return
+        if self._conn.execute("SELECT 1 FROM migrated WHERE flow = ?", (flow,)).fetchone():
+            return
+        with open(txt) as f:
+            keys = {line.strip() for line in f if line.strip()}
+        now = datetime.now().isoformat(timespec="seconds")
+        with self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO done (flow, key, done_at) VALUES (?, ?, ?)",
+                                   [(flow, k, now) for k in keys])
+            self._conn.execute("INSERT INTO migrated (flow, source, n_keys, migrated_at) VALUES (?, ?, ?, ?)",
+                               (flow, txt, len(keys), now))
+        print(f"📒 已匯入 {os.path.basename(txt)}：{len(keys):,} 筆完成紀錄")
+
+    def _keys(self, flow: str) -> set:
+        keys = self._done.get(flow)
+        if keys is None:
+            self._migrate_txt(flow)
+            rows = self._conn.execute("SELECT key FROM done WHERE flow = ?", (flow,)).fetchall()
+            keys = self._done[flow] = {r[0] for r in rows}
+        return keys
+
+    # ---------- 查詢 / 紀錄 ----------
+    def is_done(self, flow: str, key: str) -> bool:
+        with self._lock:
+            return key in self._keys(flow)
+
+    def record(self, flow: str, key: str):
+        with self._lock:
+            keys = self._keys(flow)
+            if key in keys:
+                return
+            keys.add(key)
+            self._pending.append((flow, key, datetime.now().isoformat(timespec="seconds")))
+            if (len(self._pending) >= self.batch_size
+                    or time.monotonic() - self._last_flush >= self.flush_seconds):
+                self.flush()
+
+    def flush(self):
+        with self._lock:
+            if self._pending:
+                with self._conn:
+                    self._conn.executemany("INSERT OR IGNORE INTO done (flow, key, done_at) VALUES (?, ?, ?)",
+                                           self._pending)
+                self._pending.clear()
+            self._last_flush = time.monotonic()
+
+    def done_keys(self, flow: str) -> set:
+        with self._lock:
+            return set(self._keys(flow))
+
+    def forget(self, flow: str, key: str | None = None):
+        """刪除紀錄（key=None → 整個 flow），讓下次重新下載。"""
+        with self._lock:
+            self.flush()
+            with self._conn:
+                if key is None:
+                    self._conn.execute("DELETE FROM done WHERE flow = ?", (flow,))
+                else:
+                    self._conn.execute("DELETE FROM done WHERE flow = ? AND key = ?", (flow, key))
+            self._done.pop(flow, None)
+
+    def migrate_all(self):
+        """把 logs/ 底下所有 *_done.txt 匯入。"""
+        for txt in sorted(glob.glob(os.path.join(self.log_root, "*_done.txt"))):
+            flow = os.path.basename(txt)[:-len("_done.txt")]
+            with self._lock:
+                self._done.pop(flow, None)
+                self._keys(flow)
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self._conn.close()
+
+
+_LEDGER = None
+_LEDGER_LOCK = threading.Lock()
+
+
+def get_ledger() -> RunLedger:
+    global _LEDGER
+    with _LEDGER_LOCK:
+        if _LEDGER is None:
+            _LEDGER = RunLedger()
+        return _LEDGER
+
+
+def _flush_ledger():
+    if _LEDGER is not None:
+        _LEDGER.flush()
+
+
+atexit.register(_flush_ledger)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="SAP 下載完成紀錄")
+    parser.add_argument("--migrate", action="store_true", help="匯入 logs/*_done.txt")
+    parser.add_argument("--flow", help="列出某個 flow 的完成紀錄")
+    args = parser.parse_args()
+
+    ledger = get_ledger()
+    if args.migrate:
+        ledger.migrate_all()
+    if args.flow:
+        for k in sorted(ledger.done_keys(args.flow)):
+            print(k)
@@ -1,13 +1,12 @@
-import win32com.client
 import time
-import win32gui
-import pyautogui
-import win32con
 import datetime
 import os
 import pandas as pd
 from datetime import timedelta
 from dotenv import load_dotenv
+from ETL_SAP.sap_scripts.run_ledger import get_ledger, make_key
+from ETL_SAP.sap_scripts.sap_wait import *
+from ETL_SAP.sap_scripts.gui_backend import get_scripting_engine
 
 load_dotenv()
 
@@ -18,17 +17,11 @@ os.makedirs(LOG_ROOT, exist_ok=True)
 # === 錯誤記錄函式 - 絕對路徑===
 
 def record_done(flow_name, *keys):
-    done_key = "_".join(str(k) for k in keys)
-    with open(os.path.join(LOG_ROOT, f"{flow_name}_done.txt"), "a") as f:
-        f.write(done_key + "\n")
+    get_ledger().record(flow_name, make_key(*keys))
 
 def is_already_done(flow_name, *keys):
-    done_key = "_".join(str(k) for k in keys)
-    filepath = os.path.join(LOG_ROOT, f"{flow_name}_done.txt")
-    if not os.path.exists(filepath):
-        return False
-    with open(filepath) as f:
-        return done_key in f.read()
+    # run_ledger：精確比對、O(1) 查詢；舊的 <flow>_done.txt 第一次用到時自動匯入
+    return get_ledger().is_done(flow_name, make_key(*keys))
 
 # === 錯誤記錄函式 - 相對路徑 ===       
 # def record_done(flow_name, *keys):
@@ -83,63 +76,102 @@ def select_layout(session, layout_name):
 
 #  ------- 等待 Table 的方法 ------- 
 def wait_for_table(session, grid_id="wnd[0]/usr/cntlGRID1/shellcont/shell",
-                   timeout=2400, poll=1.0):
-    t0 = time.time()
-    while time.time() - t0 < timeout:
-        # GUI 還忙 → 再等等
-        if session.busy:
-            time.sleep(poll)
-            print("busy 中…")
-            continue
-        # 嘗試抓到 Grid
-        try:
-            grid = session.findById(grid_id)
-            # 只要能取到 RowCount 就視為成功
-            _ = grid.RowCount
-            print("找到 grid，RowCount =", grid.RowCount)
-            return
-        except Exception:
-            # Grid 還沒生成
-            time.sleep(poll)
-    raise TimeoutError(f"SAP 報表 {grid_id} 等待逾時 {timeout}s")
+                   timeout=2400, poll=WAIT_MAX_INTERVAL):
+    # 自適應輪詢：查詢很快時幾十 ms 內就拿到 grid，長查詢最多每 poll 秒檢查一次
+    try:
+        grid = wait_until(grid_ready(session, grid_id), timeout=timeout, max_interval=poll, desc=grid_id)
+    except WaitTimeout:
+        raise TimeoutError(f"SAP 報表 {grid_id} 等待逾時 {timeout}s")
+    print("找到 grid，RowCount =", grid.RowCount)
+    return grid
 
 
 #  ------- 等待導出選單的方法 ------- 
-def wait_for_export_menu(session, interval=5):
-    """無限等待，直到『導出』選單可點選"""
-    while True:
-        try:
-            session.findById("wnd[0]/mbar/menu[0]/menu[3]").select()
-            return
-        except:
-            time.sleep(interval)
+def wait_for_export_menu(session, interval=WAIT_MAX_INTERVAL, timeout=1800):
+    """等待直到『導出』選單可點選（原本無限等待，現在 timeout 秒後丟 TimeoutError）"""
+    def select_export():
+        if session.busy:
+            return False
+        session.findById("wnd[0]/mbar/menu[0]/menu[3]").select()
+        return True
+    wait_until(select_export, timeout=timeout, max_interval=interval, desc="導出選單")
 
 
-def wait_for_export_menu_for_local_file(session, interval=3, max_wait=360):
+def wait_for_export_menu_for_local_file(session, interval=WAIT_MAX_INTERVAL, max_wait=360):
     """等待直到 Local File 導出選單出現為止"""
-    waited = 0
-    while waited < max_wait:
-        try:
-            session.findById("wnd[0]/mbar/menu[0]/menu[3]/menu[1]").select()
-            session.findById("wnd[1]/usr/ctxtDY_PATH")  # 檢查匯出視窗是否出現
-            return
-        except:
-            time.sleep(interval)
-            waited += interval
-    raise TimeoutError("⚠️ 匯出選單（Local File）逾時未出現")
+    def open_local_file():
+        if session.busy:
+            return False
+        session.findById("wnd[0]/mbar/menu[0]/menu[3]/menu[1]").select()
+        return session.findById("wnd[1]/usr/ctxtDY_PATH")  # 檢查匯出視窗是否出現
+    try:
+        wait_until(open_local_file, timeout=max_wait, max_interval=interval, desc="Local File 匯出視窗")
+    except WaitTimeout:
+        raise TimeoutError("⚠️ 匯出選單（Local File）逾時未出現")
 
 
-def wait_for_file(path: str, timeout: float = 10.0) -> None:
-    t0 = time.time()
-    while True:
-        if os.path.isfile(path) and os.path.getsize(path) > 0:
-            return
-        if time.time() - t0 > timeout:
-            raise RuntimeError(f"檔案未生成或為 0 byte：{path}")
-        time.sleep(0.2)
+def wait_for_file(path: str, timeout: float = 60.0, settle: float = 0.3) -> None:
+    # 檔案大小 settle 秒沒變才算寫完，取代原本 wait_for_file 之後再 sleep(2)
+    try:
+        wait_until(file_ready(path, settle=settle), timeout=timeout, max_interval=0.5, desc=path)
+    except WaitTimeout:
+        raise RuntimeError(f"檔案未生成或為 0 byte：{path}")
+
+
+# ------- 直接匯出成檔案（不經過 Excel）-------
+LOCAL_FILE_MENU = "wnd[0]/mbar/menu[0]/menu[3]/menu[2]"      # List → Export → Local File
+EXPORT_FORMAT_ROW = {"unconverted": 0, "text": 1}            # 格式視窗第幾列：未轉換 / Text with Tabs
+
+
+def export_local_file(session, export_dir, filename, fmt="text", menu_id=LOCAL_FILE_MENU,
+                      encoding="4110", timeout=600):
+    """
+    ALV 結果存成本機檔（預設 Text with Tabs），等檔案寫完才回傳完整路徑。
+    不走「Spreadsheet」→ SAP 不會自動開 Excel，也就不用 close_exported_excel / kill_excel。
+    """
+    wait_for_export_menu(session, timeout=timeout)
+    session.findById(menu_id).select()
+    row = EXPORT_FORMAT_ROW[fmt]
+    session.findById("wnd[1]/usr/subSUBSCREEN_STEPLOOP:SAPLSPO5:0150/"
+                     f"sub:SAPLSPO5:0150/radSPOPLI-SELFLAG[{row},0]").select()
+    session.findById("wnd[1]/tbar[0]/btn[0]").press()         # 確定
+
+    find(session, "wnd[1]/usr/ctxtDY_PATH").text = export_dir
+    session.findById("wnd[1]/usr/ctxtDY_FILENAME").text = filename
+    session.findById("wnd[1]/usr/ctxtDY_FILE_ENCODING").text = encoding
+    session.findById("wnd[1]/tbar[0]/btn[11]").press()        # 用覆蓋存檔的按鈕
+
+    full_path = os.path.join(export_dir, filename)
+    wait_for_file(full_path, timeout=timeout)
+    return full_path
+
+
+# ------- 多值選擇從檔案上傳（取代剪貼簿貼上）-------
+def write_selection_file(values, path):
+    """多值清單寫成一行一個值的文字檔，給 upload_selection_file 用；回傳路徑。"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8", newline="\r\n") as f:
+        f.write("\n".join(str(v) for v in values) + "\n")
+    return path
+
+
+def upload_selection_file(session, path, button_id="wnd[1]/tbar[0]/btn[23]"):
+    """
+    多值選擇視窗（wnd[1]）→「Import from Text File」上傳 path，不碰剪貼簿，
+    多個 session 可以同時做，不用排隊搶剪貼簿。
+    """
+    path = os.path.abspath(path)
+    session.findById(button_id).press()
+    find(session, "wnd[2]/usr/ctxtDY_PATH").text = os.path.dirname(path)
+    session.findById("wnd[2]/usr/ctxtDY_FILENAME").text = os.path.basename(path)
+    session.findById("wnd[2]/tbar[0]/btn[0]").press()
+    wait_idle(session)
+    raise_status_error(session)          # 檔案打不開 → 狀態列 E 訊息
+
 
 # ------- 關閉已匯出的 Excel 檔案 -------
 def close_exported_excel(target_filename: str):
+    import win32com.client
     try:
         time.sleep(0.5)
         excel = win32com.client.GetActiveObject("Excel.Application")
@@ -166,8 +198,7 @@ def close_exported_excel(target_filename: str):
 # ------- 關閉所有 SAP Session -------
 def close_all_sap_sessions():
     try:
-        sap_gui = win32com.client.GetObject("SAPGUI")
-        application = sap_gui.GetScriptingEngine
+        application = get_scripting_engine()
         for i in range(application.Children.Count):
             application.Children(i).CloseSession(0)
         print("✅ 已關閉所有 SAP Sessions")
@@ -238,9 +269,10 @@ def update_sales_search_date(file_path, fill_missing=True):
 def get_multiple_sessions(count: int = 1):
     """
     開啟 n 個 SAP GUI window, 回傳 session 物件清單
+    （平行下載請改用 session_pool.SessionPool）
     """
-    sap_gui = win32com.client.GetObject("SAPGUI") 
-    app = sap_gui.GetScriptingEngine
+    import pyautogui
+    app = get_scripting_engine()
     connection = app.Children(0)
 
     sessions = [connection.Children(0)]  # 目前開著的視窗（主）
@@ -271,6 +303,8 @@ def get_multiple_sessions(count: int = 1):
 # ------- 把 SAP GUI 視窗拉到前景 ------- 
 def bring_sap_to_front():
     """讓 SAP GUI 成為前景視窗，確保 Ctrl+N 送到正確位置"""
+    import win32gui
+    import win32con
     def enum_handler(hwnd, _):
         if win32gui.IsWindowVisible(hwnd):
             title = win32gui.GetWindowText(hwnd)
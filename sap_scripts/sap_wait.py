@@ -0,0 +1,193 @@
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from ETL_SAP.common.instrument import record
+
+# ------------------------------------------------------------
+# SAP GUI 等待工具：取代固定 time.sleep 和每秒輪詢
+#   wait_until(predicate)  → 自適應退避：一開始 50ms 就檢查，
+#                            條件一直不成立才慢慢拉長到 max_interval
+#   predicates             → session 閒置、元件出現、grid 可讀、檔案寫完
+#   StepTimer              → 每個步驟花多少時間（找出真正慢的地方）
+# 只依賴 session 的 busy / findById，不 import win32com，
+# 可以直接拿假的 session 物件測試；clock / sleep 也可以注入。
+# ------------------------------------------------------------
+
+WAIT_INITIAL = float(os.getenv("SAP_WAIT_INITIAL", 0.05))
+WAIT_MAX_INTERVAL = float(os.getenv("SAP_WAIT_MAX_INTERVAL", 2.0))
+WAIT_FACTOR = 1.5
+
+
+class WaitTimeout(TimeoutError):
+    pass
+
+
+class SapError(RuntimeError):
+    """SAP 已經回報失敗（狀態列 E/A 訊息、session 已關閉）：再等也不會好，wait_until 直接丟出。"""
+
+
+def wait_until(predicate, timeout=60.0, desc="condition",
+               initial=None, max_interval=None, factor=WAIT_FACTOR,
+               clock=time.monotonic, sleep=time.sleep):
+    """
+    反覆呼叫 predicate()，回傳第一個 truthy 的結果。
+    間隔從 initial 開始每次乘 factor，最多 max_interval；timeout=None 表示不設上限。
+    predicate 丟例外視為「還沒好」（SAP 元件還沒生成時 findById 會丟例外），SapError 除外。
+    """
+    interval = WAIT_INITIAL if initial is None else initial
+    max_interval = WAIT_MAX_INTERVAL if max_interval is None else max_interval
+    deadline = None if timeout is None else clock() + timeout
+    last_error = None
+
+    while True:
+        try:
+            result = predicate()
+            if result:
+                return result
+        except SapError:
+            raise
+        except Exception as e:
+            last_error = e
+
+        now = clock()
+        if deadline is not None and now >= deadline:
+            detail = f"（最後錯誤：{last_error}）" if last_error else ""
+            raise WaitTimeout(f"等待 {desc} 逾時 {timeout}s{detail}")
+        wait = interval if deadline is None else min(interval, deadline - now)
+        sleep(max(wait, 0))
+        interval = min(interval * factor, max_interval)
+
+
+# ---------- readiness predicates ----------
+def session_idle(session):
+    return lambda: not session.busy
+
+
+def element_ready(session, element_id):
+    """session 不忙且元件存在 → 回傳元件。"""
+    def check():
+        if session.busy:
+            return None
+        return session.findById(element_id)
+    return check
+
+
+def raise_status_error(session):
+    """狀態列是錯誤（E）或中止（A）訊息 → 丟 SapError，不用等到 timeout。"""
+    try:
+        sbar = session.findById("wnd[0]/sbar")
+        message_type, message = sbar.MessageType, sbar.Text
+    except Exception:
+        return
+    if message_type in ("E", "A"):
+        raise SapError(f"SAP 訊息（{message_type}）：{message}")
+
+
+def grid_ready(session, grid_id):
+    """grid 存在且讀得到 RowCount → 回傳 grid；grid 還沒出來但狀態列已經報錯 → SapError。"""
+    def check():
+        if session.busy:
+            return None
+        try:
+            grid = session.findById(grid_id)
+        except Exception:
+            raise_status_error(session)
+            raise
+        grid.RowCount
+        return grid
+    return check
+
+
+def file_ready(path, settle=0.3, clock=time.monotonic):
+    """
+    檔案存在、大小 > 0，且大小維持 settle 秒沒變（SAP 寫完才算）。
+    取代 wait_for_file 之後再固定 sleep(2)。
+    """
+    state = {"size": -1, "since": 0.0}
+
+    def check():
+        if not os.path.isfile(path):
+            return False
+        size = os.path.getsize(path)
+        now = clock()
+        if size != state["size"]:
+            state["size"], state["since"] = size, now
+            return False
+        return size > 0 and now - state["since"] >= settle
+    return check
+
+
+# ---------- 常用組合 ----------
+def wait_idle(session, timeout=60.0, **kwargs):
+    return wait_until(session_idle(session), timeout=timeout, desc="SAP session 閒置", **kwargs)
+
+
+def find(session, element_id, timeout=30.0, **kwargs):
+    """等元件出現再回傳，取代 findById 前面的 time.sleep。"""
+    return wait_until(element_ready(session, element_id), timeout=timeout, desc=element_id, **kwargs)
+
+
+def send_vkey(session, key, wnd="wnd[0]", timeout=60.0, **kwargs):
+    """送出按鍵（0=Enter、8=執行）並等 session 回到閒置。"""
+    session.findById(wnd).sendVKey(key)
+    wait_idle(session, timeout=timeout, **kwargs)
+
+
+def run_tcode(session, tcode, ready_id=None, timeout=60.0):
+    """輸入 tcode 進入交易；有給 ready_id 就等到選擇畫面的該欄位出現。"""
+    find(session, "wnd[0]/tbar[0]/okcd", timeout=timeout).text = tcode
+    send_vkey(session, 0, timeout=timeout)
+    if ready_id:
+        find(session, ready_id, timeout=timeout)
+
+
+# ---------- 每步驟計時 ----------
+class StepTimer:
+    """
+    with timer.step("query"): ...        或  timer.start() ... timer.lap("query")
+    同一個 timer 可以跨多次查詢累積，report() 印出每個步驟的次數 / 平均 / 總計。
+    start / lap 的起點是 per-thread 的，多個 session 同時跑也不會互相干擾。
+    每一段也記到 common/instrument 的 run 紀錄（stage = sap.<step>，tcode = label）。
+    """
+
+    def __init__(self, label="SAP", clock=time.perf_counter):
+        self.label = label
+        self.clock = clock
+        self.durations = defaultdict(list)
+        self._local = threading.local()
+
+    def start(self):
+        self._local.last = self.clock()
+
+    def lap(self, name):
+        """記錄從上一次 start / lap 到現在的時間。"""
+        now = self.clock()
+        last = getattr(self._local, "last", None)
+        if last is not None:
+            self.durations[name].append(now - last)
+            record(f"sap.{name}", now - last, tcode=self.label)
+        self._local.last = now
+
+    @contextmanager
+    def step(self, name):
+        t0 = self.clock()
+        try:
+            yield
+        finally:
+            seconds = self.clock() - t0
+            self.durations[name].append(seconds)
+            record(f"sap.{name}", seconds, tcode=self.label)
+
+    def totals(self) -> dict:
+        return {name: sum(d) for name, d in self.durations.items()}
+
+    def report(self):
+        if not self.durations:
+            return
+        print(f"⏱️ {self.label} 各步驟耗時：")
+        print(f"   {'step':<16}{'n':>6}{'avg(s)':>10}{'total(s)':>11}")
+        for name, d in sorted(self.durations.items(), key=lambda kv: -sum(kv[1])):
+            print(f"   {name:<16}{len(d):>6}{sum(d) / len(d):>10.2f}{sum(d):>11.1f}")
@@ -0,0 +1,238 @@
+import os
+import queue
+import threading
+import time
+from typing import Callable, Sequence
+
+from ETL_SAP.sap_scripts.sap_wait import wait_until, find, run_tcode
+from ETL_SAP.sap_scripts.gui_backend import get_scripting_engine, is_fake_gui
+
+# ------------------------------------------------------------
+# 多 session 平行下載：
+#   一個 SAP 連線開 N 個 session（GuiSession.CreateSession，取代 Ctrl+N，最多 6 個），
+#   每個 session 由一條 worker thread 獨占，從同一個 queue 拿查詢來跑。
+#   - 多值清單（例如 ZMMIDR 的 MCH）用 sap_utils.upload_selection_file 從文字檔上傳，
+#     不碰整台機器共用的剪貼簿，各 session 同時做不用排隊
+#   - 查詢失敗：session 還活著就 /n 回主畫面重試；死了就重新 attach，
+#     連線整個斷掉時由第一個發現的 worker 重新登入（其他 worker 等它，不重複登入）
+#   - 失敗超過 max_retries 次的查詢放棄，留給下次重跑（呼叫端的 ledger 沒記錄）
+#   - query_fn 丟 SplitJob(jobs) → 原本的 job 換成 jobs 重新排隊（例如區間逾時切半）
+# login / attach / is_alive 都可以注入，不開 SAP 也能用假的 session 測。
+# ------------------------------------------------------------
+
+SAP_SESSIONS = int(os.getenv("SAP_SESSIONS", 1))
+MAX_SESSIONS = 6   # SAP GUI 每個連線的 session 上限
+
+class SplitJob(Exception):
+    """這個 job 不算失敗，改成 jobs 重新排隊。"""
+
+    def __init__(self, jobs):
+        super().__init__(f"split into {len(jobs)} jobs")
+        self.jobs = list(jobs)
+
+
+# ---------- 預設的 SAP GUI backend ----------
+def attach_session(slot: int, timeout=60.0):
+    """
+    取得 /app/con[0]/ses[slot]，不存在就 CreateSession 補開（SAP 會給最小的空號）。
+    用 Id 找而不是 Children(slot)：中間有 session 關掉時 Children 的 index 會位移，Id 不會。
+    在 worker thread 裡呼叫：COM 物件不能跨 thread 傳，每個 thread 自己 GetObject。
+    """
+    application = get_scripting_engine()
+    session_id = f"/app/con[0]/ses[{slot}]"
+
+    def lookup():
+        try:
+            return application.findById(session_id)
+        except Exception:
+            return None
+
+    for _ in range(MAX_SESSIONS):
+        session = lookup()
+        if session is not None:
+            find(session, "wnd[0]", timeout=timeout)
+            return session
+        connection = application.Children(0)
+        count = connection.Children.Count
+        connection.Children(0).CreateSession()
+        wait_until(lambda: connection.Children.Count > count, timeout=timeout, desc="新 SAP session")
+    raise RuntimeError(f"無法開啟 SAP session {session_id}")
+
+
+def session_alive(session) -> bool:
+    try:
+        session.busy
+        return True
+    except Exception:
+        return False
+
+
+def close_session(session):
+    """關掉單一 session（例如查詢逾時還在跑的），同一個連線的其他 session 不受影響。"""
+    session.Parent.CloseSession(session.Id)
+
+
+def fresh_login():
+    # 先關掉舊連線，新連線才會是 con[0]（attach_session 用固定的 Id 找 session）
+    from ETL_SAP.sap_scripts.login import sap_login
+    from ETL_SAP.sap_scripts.sap_utils import close_all_sap_sessions
+    close_all_sap_sessions()
+    return sap_login()
+
+
+def _com_init():
+    if is_fake_gui():
+        return lambda: None
+    try:
+        import pythoncom
+    except ImportError:
+        return lambda: None
+    pythoncom.CoInitialize()
+    return pythoncom.CoUninitialize
+
+
+class SessionPool:
+    def __init__(self, n_sessions: int | None = None, login: Callable | None = None,
+                 attach: Callable | None = None, is_alive: Callable | None = None, close: Callable | None = None,
+                 max_retries: int = 2, retry_wait: float = 3.0, label: str = "SAP"):
+        """
+        login()            → 建立（或重建）SAP 連線，預設 login.sap_login
+        attach(slot)       → 第 slot 個 session，在 worker thread 裡呼叫，預設 attach_session
+        is_alive(session)  → session 是否還能用，預設 session_alive
+        close(session)     → 關掉卡住的 session，預設 close_session
+        """
+        n = n_sessions or SAP_SESSIONS
+        self.n_sessions = max(1, min(n, MAX_SESSIONS))
+        self.login = login or fresh_login
+        self.attach = attach or attach_session
+        self.is_alive = is_alive or session_alive
+        self.close = close or close_session
+        self.max_retries = max_retries
+        self.retry_wait = retry_wait
+        self.label = label
+
+        self._login_lock = threading.Lock()
+        self._generation = 0      # 每重新登入一次 +1，避免多個 worker 重複登入
+
+    # ---------- session 取得 / 回復 ----------
+    def _open(self, slot):
+        with self._login_lock:    # CreateSession 一次一個
+            return self.attach(slot), self._generation
+
+    def _recover(self, slot, session, generation):
+        """回傳 (session, generation)；無法回復時丟例外。"""
+        if self.is_alive(session):
+            try:
+                if not session.busy:
+                    run_tcode(session, "/n")
+                    return session, generation
+            except Exception:
+                pass
+            try:
+                self.close(session)     # 還在跑（例如查詢逾時）或回不到主畫面 → 關掉重開
+            except Exception:
+                pass
+        with self._login_lock:
+            if self._generation == generation:
+                try:
+                    return self.attach(slot), self._generation
+                except Exception as e:
+                    print(f"⚠️ {self.label} session {slot} 無法重新連上（{e}），重新登入 SAP")
+                time.sleep(self.retry_wait)
+                self.login()
+                self._generation += 1
+                print(f"🔁 {self.label} 已重新登入 SAP")
+            return self.attach(slot), self._generation
+
+    # ---------- 排程 ----------
+    def run(self, jobs: Sequence, query_fn: Callable,
+            on_success: Callable | None = None, on_failure: Callable | None = None) -> dict:
+        """
+        query_fn(session, job) → truthy 表示成功；丟例外或回傳 falsy 都算失敗
+        on_success(job) / on_failure(job, error) 在 worker thread 裡呼叫（要 thread-safe）
+        回傳 {"jobs", "done", "failed", "seconds", "sessions"}，failed 是放棄的 job 清單；
+        jobs 是最初排入的數量，SplitJob 切出來的 job 成功時一樣算在 done。
+        """
+        jobs = list(jobs)
+        n_workers = min(self.n_sessions, len(jobs))
+        print(f"🧵 {self.label}：{len(jobs)} 個查詢，{n_workers} 個 session")
+        if not jobs:
+            return {"jobs": 0, "done": 0, "failed": [], "seconds": 0.0, "sessions": 0}
+
+        t0 = time.perf_counter()
+        self.login()
+
+        work_q = queue.Queue()
+        for job in jobs:
+            work_q.put((job, 1))
+        done, failed = [], []
+        lock = threading.Lock()
+
+        def give_up(job, error):
+            with lock:
+                failed.append(job)
+            if on_failure:
+                on_failure(job, error)
+
+        def worker(slot):
+            uninit = _com_init()
+            try:
+                try:
+                    session, generation = self._open(slot)
+                except Exception as e:
+                    print(f"❌ {self.label} session {slot} 開啟失敗：{e}")
+                    return
+                while True:
+                    try:
+                        job, attempt = work_q.get_nowait()
+                    except queue.Empty:
+                        return
+                    try:
+                        if not query_fn(session, job):
+                            raise RuntimeError("Query did not complete successfully")
+                    except SplitJob as split:
+                        for part in split.jobs:
+                            work_q.put((part, 1))
+                        try:
+                            session, generation = self._recover(slot, session, generation)
+                        except Exception as login_err:
+                            print(f"❌ {self.label} session {slot} 無法回復，停止：{login_err}")
+                            return
+                        continue
+                    except Exception as e:
+                        print(f"⚠️ {self.label} session {slot} 第 {attempt} 次查詢失敗：{e}")
+                        if attempt >= self.max_retries:
+                            give_up(job, e)
+                        else:
+                            work_q.put((job, attempt + 1))
+                        try:
+                            session, generation = self._recover(slot, session, generation)
+                        except Exception as login_err:
+                            print(f"❌ {self.label} session {slot} 無法回復，停止：{login_err}")
+                            return
+                        continue
+                    with lock:
+                        done.append(job)
+                    if on_success:
+                        on_success(job)
+            finally:
+                uninit()
+
+        threads = [threading.Thread(target=worker, args=(slot,), name=f"{self.label}-session-{slot}", daemon=True)
+                   for slot in range(n_workers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        # 所有 worker 都停了還有沒跑的 → 算失敗，下次重跑
+        while True:
+            try:
+                job, _ = work_q.get_nowait()
+            except queue.Empty:
+                break
+            give_up(job, RuntimeError("no SAP session left"))
+
+        seconds = time.perf_counter() - t0
+        print(f"🎉 {self.label}：{len(done)}/{len(jobs)} 個查詢完成，{seconds:.1f}s（{n_workers} 個 session）")
+        return {"jobs": len(jobs), "done": len(done), "failed": failed, "seconds": seconds, "sessions": n_workers}
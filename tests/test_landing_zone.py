@@ -0,0 +1,41 @@
+import pandas as pd
+import pytest
+
+from ETL_SAP.pipelines import landing_zone
+from ETL_SAP.pipelines.etl_zmb51 import ZMB51_DTYPES
+
+pytest.importorskip("pyarrow")
+
+HEADER = ["", "Site", "Article", "MvT", "Pstng Date", "Quantity i", "Amount LC", "BUn", "Item", "Article Description"]
+
+
+def write_zmb51_export(path, rows):
+    """SAP Text with Tabs：兩行 preamble、header 和每列最前面都有一個空白欄。"""
+    lines = ["ZMB51 report", ""] + ["\t".join(HEADER)] + ["\t".join([""] + r) for r in rows]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "feather"])
+def test_land_multi_chunk_export_with_blank_text_in_first_chunk(tmp_path, monkeypatch, fmt):
+    # 第一塊：BUn / Article Description 全空、Item 是整數；之後：BUn = EA、Item 有空格
+    rows = [["SCA1", f"{i:06d}", "601", "01/05/2025", "1,234.50-", "10.00", "", str(i), ""] for i in range(10)]
+    rows += [["SCA1", f"{i:06d}", "601", "01/06/2025", "2.00", "3.00", "EA", "" if i == 15 else str(i), "Milk"]
+             for i in range(10, 25)]
+    fp = tmp_path / "ZMB51_01052025_01112025_SCA.txt"
+    write_zmb51_export(fp, rows)
+    monkeypatch.setattr(landing_zone, "LANDING_FORMAT", fmt)
+    landing_dir = tmp_path / "landing"
+
+    chunks = list(landing_zone.iter_export(fp, "ZMB51", chunksize=10, dtype=ZMB51_DTYPES, land=True,
+                                           landing_dir=landing_dir))
+    assert sum(len(c) for c in chunks) == 25
+
+    landed = landing_zone.landed_path("ZMB51", fp.stem, landing_dir)
+    assert landed is not None and landed.parent.name == "date=2025-01-05"
+    df = pd.concat(landing_zone.iter_landed(landed), ignore_index=True)
+    assert len(df) == 25
+    assert df["BUn"].iloc[:10].isna().all() and (df["BUn"].iloc[10:] == "EA").all()
+    assert df["Item"].iloc[15] is None or pd.isna(df["Item"].iloc[15])
+    assert df.loc[df.index != 15, "Item"].tolist() == [str(i) for i in range(25) if i != 15]
+    assert df["Quantity i"].iloc[0] == -1234.5
+    assert pd.api.types.is_datetime64_any_dtype(df["Pstng Date"])